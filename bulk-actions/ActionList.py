@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Model/view for the list of actions in the docker.
+
+The actions are kept as plain `ActionSpec` objects in `ActionListModel`. `ActionListView`
+only opens an editor (the row widgets of `BulkActions`) for the rows that are scrolled into
+view, so loading hundreds of saved actions costs no more than the visible rows.
+"""
+
+from PyQt5.QtCore import (
+    Qt,
+    QAbstractListModel,
+    QModelIndex,
+    QPersistentModelIndex,
+    QPoint,
+    QSize,
+    QTimer,
+    pyqtSignal,
+)
+
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QListView,
+    QStyledItemDelegate,
+)
+
+from .Engine import LABELS
+
+# Role holding the `ActionSpec` of a row
+ActionRole = Qt.UserRole
+# Role holding the `ActionStats` of the row's last run, `None` if it hasn't run
+StatsRole = Qt.UserRole + 1
+
+
+def sameAction(a, b):
+    # Rows run through their widgets, which create new specs - compare what they do
+    return a.type == b.type and a.settings() == b.settings()
+
+def actionSummary(spec):
+    summary = '{}: {}'.format(LABELS[spec.action], spec.match or '<selected layers>')
+    if spec.value != '':
+        summary += ' = {}'.format(spec.value)
+    if spec.isScoped():
+        summary += ' in {}'.format(spec.scope or '/')
+    if spec.match == '' and spec.expand != 0:
+        summary += ' and {} levels below'.format(spec.expand) if spec.expand != -1 else ' and all below'
+    return summary
+
+class ActionListModel(QAbstractListModel):
+    """
+    The actions of the docker. Rows are listed newest first, like the docker always did,
+    while `specs` returns them in the order they were added - the order they run and are saved in.
+    """
+
+    def __init__(self, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.rows = []
+        self.checked = []
+        self.stats = []
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsEditable | Qt.ItemIsUserCheckable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == ActionRole:
+            return self.rows[row]
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if self.checked[row] else Qt.Unchecked
+        if role == StatsRole:
+            return self.stats[row]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return actionSummary(self.rows[row])
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+        row = index.row()
+        if role in (ActionRole, Qt.EditRole):
+            # The stats of the last run don't describe an edited action
+            if self.stats[row] is not None and not sameAction(self.rows[row], value):
+                self.stats[row] = None
+            self.rows[row] = value
+        elif role == Qt.CheckStateRole:
+            self.checked[row] = value == Qt.Checked
+        else:
+            return False
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if row < 0 or row + count > len(self.rows):
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self.rows[row:row + count]
+        del self.checked[row:row + count]
+        del self.stats[row:row + count]
+        self.endRemoveRows()
+        return True
+
+    def addSpec(self, spec):
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.rows.insert(0, spec)
+        self.checked.insert(0, False)
+        self.stats.insert(0, None)
+        self.endInsertRows()
+
+    def setSpecs(self, specs):
+        self.beginResetModel()
+        self.rows = list(reversed(specs))
+        self.checked = [False] * len(self.rows)
+        self.stats = [None] * len(self.rows)
+        self.endResetModel()
+
+    def clear(self):
+        self.setSpecs([])
+
+    def specs(self, checked=False):
+        """
+        Return the actions in the order they were added, only the checked ones if `checked`.
+        """
+        rows = zip(self.rows, self.checked)
+        return [ spec for spec, isChecked in reversed(list(rows)) if isChecked or not checked ]
+
+    def setActionStats(self, actions):
+        """
+        Show the `ActionStats` of a run on the rows of the actions that ran.
+        """
+        for row, spec in enumerate(self.rows):
+            for a in actions:
+                if sameAction(spec, a.spec):
+                    self.stats[row] = a
+                    index = self.index(row, 0)
+                    self.dataChanged.emit(index, index, [StatsRole])
+
+
+class ActionDelegate(QStyledItemDelegate):
+    """
+    Edits a row with the widget returned by `createWidget(type)`. The widget must emit
+    `changed` when edited, `removed` when the user removes the row and `runRequested` with the
+    actions to run, and show the row's last run with `showStats`.
+    """
+    runRequested = pyqtSignal(object)
+
+    def __init__(self, createWidget, parent=None):
+        QStyledItemDelegate.__init__(self, parent)
+        self.createWidget = createWidget
+        self.rowSize = None
+
+    def createEditor(self, parent, option, index):
+        spec = index.data(ActionRole)
+        editor = self.createWidget(spec.type)
+        editor.setParent(parent)
+        editor.setAutoFillBackground(True)
+
+        row = QPersistentModelIndex(index)
+        model = index.model()
+        editor.changed.connect(lambda: self.commitData.emit(editor))
+        editor.removed.connect(lambda: row.isValid() and model.removeRows(row.row(), 1))
+        editor.runRequested.connect(self.runRequested)
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.showStats(index.data(StatsRole))
+        spec = index.data(ActionRole)
+        checked = index.data(Qt.CheckStateRole) == Qt.Checked
+        # Our own commits come back through here - don't reset the widget the user is typing in
+        if editor.settings() == spec.settings() and editor.isSelected() == checked:
+            return
+        editor.load(spec.settings(), checked)
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.spec(), ActionRole)
+        model.setData(index, Qt.Checked if editor.isSelected() else Qt.Unchecked, Qt.CheckStateRole)
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(option.rect)
+
+    def sizeHint(self, option, index):
+        # All rows are the same height, measured once on a throwaway editor
+        if self.rowSize is None:
+            editor = self.createWidget(index.data(ActionRole).type)
+            self.rowSize = editor.sizeHint()
+            editor.deleteLater()
+        return QSize(option.rect.width(), self.rowSize.height())
+
+
+class ActionListView(QListView):
+    """
+    List view that keeps editors open for the visible rows only.
+    """
+
+    def __init__(self, parent=None):
+        QListView.__init__(self, parent)
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.editorRows = []
+
+        # Scrolling and model changes come in bursts - update the editors once afterwards
+        self.updateTimer = QTimer(self)
+        self.updateTimer.setSingleShot(True)
+        self.updateTimer.setInterval(0)
+        self.updateTimer.timeout.connect(self.updateEditors)
+        self.verticalScrollBar().valueChanged.connect(self.scheduleUpdate)
+
+    def setModel(self, model):
+        QListView.setModel(self, model)
+        model.rowsInserted.connect(self.scheduleUpdate)
+        model.rowsRemoved.connect(self.scheduleUpdate)
+        model.modelReset.connect(self.modelWasReset)
+
+    def scheduleUpdate(self, *args):
+        # Not connected to `start` directly - it would take the signal's arguments as the interval
+        self.updateTimer.start()
+
+    def modelWasReset(self):
+        # The view drops all editors on reset
+        self.editorRows = []
+        self.scheduleUpdate()
+
+    def resizeEvent(self, event):
+        QListView.resizeEvent(self, event)
+        self.scheduleUpdate()
+
+    def visibleRows(self):
+        model = self.model()
+        if model is None or model.rowCount() == 0:
+            return range(0)
+        first = self.indexAt(QPoint(0, 0)).row()
+        last = self.indexAt(QPoint(0, self.viewport().height() - 1)).row()
+        if first == -1:
+            first = 0
+        if last == -1:
+            last = model.rowCount() - 1
+        return range(first, last + 1)
+
+    def updateEditors(self):
+        wanted = set(self.visibleRows())
+
+        kept = []
+        for row in self.editorRows:
+            if not row.isValid():
+                continue
+            if row.row() in wanted:
+                wanted.discard(row.row())
+                kept.append(row)
+            else:
+                self.closePersistentEditor(QModelIndex(row))
+
+        for r in sorted(wanted):
+            index = self.model().index(r, 0)
+            self.openPersistentEditor(index)
+            kept.append(QPersistentModelIndex(index))
+
+        self.editorRows = kept
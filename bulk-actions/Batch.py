@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Headless batch runs: open documents, run the actions saved in them (or in a preset file),
+save them and close them again, without the docker.
+
+Everything here only needs an application object with `openDocument(path)` - the real
+`Krita.instance()` or `sbin/FakeKrita.py`'s `FakeKrita` - so it runs in CI without Krita. See
+`sbin/batch.py` for the command line.
+
+A preset file is the JSON of the saved settings, where each action can have a name:
+
+    { "version": 2.0, "actions": [ { "type": 0, "name": "no-shadows", "settings": { "index": 0, "match": "@" } } ] }
+"""
+
+import json
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .Engine import ActionSpec, BulkActionType, runActions
+from .Index import forgetDocument
+from .Settings import actionSettings, forgetSettingsLayer, loadSettings
+from .Stats import RunStats
+
+
+def kritaApplication():
+    from krita import Krita
+    app = Krita.instance()
+    app.setBatchmode(True)
+    return app
+
+
+def loadPreset(path):
+    """
+    Read the actions of a preset file.
+
+    Returns
+    -------
+    out: list((str, ActionSpec))
+    The name of each action (`None` if it has none) and the action.
+    """
+    with open(path, encoding='utf-8') as f:
+        preset = json.load(f)
+    named = [ a.get('name') for a in preset['actions'] ] if preset.get('version') != 1.0 else [ None ] * len(preset['actions'])
+    specs = [ ActionSpec.fromSettings(t, s) for t, s in actionSettings(preset) ]
+    return list(zip(named, specs))
+
+def documentActions(doc):
+    settings = loadSettings(doc)
+    if settings is None:
+        return []
+    return [ (None, ActionSpec.fromSettings(t, s)) for t, s in actionSettings(settings) ]
+
+def selectActions(actions, wanted):
+    """
+    Pick the actions named in `wanted`, by their name or their position counting from 1.
+    All actions are used if `wanted` is empty.
+
+    Raises
+    ------
+    ValueError
+    If an action in `wanted` doesn't exist.
+    """
+    if not wanted:
+        return [ spec for name, spec in actions ]
+    specs = []
+    for w in wanted:
+        found = [ spec for i, (name, spec) in enumerate(actions) if w == name or w == str(i + 1) ]
+        if not found:
+            raise ValueError('No action {!r}'.format(w))
+        specs.extend(found)
+    return specs
+
+
+def processFile(app, path, preset=None, wanted=(), output=None, dryRun=False):
+    """
+    Run actions on the document at `path` and save it.
+
+    Parameters
+    ----------
+    app: Krita
+    path: str
+    preset: list((str, ActionSpec))
+    The actions to choose from, as returned by `loadPreset`. The actions saved in the
+    document are used if `None`.
+    wanted: iter(str)
+    Names or positions of the actions to run, all of them if empty.
+    output: str
+    Directory to save the document to, next to the original if `None`.
+    dryRun: bool
+    Don't save anything.
+
+    Returns
+    -------
+    out: dict
+    The `path`, number of `applied` and `skipped` changes, `seconds` taken, whether the
+    document was `saved`, the `error` message if it failed and the `stats` of the run as
+    `RunStats.toDict()` (`None` if no actions ran).
+    """
+    start = time.perf_counter()
+    result = { 'path': path, 'applied': 0, 'skipped': 0, 'seconds': 0.0, 'saved': False, 'error': None, 'stats': None }
+
+    doc = app.openDocument(path)
+    if doc is None:
+        result['error'] = 'Could not open document'
+        return result
+
+    try:
+        actions = preset if preset is not None else documentActions(doc)
+        specs = selectActions(actions, wanted)
+        # Empty patterns mean the selected layers, and there's no selection in a batch run
+        specs = [ spec for spec in specs if spec.match != '' ]
+        if specs:
+            stats = RunStats()
+            changes = runActions(doc, specs, stats=stats)
+            result['applied'] = changes.applied
+            result['skipped'] = changes.skipped
+            result['stats'] = stats.toDict()
+
+        if result['applied'] and not dryRun:
+            if output is None:
+                result['saved'] = bool(doc.save())
+            else:
+                result['saved'] = bool(doc.saveAs(os.path.join(output, os.path.basename(path))))
+            if not result['saved']:
+                result['error'] = 'Could not save document'
+    except ValueError as e:
+        result['error'] = str(e)
+    except Exception as e:
+        # E.g. malformed settings or a failing layer - the other files are still processed
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    finally:
+        doc.close()
+        # The caches would keep the layers of every file of the batch alive
+        forgetDocument(doc)
+        forgetSettingsLayer(doc)
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+# The application of a pool worker process, created once by `initWorker`
+_workerApp = None
+
+def initWorker(appFactory):
+    global _workerApp
+    _workerApp = appFactory()
+
+def processInWorker(path, options):
+    return processFile(_workerApp, path, **options)
+
+def runBatch(paths, appFactory, jobs=1, **options):
+    """
+    Run `processFile` on all `paths`, in `jobs` worker processes that each create their own
+    application with `appFactory`. The options are passed on to `processFile`.
+
+    Yields
+    ------
+    out: dict
+    The result of each file, as soon as it's done.
+    """
+    if jobs <= 1:
+        app = appFactory()
+        for path in paths:
+            yield processFile(app, path, **options)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initWorker, initargs=(appFactory,)) as pool:
+        futures = [ pool.submit(processInWorker, path, options) for path in paths ]
+        for future in futures:
+            yield future.result()
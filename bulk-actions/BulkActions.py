@@ -11,17 +11,17 @@ Licensed under the GNU GPL v3.0 terms
 import os
 import re
 import webbrowser
-import json
-import base64
 
 from functools import partial
-from enum import IntEnum
 
 from krita import DockWidget, DockWidgetFactory, DockWidgetFactoryBase, Krita
 
 
 from PyQt5.QtCore import (
+    Qt,
     QSize,
+    QTimer,
+    pyqtSignal,
 )
 
 from PyQt5.QtGui import (
@@ -31,13 +31,17 @@ from PyQt5.QtGui import (
 from PyQt5.QtWidgets import (
     QDialog,
     QDialogButtonBox,
-    QScrollArea,
+    QFileDialog,
+    QInputDialog,
+    QCheckBox,
     QPushButton,
     QToolButton,
     QStatusBar,
     QLabel,
     QLineEdit,
     QComboBox,
+    QProgressBar,
+    QSpinBox,
     QHBoxLayout,
     QVBoxLayout,
     QGroupBox,
@@ -45,43 +49,229 @@ from PyQt5.QtWidgets import (
     QWIDGETSIZE_MAX
 )
 
-from .KritaNode import KritaNode
+from .Engine import ACTIONS, LABELS, SWITCHES, ActionSpec, BulkAction, BulkActionType, documentName, parseState, revertActions, runTimed, startActions
+from .Index import documentKey, pruneDocuments
+from .Pipeline import finishPlanning, startPlanning
+from .Settings import actionSpecs, loadSettings, loadSnapshots, pruneSettingsLayers, saveSettings, saveSnapshots
+from .ActionList import ActionDelegate, ActionListModel, ActionListView
+from .RenamePreview import renamePreviewView
+from .Presets import StatePreset, presetSettings, replacePreset, statePresets
+from .Snapshot import captureSnapshot, restoreSnapshot, snapshotsData, snapshotsFromData
+from .Stats import RunStats, exportStats
+from .Template import compileTemplate
 
 from .UI import QHLine
 
 from .Utils import kickstart, flip, remap, clamp
-from .Utils.Tree import iterPre
 
 KI = Krita.instance()
 
-def openHelp():
-    webbrowser.open("https://github.com/Larpon/krita-bulk-actions", new=0, autoraise=True)
+# Seconds the GUI waits for a run's plan before polling for it in the background
+PLAN_BUDGET = 0.02
 
+TEMPLATE_HELP = 'Counters {i++} {i--} {i+} {i-} (e.g. {i+:03}), {%name}, {%parent}, {%depth}, {%type}, pattern groups {%0} {%1}..., or s/find/replace/'
 
-class BulkActionType(IntEnum):
-    BOOL = 0
-    SET = 1
+def openHelp():
+    webbrowser.open("https://github.com/Larpon/krita-bulk-actions", new=0, autoraise=True)
 
-class BulkAction(IntEnum):
-    BOOL_VISIBLE = 0
-    BOOL_LOCKED = 1
-    BOOL_ALPHA_LOCKED = 2
-    BOOL_COLLAPSED = 3
-    BOOL_INHERIT_ALPHA = 4
-    SET_OPACITY = 5
-    SET_NAME = 6
+def selectedNodes():
+    return KI.activeWindow().activeView().selectedNodes()
+
+def openPreviewActionDialog(content):
+    dialog = QDialog()
+    dialog.setWindowTitle(i18n("Confirm renaming"))
+    buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+    buttons.accepted.connect(dialog.accept)
+    buttons.rejected.connect(dialog.reject)
+    dialog.setLayout(QVBoxLayout())
+    dialog.layout().addWidget(content)
+    dialog.layout().addWidget(buttons)
+    return dialog
+
+def confirmRenames(renames):
+    # The renames are the engine's plan - they're shown as is and applied as is on 'OK'
+    view = renamePreviewView(renames)
+    changed = view.model().changedCount()
+
+    content = QWidget()
+    content.setLayout(QVBoxLayout())
+    content.layout().setContentsMargins(0, 0, 0, 0)
+    content.layout().addWidget(QLabel('{} of {} matching layers will be renamed. Press \'OK\' to rename'.format(changed, len(renames))))
+    content.layout().addWidget(view)
+
+    dialog = openPreviewActionDialog(content)
+    dialog.resize(500, 400)
+
+    return dialog.exec_() == QDialog.Accepted
+
+def startBulkActions(specs, stats=None):
+    doc = KI.activeDocument()
+    if doc == None or len(specs) == 0:
+        return
+
+    try:
+        return startPlanning(doc, specs, selectedNodes, stats=stats)
+    except ValueError as e:
+        print(e)
+
+def startSelectionActions(specs, stats=None):
+    # Nothing to match - the selected layers are planned on the spot, without the index unless expanded
+    doc = KI.activeDocument()
+    if doc == None or len(specs) == 0:
+        return
+
+    try:
+        return startActions(doc, specs, selectedNodes, confirmRenames, stats=stats)
+    except ValueError as e:
+        print(e)
+
+def runStatusMessage(changes, stats=None):
+    message = 'Applied {} changes, skipped {} unchanged'.format(changes.applied, changes.skipped)
+    if stats is not None:
+        message += ' in {:.0f} ms'.format(stats.total * 1000)
+    return message
+
+def documentsStatusMessage(reports):
+    failed = sum(1 for r in reports if r.error is not None)
+    message = 'Ran in {} documents: applied {} changes, skipped {} unchanged in {:.0f} ms'.format(
+        len(reports), sum(r.applied for r in reports), sum(r.skipped for r in reports), sum(r.seconds for r in reports) * 1000)
+    if failed:
+        message += ', {} failed'.format(failed)
+    return message
+
+def createBulkActionWidget(bulk_action_type):
+    if bulk_action_type == BulkActionType.BOOL:
+        return BulkBoolActionWidget()
+    if bulk_action_type == BulkActionType.SET:
+        return BulkSetActionWidget()
+    raise NotImplementedError()
 
 class BulkActionBaseWidget(QWidget):
+    """
+    Editor of one action in the action list. Emits `changed` when edited by the user,
+    `removed` when the remove button is pressed and `runRequested` with the action to run.
+    """
     type = BulkActionType.BOOL
     hblayout = None
+    runRequested = pyqtSignal(object)
+    changed = pyqtSignal()
+    removed = pyqtSignal()
 
     def __init__(self, parent=None):
         QWidget.__init__(self, parent=parent)
+        self.loading = False
         self.hblayout = QHBoxLayout(self)
         self.hblayout.setContentsMargins(2, 2, 2, 2)
 
+        self.selectCheckBox = QCheckBox()
+        self.selectCheckBox.setToolTip('Include in "Run selected"')
+        self.selectCheckBox.toggled.connect(self.notifyChanged)
+        self.hblayout.addWidget(self.selectCheckBox)
+
+        self.statsLabel = QLabel()
+        self.statsLabel.setStyleSheet('color: gray')
+        self.statsLabel.hide()
+
+    def addActionsComboBox(self):
+        self.actionsComboBox = QComboBox()
+        for action in ACTIONS[self.type]:
+            self.actionsComboBox.addItem(LABELS[action], action)
+
+    def addScopeWidgets(self):
+        self.scopeLineEdit = QLineEdit()
+        self.scopeLineEdit.setText('')
+        self.scopeLineEdit.setPlaceholderText('scope')
+        self.scopeLineEdit.setToolTip('Only act on layers inside this group path (e.g. "Robot/Head"), "." for the current layer or empty for the whole document')
+        self.scopeLineEdit.setFixedWidth(70)
+        self.scopeLineEdit.returnPressed.connect(
+            partial(self.doAction)
+        )
+
+        self.depthSpinBox = QSpinBox()
+        self.depthSpinBox.setRange(-1, 99)
+        self.depthSpinBox.setValue(-1)
+        self.depthSpinBox.setSpecialValueText('all')
+        self.depthSpinBox.setToolTip('How many levels below the scope to include')
+
+        self.expandSpinBox = QSpinBox()
+        self.expandSpinBox.setRange(-1, 99)
+        self.expandSpinBox.setValue(0)
+        self.expandSpinBox.setSpecialValueText('all')
+        self.expandSpinBox.setToolTip('How many levels below the selected groups to include, 0 for the selected layers only')
+
+        self.scopeLineEdit.textEdited.connect(self.notifyChanged)
+        self.depthSpinBox.valueChanged.connect(self.notifyChanged)
+        self.expandSpinBox.valueChanged.connect(self.notifyChanged)
+        self.matchLineEdit.textChanged.connect(self.updateScopeWidgets)
+
+        self.hblayout.addWidget(self.scopeLineEdit)
+        self.hblayout.addWidget(self.depthSpinBox)
+        self.hblayout.addWidget(self.expandSpinBox)
+        self.updateScopeWidgets()
+
+    def updateScopeWidgets(self, *args):
+        # An empty pattern acts on the selected layers - they have no scope, but can be expanded
+        selection = self.matchLineEdit.text() == ''
+        self.scopeLineEdit.setVisible(not selection)
+        self.depthSpinBox.setVisible(not selection)
+        self.expandSpinBox.setVisible(selection)
+
+    def addRemoveButton(self):
+        # The stats of the last run go right before the remove button
+        self.hblayout.addWidget(self.statsLabel)
+
+        removeButton = QToolButton()
+        removeButton.setIcon(QIcon.fromTheme("list-remove"))
+        removeButton.clicked.connect(self.removed)
+        self.hblayout.addWidget(removeButton)
+
+    def notifyChanged(self, *args):
+        if not self.loading:
+            self.changed.emit()
+
+    def load(self, settings, selected=False):
+        """
+        Show `settings` and the selection state without emitting `changed`.
+        """
+        self.loading = True
+        try:
+            self.loadSettings(settings)
+            self.selectCheckBox.setChecked(selected)
+        finally:
+            self.loading = False
+
+    def scopeSettings(self, settings):
+        if self.scopeLineEdit.text() != '' or self.depthSpinBox.value() != -1:
+            settings['scope'] = self.scopeLineEdit.text()
+            settings['depth'] = self.depthSpinBox.value()
+        if self.expandSpinBox.value() != 0:
+            settings['expand'] = self.expandSpinBox.value()
+        return settings
+
+    def loadScopeSettings(self, settings):
+        self.scopeLineEdit.setText(settings.get('scope', ''))
+        self.depthSpinBox.setValue(settings.get('depth', -1))
+        self.expandSpinBox.setValue(settings.get('expand', 0))
+
+    def isSelected(self):
+        return self.selectCheckBox.isChecked()
+
+    def showStats(self, stats):
+        """
+        Show the `ActionStats` of the action's last run, or nothing if `None`.
+        """
+        if stats is None:
+            self.statsLabel.hide()
+            return
+        self.statsLabel.setText('{} · {:.0f} ms'.format(stats.matched, stats.seconds * 1000))
+        self.statsLabel.setToolTip('Last run: ' + stats.summary())
+        self.statsLabel.show()
+
     def doAction(self):
-        raise NotImplementedError()
+        self.runRequested.emit([self.spec()])
+
+    def spec(self):
+        return ActionSpec.fromSettings(self.type, self.settings())
 
     def settings(self):
         raise NotImplementedError()
@@ -98,9 +288,7 @@ class BulkSetActionWidget(BulkActionBaseWidget):
     def __init__(self, parent=None):
         BulkActionBaseWidget.__init__(self, parent=parent)
 
-        self.actionsComboBox = QComboBox()
-        self.actionsComboBox.addItem('Opacity', BulkAction.SET_OPACITY)
-        self.actionsComboBox.addItem('Name', BulkAction.SET_NAME)
+        self.addActionsComboBox()
 
         self.matchLineEdit = QLineEdit()
         self.matchLineEdit.setText('')
@@ -115,24 +303,29 @@ class BulkSetActionWidget(BulkActionBaseWidget):
         applyButton.setIcon(QIcon.fromTheme("checkmark"))
 
         applyButton.released.connect(
-            partial(self.doAction, self.actionsComboBox, self.matchLineEdit, self.valueLineEdit)
+            partial(self.doAction)
         )
 
         self.actionsComboBox.activated.connect(
             partial(self.actionsComboBoxActivated)
         )
         self.matchLineEdit.returnPressed.connect(
-            partial(self.doAction, self.actionsComboBox, self.matchLineEdit, self.valueLineEdit)
+            partial(self.doAction)
         )
 
         self.valueLineEdit.returnPressed.connect(
-            partial(self.doAction, self.actionsComboBox, self.matchLineEdit, self.valueLineEdit)
+            partial(self.doAction)
         )
+        self.matchLineEdit.textEdited.connect(self.notifyChanged)
+        self.valueLineEdit.textEdited.connect(self.notifyChanged)
+        self.valueLineEdit.textChanged.connect(self.validateValue)
 
         self.hblayout.addWidget(applyButton)
         self.hblayout.addWidget(self.actionsComboBox)
         self.hblayout.addWidget(self.valueLineEdit)
         self.hblayout.addWidget(self.matchLineEdit)
+        self.addScopeWidgets()
+        self.addRemoveButton()
 
     def actionsComboBoxActivated(self):
         index = self.actionsComboBox.currentIndex()
@@ -145,129 +338,45 @@ class BulkSetActionWidget(BulkActionBaseWidget):
             self.valueLineEdit.setPlaceholderText('new name')
             self.valueLineEdit.setFixedWidth(QWIDGETSIZE_MAX)
             self.matchLineEdit.setPlaceholderText('pattern')
+        if index >= 2:
+            self.valueLineEdit.setPlaceholderText('on / off')
+            self.valueLineEdit.setFixedWidth(55)
+            self.matchLineEdit.setPlaceholderText('pattern')
 
         self.index = index
+        self.validateValue()
+        self.notifyChanged()
+
+    def validateValue(self, *args):
+        # Show rename template and state errors while typing instead of when running the action
+        error = ''
+        toolTip = ''
+        action = self.actionsComboBox.currentData()
+        if action == BulkAction.SET_NAME:
+            toolTip = TEMPLATE_HELP
+            try:
+                compileTemplate(self.valueLineEdit.text())
+            except ValueError as e:
+                error = toolTip = str(e)
+        elif action in SWITCHES:
+            toolTip = 'on or off, empty for on'
+            try:
+                parseState(self.valueLineEdit.text())
+            except ValueError as e:
+                error = toolTip = str(e)
+        self.valueLineEdit.setToolTip(toolTip)
+        self.valueLineEdit.setStyleSheet('color: red' if error else '')
+
 
     def settings(self):
-        return { 'index': self.actionsComboBox.currentIndex(), 'match': self.matchLineEdit.text(), 'value': self.valueLineEdit.text() }
+        return self.scopeSettings({ 'index': self.actionsComboBox.currentIndex(), 'match': self.matchLineEdit.text(), 'value': self.valueLineEdit.text() })
 
     def loadSettings(self, settings):
         self.actionsComboBox.setCurrentIndex(settings['index'])
         self.actionsComboBoxActivated()
         self.matchLineEdit.setText(settings['match'])
         self.valueLineEdit.setText(settings['value'])
-
-    def openPreviewActionDialog(self, content):
-        dialog = QDialog()
-        dialog.setWindowTitle(i18n("Confirm renaming"))
-        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-        buttons.accepted.connect(dialog.accept)
-        buttons.rejected.connect(dialog.reject)
-        dialog.setLayout(QVBoxLayout())
-        dialog.layout().addWidget(content)
-        dialog.layout().addWidget(buttons)
-        return dialog
-
-    def doAction(self, comboBox, lineEdit, valueEdit):
-
-        doc = KI.activeDocument()
-        if doc == None:
-            return
-
-        try:
-            action_type = comboBox.itemData(comboBox.currentIndex())
-
-            value_text = valueEdit.text()
-            match_text = lineEdit.text()
-
-            if action_type is BulkAction.SET_OPACITY:
-                numbers = re.compile('\d+(?:\.\d+)?')
-                value_text = numbers.findall(value_text)[0]
-                if value_text == '':
-                    value_text = '100'
-                value_text = clamp(float(value_text),0,100)
-                value_text = int(remap(value_text,0.0,100.0,0,255))
-
-            if action_type is BulkAction.SET_NAME:
-                value_text = value_text
-
-            root = doc.rootNode()
-            root = KritaNode(root)
-            it = iterPre(root)
-
-            user_pattern = False
-
-            if match_text == "":
-                nodes = KI.activeWindow().activeView().selectedNodes()
-                it = map(partial(KritaNode), nodes)
-            else:
-                user_pattern = True
-                it = filter(lambda n: n.match(lineEdit.text()), it)
-
-            count_down, count_up = 0, -1
-
-            def setOpacity(n):
-                n.raw.setOpacity(value_text)
-            def setName(n, preview):
-                nonlocal count_down, count_up
-                count_up = count_up + 1
-                count_down = count_down - 1
-
-                text = value_text
-
-                mapping = [ ('i++', 'count_up'), ('i--', 'count_down'), ('i+', 'count_up_one'), ('i-', 'count_down_one'), \
-                    ('{%name}', n.raw.name()) \
-                ]
-                for k, v in mapping:
-                    text = text.replace(k, v)
-
-
-                mappings={\
-                    'count_up':count_up, 'count_down':count_down, \
-                    'count_up_one':count_up+1, 'count_down_one':count_down+1, \
-                }
-                try:
-                    text = text.format_map(mappings)
-                except KeyError as e:
-                    #for k, v in [ ('{', '{{'), ('}', '}}') ]:
-                    #    text = text.replace(k, v)
-                    text = text
-
-                if preview:
-                    return (n.raw.name(),text)
-
-                n.raw.setName(text)
-
-            if action_type is BulkAction.SET_OPACITY:
-                it = map(setOpacity, it)
-            if action_type is BulkAction.SET_NAME:
-                oit = it
-                lst = list(it)
-                if user_pattern:
-                    lst = list(reversed(lst))
-                count_down = len(lst)
-
-                it = list()
-
-                preview = ''
-                for i, val in enumerate(lst):
-                    vals = setName(val,True)
-                    preview = preview + '{} => {}\n'.format(vals[0],vals[1])
-
-                preview = preview + 'Press \'OK\' to rename'
-                label = QLabel(preview)
-                dialog = self.openPreviewActionDialog(label)
-
-                if dialog.exec_() == QDialog.Accepted:
-                    count_down, count_up = len(lst), -1
-                    it = map(partial(flip(setName),False), lst)
-
-            kickstart(it)
-            doc.refreshProjection()
-        except ValueError as e:
-            print(e)
-        #except KeyError as e:
-        #    print(e)
+        self.loadScopeSettings(settings)
 
 class BulkBoolActionWidget(BulkActionBaseWidget):
     type = BulkActionType.BOOL
@@ -278,12 +387,7 @@ class BulkBoolActionWidget(BulkActionBaseWidget):
     def __init__(self, parent=None):
         BulkActionBaseWidget.__init__(self, parent=parent)
 
-        self.actionsComboBox = QComboBox()
-        self.actionsComboBox.addItem('Visible', BulkAction.BOOL_VISIBLE)
-        self.actionsComboBox.addItem('Locked', BulkAction.BOOL_LOCKED)
-        self.actionsComboBox.addItem('Alpha Locked', BulkAction.BOOL_ALPHA_LOCKED)
-        self.actionsComboBox.addItem('Collapsed', BulkAction.BOOL_COLLAPSED)
-        self.actionsComboBox.addItem('Inherit Alpha', BulkAction.BOOL_INHERIT_ALPHA)
+        self.addActionsComboBox()
         #self.actionsComboBox.insertSeparator(5)
         #self.actionsComboBox.addItem(QIcon.fromTheme("edit-rename"),'Opacity', BulkAction.INT_OPACITY)
 
@@ -297,224 +401,462 @@ class BulkBoolActionWidget(BulkActionBaseWidget):
         applyButton.setIcon(QIcon.fromTheme("view-refresh"))
 
         applyButton.released.connect(
-            partial(self.doAction, self.actionsComboBox, self.matchLineEdit)
+            partial(self.doAction)
         )
 
         self.actionsComboBox.activated.connect(
             partial(self.actionsComboBoxActivated, self.actionsComboBox)
         )
         self.matchLineEdit.returnPressed.connect(
-            partial(self.doAction, self.actionsComboBox, self.matchLineEdit)
+            partial(self.doAction)
         )
+        self.matchLineEdit.textEdited.connect(self.notifyChanged)
 
         self.hblayout.addWidget(applyButton)
         self.hblayout.addWidget(self.actionsComboBox)
         self.hblayout.addWidget(self.matchLineEdit)
+        self.addScopeWidgets()
+        self.addRemoveButton()
 
     def actionsComboBoxActivated(self, combo):
         index = combo.currentIndex()
         self.index = index
+        self.notifyChanged()
+
 
     def settings(self):
-        return { 'index': self.actionsComboBox.currentIndex(), 'match': self.matchLineEdit.text() }
+        return self.scopeSettings({ 'index': self.actionsComboBox.currentIndex(), 'match': self.matchLineEdit.text() })
 
     def loadSettings(self, settings):
         self.actionsComboBox.setCurrentIndex(settings['index'])
         self.matchLineEdit.setText(settings['match'])
-
-    def doAction(self, comboBox, lineEdit):
-
-        doc = KI.activeDocument()
-        if doc == None:
-            return
-
-        #msg, timeout = (cfg["done"]["msg"].format("Renaming successful!"), cfg["done"]["timeout"])
-        try:
-            action_type = comboBox.itemData(comboBox.currentIndex())
-            match_text = lineEdit.text()
-            #print('Action type',action_type)
-            doc = KI.activeDocument()
-            root = doc.rootNode()
-            root = KritaNode(root)
-
-            it = iterPre(root)
-
-            if match_text == "":
-                nodes = KI.activeWindow().activeView().selectedNodes()
-                it = map(partial(KritaNode), nodes)
-            else:
-                it = filter(lambda n: n.match(lineEdit.text()), it)
-
-            def toggleVisible(n):
-                n.setVisible(not n.visible())
-            def toggleLock(n):
-                n.setLocked(not n.locked())
-            def toggleAlphaLocked(n):
-                n.raw.setAlphaLocked(not n.raw.alphaLocked())
-            def toggleCollapsed(n):
-                n.raw.setCollapsed(not n.raw.collapsed())
-                #print('Setting',n.name,'collapsed',n.raw.collapsed())
-            def toggleInheritAlpha(n):
-                n.raw.setInheritAlpha(not n.raw.inheritAlpha())
-
-            if action_type is BulkAction.BOOL_VISIBLE:
-                it = map(toggleVisible, it)
-            if action_type is BulkAction.BOOL_LOCKED:
-                it = map(toggleLock, it)
-            if action_type is BulkAction.BOOL_ALPHA_LOCKED:
-                it = map(toggleAlphaLocked, it)
-            if action_type is BulkAction.BOOL_COLLAPSED:
-                it = map(toggleCollapsed, it)
-            if action_type is BulkAction.BOOL_INHERIT_ALPHA:
-                it = map(toggleInheritAlpha, it)
-
-            kickstart(it)
-            doc.refreshProjection()
-        except ValueError as e:
-            print(e)
-            #msg, timeout = cfg["error"]["msg"].format(e), cfg["error"]["timeout"]
-        #statusBar.showMessage(msg, timeout)
+        self.loadScopeSettings(settings)
 
 class BulkActionsDockWidget(DockWidget):
     title = "Bulk Actions"
-    listLayout = QVBoxLayout()
-    actions = list()
 
     def __init__(self):
         super().__init__()
         KI.setBatchmode(True)
         self.setWindowTitle(self.title)
+        # The `PlanJob` computing the next run's plan in the background, polled by `planTimer`
+        self.planJob = None
+        self.planTimer = QTimer(self)
+        self.planTimer.setSingleShot(True)
+        self.planTimer.setInterval(10)
+        self.planTimer.timeout.connect(self.pollPlan)
+        # The `ChunkedRun` being applied, stepped by `runTimer`
+        self.run = None
+        self.runTimer = QTimer(self)
+        self.runTimer.setSingleShot(True)
+        self.runTimer.setInterval(0)
+        self.runTimer.timeout.connect(self.stepRun)
+        # The documents "Run in all documents" has yet to run in, `None` unless one is running
+        self.documentsRun = None
+        # Key of the document the presets and snapshots were loaded from
+        self.activeKey = None
+        # (document name, RunStats) of the last run, for the stats panel
+        self.lastStats = []
+        # Document key -> `Transaction` of the last run in the document, for "Revert last run"
+        self.transactions = {}
+        # The `StatePreset`s of the document, saved and loaded with the actions
+        self.presets = []
+        # The `Snapshot`s of the active document, saved in it as soon as they change
+        self.snapshots = []
         self.createInterface()
 
-    def isPluginSettingsLayer(self, n):
-        return n.isGroupLayer() and n.name == 'Plugin Settings'
-
-    def isSettingsLayer(self, n):
-        return n.name == 'Bulk Actions' and self.isPluginSettingsLayer(n.parent)
-
     def clearBulkActions(self):
-        self.actions = list()
-        while self.listLayout.count():
-            child = self.listLayout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
+        self.actionList.clear()
 
     def addNewBulkAction(self, bulk_action_type, settings=None):
+        if settings is None:
+            settings = { 'index': 0, 'match': '', 'value': '' }
+        self.actionList.addSpec(ActionSpec.fromSettings(bulk_action_type, settings))
+
+    def showRunStatus(self, changes, stats=None):
+        if changes is not None:
+            self.statusBar.showMessage(runStatusMessage(changes, stats), 5000)
+
+    def isBusy(self):
+        return self.planJob is not None or self.run is not None or self.documentsRun is not None
+
+    def runBulkActions(self, specs):
+        """
+        Plan `specs` for the active document in the background (see `Pipeline`), then apply
+        them in time slices, handing control back to Krita between them. Small runs finish
+        within the first slice without showing any progress. Actions on the selected layers
+        only have nothing to match and are planned right away.
+        """
+        if self.isBusy():
+            self.statusBar.showMessage('Wait for the running actions to finish or cancel them', 5000)
+            return
 
-        removeButton = QToolButton()
-        removeButton.setIcon(QIcon.fromTheme("list-remove"))
-
-        bulkActionWidget = None
+        stats = RunStats(self.takeProfileRequest())
+        if all(spec.match == '' for spec in specs):
+            run = startSelectionActions(specs, stats)
+            if run is not None:
+                self.run = run
+                self.stepRun()
+            return
 
-        if bulk_action_type == BulkActionType.BOOL:
-            bulkActionWidget = BulkBoolActionWidget()
-        elif bulk_action_type == BulkActionType.SET:
-            bulkActionWidget = BulkSetActionWidget()
-        else:
-            raise NotImplementedError()
+        job = startBulkActions(specs, stats)
+        if job is None:
+            return
 
-        if settings is not None:
-            bulkActionWidget.loadSettings(settings)
+        # Small plans are done within a slice - no events ran, so the layers can't have changed
+        if job.wait(PLAN_BUDGET):
+            self.startRun(job, False)
+            return
 
-        widget = QWidget()
+        # No way to tell how far the workers are
+        self.runProgressBar.setMaximum(0)
+        self.runProgressWidget.show()
+        self.planJob = job
+        self.planTimer.start()
 
-        hBoxLayout = QHBoxLayout()
-        hBoxLayout.setContentsMargins(0, 0, 0, 0)
-        hBoxLayout.addWidget(bulkActionWidget)
-        hBoxLayout.addWidget(removeButton)
+    def pollPlan(self):
+        job = self.planJob
+        if job is None:
+            return
+        if not job.isDone():
+            self.planTimer.start()
+            return
 
-        widget.setLayout(hBoxLayout)
-        #self.listLayout.addWidget(widget)
-        self.listLayout.insertWidget(0,widget)
+        self.planJob = None
+        self.runProgressWidget.hide()
+        self.startRun(job, True)
 
-        self.actions.append(bulkActionWidget)
+    def startRun(self, job, resync):
+        try:
+            run = finishPlanning(job, confirmRenames, resync=resync)
+        except ValueError as e:
+            print(e)
+            return
+        if run is None:
+            return
 
-        def removeBulkAction():
-            self.actions.remove(bulkActionWidget)
-            widget.deleteLater()
+        self.run = run
+        self.stepRun()
 
-        removeButton.clicked.connect( partial(removeBulkAction) )
+    def stepRun(self):
+        run = self.run
+        if run is None:
+            return
+        try:
+            finished = run.step()
+        except Exception as e:
+            # The step rolled the run back already
+            self.run = None
+            self.runProgressWidget.hide()
+            self.statusBar.showMessage('Failed and rolled back: {}'.format(e), 10000)
+            print(e)
+            return
 
-    def hasSettings(self):
+        if finished:
+            self.run = None
+            self.runProgressWidget.hide()
+            self.showRunStatus(run.changes, run.stats)
+            self.recordTransaction(run.doc, run.changes)
+            self.actionList.setActionStats(run.stats.actions)
+            self.showStats([ (documentName(run.doc), run.stats) ])
+            return
 
+        self.runProgressBar.setMaximum(run.total)
+        self.runProgressBar.setValue(run.done)
+        self.runProgressWidget.show()
+        self.runTimer.start()
+
+    def cancelRun(self):
+        if self.planJob is not None:
+            self.planTimer.stop()
+            self.planJob.cancel()
+            self.planJob = None
+            self.runProgressWidget.hide()
+            self.statusBar.showMessage('Cancelled before anything was changed', 5000)
+            return
+        if self.run is None:
+            return
+        self.runTimer.stop()
+        restored = self.run.cancel()
+        self.statusBar.showMessage('Cancelled, rolled back {} changes'.format(restored), 5000)
+        self.showStats([ (documentName(self.run.doc), self.run.stats) ])
+        self.run = None
+        self.runProgressWidget.hide()
+
+    def recordTransaction(self, doc, changes):
+        if changes is not None and changes.applied:
+            self.transactions[documentKey(doc)] = changes.transaction
+        self.updateRevertButton()
+
+    def updateRevertButton(self):
         doc = KI.activeDocument()
-        if doc == None:
-            return False
+        transaction = self.transactions.get(documentKey(doc)) if doc is not None else None
+        self.revertButton.setEnabled(transaction is not None)
+        self.revertButton.setToolTip('Undo the {} changes of the last run in this document'.format(len(transaction)) if transaction is not None else 'Undo the last run in this document')
 
-        # TODO The following works but it's saved in kritarc - we want a way to save it with the document
-        #entry = Application.readSetting('bulkActionsPlugin', 'settings', None)
-        #return entry is not None
-
-        root = doc.rootNode()
-        root = KritaNode(root)
-
-        it = iterPre(root)
-        it = filter(self.isSettingsLayer, it)
-
-        l = list(it)
-
-        if len(l) == 0:
-            return False
-
-        children = l[0].children
+    def revertLastRun(self):
+        doc = KI.activeDocument()
+        if doc == None or self.isBusy():
+            return
+        transaction = self.transactions.pop(documentKey(doc), None)
+        if transaction is None:
+            return
 
-        if len(children) == 0:
-            return False
-        return True
+        try:
+            changes = revertActions(doc, transaction)
+        except Exception as e:
+            # Nothing was restored - keep the journal to try again
+            self.transactions[documentKey(doc)] = transaction
+            self.statusBar.showMessage('Could not revert: {}'.format(e), 10000)
+            print(e)
+            return
+        finally:
+            self.updateRevertButton()
+
+        message = 'Reverted {} changes'.format(changes.applied)
+        if changes.applied < len(transaction):
+            message += ', kept {} changed since'.format(len(transaction) - changes.applied)
+        self.statusBar.showMessage(message, 5000)
+
+    def setPresets(self, presets):
+        current = self.presetComboBox.currentText()
+        self.presets = presets
+        self.presetComboBox.clear()
+        self.presetComboBox.addItems([ p.name for p in presets ])
+        index = self.presetComboBox.findText(current)
+        if index != -1:
+            self.presetComboBox.setCurrentIndex(index)
+        self.presetWidget.setEnabled(bool(presets))
+
+    def currentPreset(self):
+        index = self.presetComboBox.currentIndex()
+        return self.presets[index] if 0 <= index < len(self.presets) else None
+
+    def applyPreset(self):
+        preset = self.currentPreset()
+        if preset is not None:
+            self.runBulkActions(preset.specs)
+
+    def editPreset(self):
+        # Load the preset's actions into the list, to change them and save them again
+        preset = self.currentPreset()
+        if preset is not None:
+            self.actionList.setSpecs(preset.specs)
+
+    def saveAsPreset(self):
+        specs = self.actionList.specs()
+        if len(specs) == 0:
+            self.statusBar.showMessage('Add the actions of the preset to the list first', 5000)
+            return
+        name, ok = QInputDialog.getText(self, 'Save state preset', 'Save the actions in the list as preset:', text=self.presetComboBox.currentText())
+        name = name.strip()
+        if not ok or name == '':
+            return
+        self.setPresets(replacePreset(self.presets, StatePreset(name, specs)))
+        self.presetComboBox.setCurrentIndex(self.presetComboBox.findText(name))
+        self.statusBar.showMessage('Saved preset "{}", press "Save" to store it in the document'.format(name), 5000)
+
+    def removePreset(self):
+        preset = self.currentPreset()
+        if preset is not None:
+            self.setPresets([ p for p in self.presets if p is not preset ])
+
+    def loadPresets(self):
+        # Presets belong to the active document, never carry them over to another one
+        presets = []
+        doc = KI.activeDocument()
+        if doc is not None:
+            try:
+                settings = loadSettings(doc)
+                if settings is not None:
+                    presets = statePresets(settings)
+            except ValueError as e:
+                print(e)
+        self.setPresets(presets)
+
+    def loadSnapshots(self):
+        self.snapshots = []
+        doc = KI.activeDocument()
+        if doc is not None:
+            try:
+                data = loadSnapshots(doc)
+                if data is not None:
+                    self.snapshots = snapshotsFromData(data)
+            except ValueError as e:
+                print(e)
+        self.showSnapshots()
+
+    def showSnapshots(self, current=None):
+        current = current if current is not None else self.snapshotComboBox.currentText()
+        self.snapshotComboBox.clear()
+        self.snapshotComboBox.addItems([ s.name for s in self.snapshots ])
+        index = self.snapshotComboBox.findText(current)
+        if index != -1:
+            self.snapshotComboBox.setCurrentIndex(index)
+        self.snapshotWidget.setEnabled(bool(self.snapshots))
+
+    def storeSnapshots(self, doc):
+        try:
+            saveSnapshots(doc, snapshotsData(self.snapshots) if self.snapshots else None)
+        except ValueError as e:
+            print(e)
 
-    def loadSettings(self):
-        #print('Loading...')
+    def currentSnapshot(self):
+        index = self.snapshotComboBox.currentIndex()
+        return self.snapshots[index] if 0 <= index < len(self.snapshots) else None
 
+    def captureSnapshot(self):
         doc = KI.activeDocument()
         if doc == None:
             return
+        name, ok = QInputDialog.getText(self, 'Capture snapshot', 'Save the state of all layers as:', text=self.snapshotComboBox.currentText())
+        name = name.strip()
+        if not ok or name == '':
+            return
 
-        # TODO The following works but it's saved in kritarc - we want a way to save it with the document
-        #entry = Application.readSetting('bulkActionsPlugin', 'settings', None)
-        #return entry is not None
-        #decoded = Application.readSetting('bulkActionsPlugin', 'settings', None)
-        #decoded = base64.b64decode(decoded).decode('utf-8')
-        #return json.loads(decoded)
+        snapshot = captureSnapshot(doc, name)
+        self.snapshots = [ s for s in self.snapshots if s.name != name ] + [ snapshot ]
+        self.storeSnapshots(doc)
+        self.showSnapshots(name)
+        self.statusBar.showMessage('Captured {} layers as "{}"'.format(len(snapshot), name), 5000)
 
-        decoded = None
+    def restoreSnapshot(self):
+        doc = KI.activeDocument()
+        snapshot = self.currentSnapshot()
+        if doc == None or snapshot is None or self.isBusy():
+            return
+        try:
+            changes = restoreSnapshot(doc, snapshot)
+        except Exception as e:
+            # The changes were rolled back
+            self.statusBar.showMessage('Failed and rolled back: {}'.format(e), 10000)
+            print(e)
+            return
+        self.recordTransaction(doc, changes)
+        self.statusBar.showMessage('Restored "{}": {}'.format(snapshot.name, runStatusMessage(changes)), 5000)
 
+    def removeSnapshot(self):
+        doc = KI.activeDocument()
+        snapshot = self.currentSnapshot()
+        if doc == None or snapshot is None:
+            return
+        self.snapshots = [ s for s in self.snapshots if s is not snapshot ]
+        self.storeSnapshots(doc)
+        self.showSnapshots()
+
+    def takeProfileRequest(self):
+        # Profiling is switched on for one run at a time
+        profile = self.profileCheckBox.isChecked()
+        self.profileCheckBox.setChecked(False)
+        return profile
+
+    def showStats(self, runs):
+        """
+        Show the `RunStats` of the last run, one per document, in the stats panel. The profile
+        of a profiled run is printed.
+        """
+        self.lastStats = runs
+        lines = []
+        for name, stats in runs:
+            lines.append('{}: {:.1f} ms'.format(name, stats.total * 1000))
+            for stage, seconds in stats.seconds.items():
+                lines.append('    {:<10} {:8.1f} ms'.format(stage, seconds * 1000))
+            lines.append('    {} visited, {} childNodes() calls'.format(stats.counts['visited'], stats.counts['childNodes']))
+            lines.append('    {} matched, {} setter calls{}'.format(stats.matched, stats.counts['setters'], ', refreshed' if stats.refreshed else ''))
+            report = stats.profileReport()
+            if report is not None:
+                print('Profile of the run in {}:\n{}'.format(name, report))
+        self.statsText.setText('\n'.join(lines))
+        self.exportStatsButton.setEnabled(bool(runs))
+
+    def exportStats(self):
+        if not self.lastStats:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, 'Export statistics', 'bulk-actions-stats.json', 'JSON (*.json)')
+        if not path:
+            return
+        try:
+            exportStats(path, [ (name, stats.toDict()) for name, stats in self.lastStats ])
+        except OSError as e:
+            print(e)
 
-        root = doc.rootNode()
-        root = KritaNode(root)
+    def runAllBulkActions(self):
+        self.runBulkActions(self.actionList.specs())
 
-        it = iterPre(root)
+    def runSelectedBulkActions(self):
+        self.runBulkActions(self.actionList.specs(checked=True))
 
-        it = filter(self.isSettingsLayer, it)
+    def runInAllDocuments(self):
+        """
+        Run all actions in every open document, one document per event loop iteration so
+        Krita stays responsive in between. No other run, revert or restore can start until
+        it's done.
+        """
+        if self.isBusy():
+            self.statusBar.showMessage('Wait for the running actions to finish or cancel them', 5000)
+            return
 
-        l = list(it)
-        if len(l) == 0:
-            return None
+        specs = self.actionList.specs()
+        documents = list(KI.documents())
+        if len(specs) == 0 or len(documents) == 0:
+            return
 
-        children = l[0].children
+        # Empty patterns act on the selected layers, which only the active document has
+        active = KI.activeDocument()
+        activeKey = documentKey(active) if active is not None else None
+        total = len(documents)
+        reports = []
+        profile = self.takeProfileRequest()
+
+        def finish():
+            self.documentsRun = None
+            self.runAllDocumentsButton.setEnabled(True)
+
+        def runNext():
+            try:
+                if not documents:
+                    finish()
+                    for report in reports:
+                        print('{}: {}'.format(report.name, report.summary()))
+                    self.statusBar.showMessage(documentsStatusMessage(reports), 10000)
+                    self.statusBar.setToolTip('\n'.join('{}: {}'.format(r.name, r.summary()) for r in reports))
+                    self.showStats([ (r.name, r.stats) for r in reports if r.changes is not None ])
+                    return
+
+                doc = documents.pop(0)
+                selection = selectedNodes if documentKey(doc) == activeKey else None
+                # Failed runs are rolled back and reported, the other documents still run
+                report = runTimed(doc, specs, selection, confirmRenames, profile)
+                reports.append(report)
+                self.recordTransaction(doc, report.changes)
+                self.statusBar.showMessage('Ran in {} of {} documents'.format(len(reports), total))
+            except Exception as e:
+                # Never leave the docker busy for good
+                finish()
+                self.statusBar.showMessage('Run in all documents failed after {} of {} documents: {}'.format(len(reports), total, e), 10000)
+                print(e)
+                return
+            QTimer.singleShot(0, runNext)
+
+        self.documentsRun = documents
+        self.runAllDocumentsButton.setEnabled(False)
+        QTimer.singleShot(0, runNext)
 
-        if len(children) == 0:
-            return None
-        else:
-            dataLayer = children[0]
-            dataLayer.setLocked(False)
-            decoded = dataLayer.name
-            decoded = base64.b64decode(decoded).decode('utf-8')
-            dataLayer.setLocked(True)
+    def loadAndApplySettings(self):
+        doc = KI.activeDocument()
+        if doc == None:
+            return
 
-        #print('Loaded',decoded)
-        return json.loads(decoded)
+        try:
+            settings = loadSettings(doc)
+        except ValueError as e:
+            print(e)
+            return
 
-    def loadAndApplySettings(self):
-        if self.hasSettings():
-            self.clearBulkActions()
-            settings = self.loadSettings()
-            if settings['version'] == 1.0:
-                for actionSetting in settings['actions']:
-                    self.addNewBulkAction(BulkActionType.BOOL,actionSetting)
-            if settings['version'] == 1.1:
-                for actionSetting in settings['actions']:
-                    #print(actionSetting, actionSetting['type'],  BulkActionType(actionSetting['type']))
-                    self.addNewBulkAction(BulkActionType(actionSetting['type']), actionSetting['settings'])
+        if settings is not None:
+            # Only the rows scrolled into view get widgets
+            self.actionList.setSpecs(actionSpecs(settings))
+            self.setPresets(statePresets(settings))
 
     def saveSettings(self):
 
@@ -522,72 +864,8 @@ class BulkActionsDockWidget(DockWidget):
         if doc == None:
             return
 
-        #msg, timeout = (cfg["done"]["msg"].format("Renaming successful!"), cfg["done"]["timeout"])
         try:
-            bulkActions = []
-            for ba in self.actions:
-                bulkActions.append( { 'settings': ba.settings(), 'type': ba.type.value } )
-            data = json.dumps({ 'version': 1.1, 'actions':bulkActions }, separators=(',', ':'))
-            encodedBytes = base64.b64encode(data.encode("utf-8"))
-            encoded = str(encodedBytes, "utf-8")
-
-            #print(data)
-            #return
-
-            # TODO The following works but it's saved in kritarc - we want a way to save it with each document
-            #Application.writeSetting('bulkActionsPlugin', 'settings', encoded)
-
-            root = doc.rootNode()
-            root = KritaNode(root)
-
-            it = iterPre(root)
-
-            it = filter(self.isPluginSettingsLayer, it)
-            if len(list(it)) == 0:
-                gl = doc.createGroupLayer('Plugin Settings')
-                gl.setVisible(False)
-                gl.setCollapsed(True)
-                gl.setLocked(True)
-                doc.rootNode().addChildNode(gl, doc.rootNode().childNodes()[0])
-
-            it = iterPre(root)
-            it = filter(self.isSettingsLayer, it)
-
-            if len(list(it)) == 0:
-                gl = doc.createGroupLayer('Bulk Actions')
-                gl.setVisible(False)
-                gl.setCollapsed(True)
-                gl.setLocked(True)
-                it = iterPre(root)
-                it = filter(self.isPluginSettingsLayer, it)
-                list(it)[0].raw.addChildNode(gl, None)
-
-            it = iterPre(root)
-            it = filter(self.isSettingsLayer, it)
-
-            children = list(it)[0].children
-
-            if len(children) == 0:
-                gl = doc.createGroupLayer(encoded)
-                gl.setVisible(False)
-                gl.setLocked(True)
-                it = iterPre(root)
-                it = filter(self.isSettingsLayer, it)
-                list(it)[0].raw.addChildNode(gl, None)
-            else:
-                dataLayer = children[0]
-                dataLayer.setLocked(False)
-                dataLayer.raw.setName(encoded)
-                dataLayer.setLocked(True)
-
-            #print('Saved',base64.b64decode(encoded).decode('utf-8'))
-            #for i in list(it):
-            #    print('Hep',type(i),i)
-
-            #str.encode('base64','strict')
-
-            #kickstart(it)
-            doc.refreshProjection()
+            saveSettings(doc, [ (spec.type, spec.settings()) for spec in self.actionList.specs() ], presetSettings(self.presets))
         except ValueError as e:
             print(e)
 
@@ -607,13 +885,50 @@ class BulkActionsDockWidget(DockWidget):
         addSetButton = QToolButton()
         addSetButton.setIcon(QIcon.fromTheme("checkmark"))
 
+        statsButton = QToolButton()
+        statsButton.setIcon(QIcon.fromTheme("view-statistics"))
+        statsButton.setToolTip('Show the timings and counts of the last run')
+        statsButton.setCheckable(True)
+
         helpHBoxLayout = QHBoxLayout()
         helpHBoxLayout.addWidget(QLabel("Add action"))
         helpHBoxLayout.addWidget(addBoolButton)
         helpHBoxLayout.addWidget(addSetButton)
         helpHBoxLayout.addStretch()
+        helpHBoxLayout.addWidget(statsButton)
         helpHBoxLayout.addWidget(helpButton)
 
+        runAllButton = QPushButton('Run all')
+        runSelectedButton = QPushButton('Run selected')
+
+        self.runAllDocumentsButton = QPushButton('Run in all documents')
+        self.runAllDocumentsButton.setToolTip('Run all actions in every open document')
+
+        self.revertButton = QToolButton()
+        self.revertButton.setIcon(QIcon.fromTheme("edit-undo"))
+        self.revertButton.setEnabled(False)
+        self.revertButton.clicked.connect(
+            partial(self.revertLastRun)
+        )
+
+        runHBoxLayout = QHBoxLayout()
+        runHBoxLayout.addWidget(runAllButton)
+        runHBoxLayout.addWidget(runSelectedButton)
+        runHBoxLayout.addWidget(self.runAllDocumentsButton)
+        runHBoxLayout.addWidget(self.revertButton)
+
+        self.runAllDocumentsButton.clicked.connect(
+            partial(self.runInAllDocuments)
+        )
+
+        runAllButton.clicked.connect(
+            partial(self.runAllBulkActions)
+        )
+
+        runSelectedButton.clicked.connect(
+            partial(self.runSelectedBulkActions)
+        )
+
         saveButton = QPushButton('Save')
         loadButton = QPushButton('Load')
         clearButton = QPushButton('Clear')
@@ -636,19 +951,155 @@ class BulkActionsDockWidget(DockWidget):
             partial(self.clearBulkActions)
         )
 
-        listWidget = QWidget()
-        listWidget.setLayout(self.listLayout)
+        self.actionList = ActionListModel(self)
+        delegate = ActionDelegate(createBulkActionWidget, self)
+        delegate.runRequested.connect(self.runBulkActions)
+
+        listView = ActionListView()
+        listView.setItemDelegate(delegate)
+        listView.setModel(self.actionList)
+
+        self.presetComboBox = QComboBox()
+        self.presetComboBox.setToolTip('State presets of the document')
+
+        applyPresetButton = QPushButton('Apply preset')
+        applyPresetButton.setToolTip('Run the actions of the preset')
+        applyPresetButton.clicked.connect(
+            partial(self.applyPreset)
+        )
+
+        editPresetButton = QToolButton()
+        editPresetButton.setIcon(QIcon.fromTheme("document-edit"))
+        editPresetButton.setToolTip('Load the actions of the preset into the list')
+        editPresetButton.clicked.connect(
+            partial(self.editPreset)
+        )
+
+        removePresetButton = QToolButton()
+        removePresetButton.setIcon(QIcon.fromTheme("list-remove"))
+        removePresetButton.setToolTip('Remove the preset')
+        removePresetButton.clicked.connect(
+            partial(self.removePreset)
+        )
+
+        presetHBoxLayout = QHBoxLayout()
+        presetHBoxLayout.setContentsMargins(0, 0, 0, 0)
+        presetHBoxLayout.addWidget(self.presetComboBox, 1)
+        presetHBoxLayout.addWidget(applyPresetButton)
+        presetHBoxLayout.addWidget(editPresetButton)
+        presetHBoxLayout.addWidget(removePresetButton)
+
+        self.presetWidget = QWidget()
+        self.presetWidget.setLayout(presetHBoxLayout)
+        self.presetWidget.setEnabled(False)
+
+        savePresetButton = QToolButton()
+        savePresetButton.setIcon(QIcon.fromTheme("document-save-as"))
+        savePresetButton.setToolTip('Save the actions in the list as a state preset')
+        savePresetButton.clicked.connect(
+            partial(self.saveAsPreset)
+        )
+
+        presetsHBoxLayout = QHBoxLayout()
+        presetsHBoxLayout.addWidget(self.presetWidget, 1)
+        presetsHBoxLayout.addWidget(savePresetButton)
+
+        self.snapshotComboBox = QComboBox()
+        self.snapshotComboBox.setToolTip('Layer state snapshots of the document')
+
+        restoreSnapshotButton = QPushButton('Restore snapshot')
+        restoreSnapshotButton.setToolTip('Put every layer back in the state of the snapshot')
+        restoreSnapshotButton.clicked.connect(
+            partial(self.restoreSnapshot)
+        )
+
+        removeSnapshotButton = QToolButton()
+        removeSnapshotButton.setIcon(QIcon.fromTheme("list-remove"))
+        removeSnapshotButton.setToolTip('Remove the snapshot from the document')
+        removeSnapshotButton.clicked.connect(
+            partial(self.removeSnapshot)
+        )
+
+        snapshotHBoxLayout = QHBoxLayout()
+        snapshotHBoxLayout.setContentsMargins(0, 0, 0, 0)
+        snapshotHBoxLayout.addWidget(self.snapshotComboBox, 1)
+        snapshotHBoxLayout.addWidget(restoreSnapshotButton)
+        snapshotHBoxLayout.addWidget(removeSnapshotButton)
+
+        self.snapshotWidget = QWidget()
+        self.snapshotWidget.setLayout(snapshotHBoxLayout)
+        self.snapshotWidget.setEnabled(False)
+
+        captureSnapshotButton = QToolButton()
+        captureSnapshotButton.setIcon(QIcon.fromTheme("camera-photo"))
+        captureSnapshotButton.setToolTip('Capture the state of every layer as a snapshot, stored in the document')
+        captureSnapshotButton.clicked.connect(
+            partial(self.captureSnapshot)
+        )
 
-        scrollArea = QScrollArea()
-        scrollArea.setWidget(listWidget)
-        scrollArea.setWidgetResizable(True)
+        snapshotsHBoxLayout = QHBoxLayout()
+        snapshotsHBoxLayout.addWidget(self.snapshotWidget, 1)
+        snapshotsHBoxLayout.addWidget(captureSnapshotButton)
 
         mainLayout = QVBoxLayout()
         mainLayout.addLayout(helpHBoxLayout)
         mainLayout.addWidget(QHLine())
-        mainLayout.addWidget(scrollArea)
+        mainLayout.addWidget(listView)
+        mainLayout.addLayout(runHBoxLayout)
+        mainLayout.addLayout(presetsHBoxLayout)
+        mainLayout.addLayout(snapshotsHBoxLayout)
         mainLayout.addLayout(settingsHBoxLayout)
 
+        self.runProgressBar = QProgressBar()
+        cancelRunButton = QToolButton()
+        cancelRunButton.setIcon(QIcon.fromTheme("dialog-cancel"))
+        cancelRunButton.setToolTip('Cancel and undo the changes made so far')
+        cancelRunButton.clicked.connect(
+            partial(self.cancelRun)
+        )
+
+        runProgressHBoxLayout = QHBoxLayout()
+        runProgressHBoxLayout.setContentsMargins(0, 0, 0, 0)
+        runProgressHBoxLayout.addWidget(self.runProgressBar)
+        runProgressHBoxLayout.addWidget(cancelRunButton)
+
+        self.runProgressWidget = QWidget()
+        self.runProgressWidget.setLayout(runProgressHBoxLayout)
+        self.runProgressWidget.hide()
+        mainLayout.addWidget(self.runProgressWidget)
+
+        self.statsText = QLabel('No runs yet')
+        self.statsText.setStyleSheet('font-family: monospace')
+        self.statsText.setTextInteractionFlags(Qt.TextSelectableByMouse)
+
+        self.profileCheckBox = QCheckBox('Profile next run')
+        self.profileCheckBox.setToolTip('Run the next action run under cProfile and print the profile')
+
+        self.exportStatsButton = QPushButton('Export JSON')
+        self.exportStatsButton.setEnabled(False)
+        self.exportStatsButton.clicked.connect(
+            partial(self.exportStats)
+        )
+
+        statsHBoxLayout = QHBoxLayout()
+        statsHBoxLayout.addWidget(self.profileCheckBox)
+        statsHBoxLayout.addStretch()
+        statsHBoxLayout.addWidget(self.exportStatsButton)
+
+        statsVBoxLayout = QVBoxLayout()
+        statsVBoxLayout.addWidget(self.statsText)
+        statsVBoxLayout.addLayout(statsHBoxLayout)
+
+        self.statsPanel = QGroupBox('Last run')
+        self.statsPanel.setLayout(statsVBoxLayout)
+        self.statsPanel.hide()
+        statsButton.toggled.connect(self.statsPanel.setVisible)
+        mainLayout.addWidget(self.statsPanel)
+
+        self.statusBar = QStatusBar()
+        self.statusBar.setSizeGripEnabled(False)
+        mainLayout.addWidget(self.statusBar)
+
         helpButton.clicked.connect(
             partial(openHelp)
         )
@@ -667,7 +1118,21 @@ class BulkActionsDockWidget(DockWidget):
         self.setWidget(uiContainer)
 
     def canvasChanged(self, canvas):
-        pass
+        # Called when the active document changes - a good time to drop the caches of closed
+        # documents. The index of the new document syncs itself before its next run.
+        documents = KI.documents()
+        pruneDocuments(documents)
+        pruneSettingsLayers(documents)
+        keys = set(documentKey(doc) for doc in documents)
+        self.transactions = { key: t for key, t in self.transactions.items() if key in keys }
+        self.updateRevertButton()
+        # Switching between views of the same document changes nothing stored in it
+        doc = KI.activeDocument()
+        key = documentKey(doc) if doc is not None else None
+        if key != self.activeKey:
+            self.activeKey = key
+            self.loadPresets()
+            self.loadSnapshots()
 
 
 def registerDocker():
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+"""
+
+from .Stats import counters
+from .Utils import unionRect, intersectRect, containsRect
+
+# Node attribute -> (getter, setter) on Krita's Node class
+ATTRIBUTES = {
+    'visible': ('visible', 'setVisible'),
+    'locked': ('locked', 'setLocked'),
+    'alphaLocked': ('alphaLocked', 'setAlphaLocked'),
+    'collapsed': ('collapsed', 'setCollapsed'),
+    'inheritAlpha': ('inheritAlpha', 'setInheritAlpha'),
+    'opacity': ('opacity', 'setOpacity'),
+    'name': ('name', 'setName'),
+}
+
+# Attributes that change what the layer stack composites to. Locking, alpha locking, collapsing
+# and renaming never change pixels.
+PIXEL_ATTRIBUTES = { 'visible', 'inheritAlpha', 'opacity' }
+
+
+class ChangeSet:
+    """
+    Collects the target state of node attributes from any number of actions before anything
+    is written to the document.
+
+    Writes to the same attribute of the same node are merged - the last one wins, and toggles
+    see the pending value of earlier actions. `apply` then only calls the setters of attributes
+    whose target differs from the value the node had to begin with.
+
+    Applying is all or nothing: if a setter fails, the writes made before it are rolled back.
+    Once applied, `transaction` holds the journal to revert the whole change set with.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        # (uid, attribute) -> value read from the document
+        self.original = {}
+        # (uid, attribute) -> pending value, in the order the attributes were first touched
+        self.target = {}
+        self.requested = 0
+        self.applied = 0
+        self.skipped = 0
+        # Writes to make, from `begin`, and the ones made so far
+        self.pending = []
+        self.written = []
+        self.transaction = None
+
+    def __len__(self):
+        return len(self.target)
+
+    def _key(self, node, attr):
+        uid = node.uniqueId
+        self.nodes.setdefault(uid, node)
+        return uid, attr
+
+    def _read(self, key):
+        value = self.original.get(key)
+        if value is None and key not in self.original:
+            node, attr = self.nodes[key[0]], key[1]
+            # Names are memoised by the node handle
+            if attr == 'name':
+                value = node.name
+            else:
+                value = getattr(node.raw, ATTRIBUTES[attr][0])()
+            self.original[key] = value
+        return value
+
+    def seed(self, node, attr, value):
+        """
+        Record `value`, read from the document by the caller, as the value `attr` of `node` has
+        to begin with, so it isn't read again.
+        """
+        self.original[self._key(node, attr)] = value
+
+    def get(self, node, attr):
+        """
+        Return the value `attr` of `node` will have once the change set is applied.
+        """
+        key = self._key(node, attr)
+        if key in self.target:
+            return self.target[key]
+        return self._read(key)
+
+    def isPending(self, node, attr):
+        """
+        Return whether a value was set for `attr` of `node`.
+        """
+        return (node.uniqueId, attr) in self.target
+
+    def set(self, node, attr, value):
+        key = self._key(node, attr)
+        self.requested += 1
+        self.target[key] = value
+
+    def toggle(self, node, attr):
+        self.set(node, attr, not self.get(node, attr))
+
+    def setAll(self, nodes, attr, value):
+        """
+        Like `set` for each of `nodes`, in one loop.
+        """
+        known, target = self.nodes, self.target
+        for node in nodes:
+            uid = node.uniqueId
+            known.setdefault(uid, node)
+            target[(uid, attr)] = value
+        self.requested += len(nodes)
+
+    def toggleAll(self, nodes, attr):
+        """
+        Like `toggle` for each of `nodes`, of a boolean attribute, in one loop.
+        """
+        known, target, original = self.nodes, self.target, self.original
+        getter = ATTRIBUTES[attr][0]
+        for node in nodes:
+            uid = node.uniqueId
+            known.setdefault(uid, node)
+            key = (uid, attr)
+            value = target.get(key)
+            if value is None:
+                value = original.get(key)
+                if value is None:
+                    value = original[key] = getattr(node.raw, getter)()
+            target[key] = not value
+        self.requested += len(nodes)
+
+    def changes(self):
+        """
+        Yield the (node, attribute, value) writes that actually change the document.
+        """
+        for key, value in self.target.items():
+            if self._read(key) != value:
+                yield self.nodes[key[0]], key[1], value
+
+    def apply(self):
+        """
+        Write the changes to the document.
+
+        Returns
+        -------
+        out: list((KritaNode, str, object))
+        The writes that were made.
+        """
+        self.begin()
+        try:
+            self.applyNext(len(self.pending))
+        except Exception:
+            self.rollback()
+            raise
+        return self.finish()
+
+    def begin(self):
+        """
+        Start applying the changes in steps with `applyNext`, ending with `finish` or `rollback`.
+        """
+        self.pending = list(self.changes())
+        self.written = []
+        return len(self.pending)
+
+    def applyNext(self, count):
+        """
+        Write up to `count` of the pending changes and return how many were written.
+        If a setter raises, the writes made before it are in `written`, ready for `rollback`.
+        """
+        written = self.written
+        start = len(written)
+        chunk = self.pending[start:start + count]
+        try:
+            for change in chunk:
+                node, attr, value = change
+                getattr(node.raw, ATTRIBUTES[attr][1])(value)
+                if attr == 'name':
+                    node.invalidate()
+                written.append(change)
+        finally:
+            counters['setters'] += len(written) - start
+        return len(written) - start
+
+    def isDone(self):
+        return len(self.written) == len(self.pending)
+
+    def finish(self):
+        applied = self.written
+        self.applied = len(applied)
+        self.skipped = self.requested - self.applied
+        self.transaction = Transaction(applied, self.original)
+        self.original.update(((node.uniqueId, attr), value) for node, attr, value in applied)
+        self.pending = []
+        return applied
+
+    def rollback(self):
+        """
+        Restore the original values of the changes written since `begin`, newest first.
+
+        Returns
+        -------
+        out: list((KritaNode, str, object))
+        The writes made to restore the document. They also become `written`, so `dirtyRect`
+        covers what the rollback touched.
+        """
+        restored = []
+        failed = 0
+        for node, attr, value in reversed(self.written):
+            original = self.original[(node.uniqueId, attr)]
+            try:
+                getattr(node.raw, ATTRIBUTES[attr][1])(original)
+            except Exception:
+                # Restore everything else rather than stopping at the first failure
+                failed += 1
+                continue
+            if attr == 'name':
+                node.invalidate()
+            restored.append((node, attr, original))
+        if failed:
+            print('Could not restore {} of {} changes'.format(failed, len(self.written)))
+        counters['setters'] += len(restored)
+        self.written = restored
+        self.pending = []
+        self.applied = 0
+        self.skipped = self.requested
+        return restored
+
+    def dirtyRect(self, canvas):
+        """
+        Compute the canvas area affected by the applied changes.
+
+        Parameters
+        ----------
+        canvas: (int, int, int, int)
+        The bounds of the document.
+
+        Returns
+        -------
+        out: (int, int, int, int) or None
+        The union of the bounds of every node that had a pixel affecting change, clipped to
+        `canvas`, or `None` if nothing visible can have changed.
+        """
+        rect = None
+        for node, attr, value in self.written:
+            if attr not in PIXEL_ATTRIBUTES:
+                continue
+            rect = unionRect(rect, node.bounds)
+            # Inherit alpha is composited against the layers of the parent group
+            if attr == 'inheritAlpha' and node.parent:
+                rect = unionRect(rect, node.parent.bounds)
+            # Reading bounds isn't free - stop once the whole canvas is dirty
+            if containsRect(rect, canvas):
+                return canvas
+        return intersectRect(rect, canvas)
+
+
+class Transaction:
+    """
+    Journal of an applied `ChangeSet`, to revert it in one go.
+
+    For each node it touched, the journal holds the value of every written attribute before
+    and after the change set: uid -> (node, { attribute: (before, after) }).
+    """
+
+    def __init__(self, writes, original):
+        self.journal = {}
+        for node, attr, value in writes:
+            uid = node.uniqueId
+            entry = self.journal.get(uid)
+            if entry is None:
+                entry = self.journal[uid] = (node, {})
+            entry[1][attr] = (original[(uid, attr)], value)
+
+    def __len__(self):
+        return sum(len(attrs) for node, attrs in self.journal.values())
+
+    def revertChanges(self, uids=None):
+        """
+        Plan the writes restoring the journaled values, without writing anything. Attributes
+        changed since the change set was applied are left as they are.
+
+        Parameters
+        ----------
+        uids: container(str)
+        The unique ids of the nodes still in the document (e.g. a `NodeIndex`), all journaled
+        nodes if `None`.
+
+        Returns
+        -------
+        out: ChangeSet
+        """
+        changes = ChangeSet()
+        for uid, (node, attrs) in self.journal.items():
+            if uids is not None and uid not in uids:
+                continue
+            # The name may have changed behind the handle's back
+            node.invalidate()
+            for attr, (before, after) in attrs.items():
+                if changes.get(node, attr) == after:
+                    changes.set(node, attr, before)
+        return changes
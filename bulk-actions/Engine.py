@@ -0,0 +1,808 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+"""
+
+import os
+import re
+import time
+
+from enum import IntEnum
+
+from .KritaNode import KritaNode, nodeId
+from .Index import cachedIndex, documentIndex
+from .ChangeSet import ChangeSet
+from .Pattern import Literal, compilePattern
+from .Stats import RunStats, counters
+from .Template import RenameContext, compileTemplate
+
+from .Utils import remap, clamp
+from .Utils.Tree import iterPre
+
+
+class BulkActionType(IntEnum):
+    BOOL = 0
+    SET = 1
+
+class BulkAction(IntEnum):
+    BOOL_VISIBLE = 0
+    BOOL_LOCKED = 1
+    BOOL_ALPHA_LOCKED = 2
+    BOOL_COLLAPSED = 3
+    BOOL_INHERIT_ALPHA = 4
+    SET_OPACITY = 5
+    SET_NAME = 6
+    SET_VISIBLE = 7
+    SET_LOCKED = 8
+    SET_ALPHA_LOCKED = 9
+    SET_COLLAPSED = 10
+    SET_INHERIT_ALPHA = 11
+
+
+# The actions of each action type, in the order the action widgets list them
+ACTIONS = {
+    BulkActionType.BOOL: [
+        BulkAction.BOOL_VISIBLE,
+        BulkAction.BOOL_LOCKED,
+        BulkAction.BOOL_ALPHA_LOCKED,
+        BulkAction.BOOL_COLLAPSED,
+        BulkAction.BOOL_INHERIT_ALPHA,
+    ],
+    BulkActionType.SET: [
+        BulkAction.SET_OPACITY,
+        BulkAction.SET_NAME,
+        BulkAction.SET_VISIBLE,
+        BulkAction.SET_LOCKED,
+        BulkAction.SET_ALPHA_LOCKED,
+        BulkAction.SET_COLLAPSED,
+        BulkAction.SET_INHERIT_ALPHA,
+    ],
+}
+
+# Display names of the actions
+LABELS = {
+    BulkAction.BOOL_VISIBLE: 'Visible',
+    BulkAction.BOOL_LOCKED: 'Locked',
+    BulkAction.BOOL_ALPHA_LOCKED: 'Alpha Locked',
+    BulkAction.BOOL_COLLAPSED: 'Collapsed',
+    BulkAction.BOOL_INHERIT_ALPHA: 'Inherit Alpha',
+    BulkAction.SET_OPACITY: 'Opacity',
+    BulkAction.SET_NAME: 'Name',
+    BulkAction.SET_VISIBLE: 'Set Visible',
+    BulkAction.SET_LOCKED: 'Set Locked',
+    BulkAction.SET_ALPHA_LOCKED: 'Set Alpha Locked',
+    BulkAction.SET_COLLAPSED: 'Set Collapsed',
+    BulkAction.SET_INHERIT_ALPHA: 'Set Inherit Alpha',
+}
+
+class ActionSpec:
+    """
+    Plain description of a single bulk action: what to do, which layers to do it to and
+    the value to use for SET actions.
+    An empty `match` means the action applies to the selected layers.
+    """
+
+    def __init__(self, action, match='', value='', scope='', depth=-1, expand=0):
+        self.action = BulkAction(action)
+        self.match = match
+        self.value = value
+        # '' for the whole document, '.' for the current layer or a group path like 'Robot/Head'
+        self.scope = scope
+        # Levels below the scope to include, -1 for all
+        self.depth = depth
+        # Levels below the selected groups to include when `match` is empty, -1 for all
+        self.expand = expand
+
+    def __repr__(self):
+        return 'ActionSpec({}, {!r}, {!r}, {!r}, {}, {})'.format(self.action.name, self.match, self.value, self.scope, self.depth, self.expand)
+
+    def isScoped(self):
+        return self.scope != '' or self.depth != -1
+
+    @property
+    def type(self):
+        return BulkActionType.SET if self.action in ACTIONS[BulkActionType.SET] else BulkActionType.BOOL
+
+    @classmethod
+    def fromSettings(cls, type, settings):
+        """
+        Create a spec from the settings dict saved by the action widgets.
+        """
+        action = ACTIONS[BulkActionType(type)][settings['index']]
+        return cls(action, settings.get('match', ''), settings.get('value', ''), settings.get('scope', ''), settings.get('depth', -1), settings.get('expand', 0))
+
+    def settings(self):
+        settings = { 'index': ACTIONS[self.type].index(self.action), 'match': self.match }
+        if self.type == BulkActionType.SET:
+            settings['value'] = self.value
+        if self.isScoped():
+            settings['scope'] = self.scope
+            settings['depth'] = self.depth
+        if self.expand != 0:
+            settings['expand'] = self.expand
+        return settings
+
+
+NUMBERS = re.compile(r'\d+(?:\.\d+)?')
+
+def parseOpacity(text):
+    """
+    Parse a 0 - 100% opacity text into Krita's 0 - 255 range. Empty text means 100%.
+    """
+    numbers = NUMBERS.findall(text)
+    value = numbers[0] if numbers else '100'
+    value = clamp(float(value), 0, 100)
+    return int(remap(value, 0.0, 100.0, 0, 255))
+
+STATES = {
+    'on': True, 'yes': True, 'true': True, '1': True,
+    'off': False, 'no': False, 'false': False, '0': False,
+}
+
+def parseState(text):
+    """
+    Parse the on / off value of a state action. Empty text means on.
+
+    Raises
+    ------
+    ValueError
+    If the text isn't one of on, off, yes, no, true, false, 1 or 0.
+    """
+    state = STATES.get(text.strip().lower() or 'on')
+    if state is None:
+        raise ValueError('Invalid state {!r}, use on or off'.format(text))
+    return state
+
+
+def renamePlan(template, nodes, names=None, term=None):
+    """
+    Compute the new names of `nodes` from a rename `template`, see `Template` for the syntax.
+
+    Parameters
+    ----------
+    template: str or Template
+    nodes: iter(KritaNode)
+    names: callable
+    Optionally maps a node to the name to use as its current name.
+    term: Term
+    The compiled pattern the nodes were matched by, for the {%0} {%1}... fields.
+
+    Returns
+    -------
+    out: list((KritaNode, str, str))
+    The node, its current name and its new name.
+
+    Raises
+    ------
+    ValueError
+    If the template is invalid or uses more pattern groups than `term` has.
+    """
+    if isinstance(template, str):
+        template = compileTemplate(template)
+    checkCaptures(template, term)
+
+    nodes = list(nodes)
+    return list(iterRenames(template, nodes, len(nodes), names, term))
+
+def iterRenames(template, nodes, count, names=None, term=None):
+    """
+    Like `renamePlan`, but yield the renames of the `count` `nodes` one at a time, for callers
+    that only keep the new names. The template must be compiled and checked.
+    """
+    render = template.render
+    for i, n in enumerate(nodes):
+        name = names(n) if names else n.name
+        captures = ()
+        if template.captures:
+            captures = term.captures(n) if term is not None else None
+            if captures is None:
+                # Selected layers, or a term that doesn't capture: {%0} is the whole name
+                captures = (name,)
+        yield n, name, render(RenameContext(n, name, i, count, captures))
+
+def checkCaptures(template, term):
+    groups = term.groups if term is not None else 0
+    if template.captures > groups + 1:
+        raise ValueError('Template {!r} uses {{%{}}} but the pattern only has {} groups'.format(template.text, template.captures - 1, groups))
+
+
+# BOOL action -> the node attribute it toggles
+TOGGLES = {
+    BulkAction.BOOL_VISIBLE: 'visible',
+    BulkAction.BOOL_LOCKED: 'locked',
+    BulkAction.BOOL_ALPHA_LOCKED: 'alphaLocked',
+    BulkAction.BOOL_COLLAPSED: 'collapsed',
+    BulkAction.BOOL_INHERIT_ALPHA: 'inheritAlpha',
+}
+
+# SET action -> the node attribute it sets on or off. Unlike toggles these leave layers that
+# are already in the state alone, so groups of layers in mixed states end up in the same one.
+SWITCHES = {
+    BulkAction.SET_VISIBLE: 'visible',
+    BulkAction.SET_LOCKED: 'locked',
+    BulkAction.SET_ALPHA_LOCKED: 'alphaLocked',
+    BulkAction.SET_COLLAPSED: 'collapsed',
+    BulkAction.SET_INHERIT_ALPHA: 'inheritAlpha',
+}
+
+def refreshDirty(doc, changes):
+    """
+    Refresh the projection of `doc` if the applied `changes` made any part of the canvas dirty.
+    The scripting API can only recomposite the whole image, so the dirty rect decides
+    whether a refresh is needed at all.
+    """
+    canvas = doc.bounds()
+    canvas = (canvas.x(), canvas.y(), canvas.width(), canvas.height())
+    if changes.dirtyRect(canvas) is None:
+        return False
+    doc.refreshProjection()
+    return True
+
+
+def findMatches(index, term):
+    """
+    Return the unique ids, in pre order, of the nodes in `index` matching the compiled pattern
+    `term`. Only the candidates the tag index can't rule out are tested.
+    """
+    candidates = term.candidates(index.tags)
+    uids = index.order if candidates is None else index.tags.ordered(candidates)
+    return [uid for uid in uids if term.matches(index.node(uid))]
+
+# Group holding the layers plugins store their settings in, see `Settings`. Its layers are
+# never acted on by patterns - the encoded settings can contain any tag.
+PLUGIN_SETTINGS = 'Plugin Settings'
+
+def pluginSettingsUids(index):
+    uids = set()
+    for uid in index.tags.lookup(PLUGIN_SETTINGS):
+        if index.names[uid] == PLUGIN_SETTINGS and index.types[uid] == 'grouplayer':
+            uids.update(index.subtree(uid))
+    return uids
+
+def isInPluginSettings(node):
+    n = node
+    while n:
+        if n.name == PLUGIN_SETTINGS and n.isGroupLayer():
+            return True
+        n = n.parent
+    return False
+
+def scopeRoot(doc, scope):
+    """
+    Return the `KritaNode` a scope starts at: the document root for '', the current layer for
+    '.' or the group at a path of layer names like 'Robot/Head'. Only the groups along the path
+    are asked for their children.
+    """
+    if scope == '':
+        return KritaNode(doc.rootNode())
+    if scope == '.':
+        node = doc.activeNode()
+        if node is None:
+            raise ValueError('There is no current layer to scope the action to')
+        return KritaNode(node)
+    node = KritaNode(doc.rootNode())
+    for name in filter(None, scope.split('/')):
+        node = next((c for c in node.children if c.name == name), None)
+        if node is None:
+            raise ValueError('No layer at scope {!r}'.format(scope))
+    return node
+
+def syncScopes(doc, index, specs, root):
+    """
+    Sync the index of `doc` where `specs` look and return it.
+
+    If `index` is built and every pattern spec is scoped, only the subtree of each scope is
+    synced, down to the deepest depth of the specs sharing it (see `NodeIndex.syncSubtree`).
+    Otherwise, or if a spec expands the selection, the whole document is.
+
+    Parameters
+    ----------
+    doc: Document
+    index: NodeIndex
+    The cached index of `doc`, see `cachedIndex`.
+    specs: list(ActionSpec)
+    root: callable
+    Returns the `KritaNode` a scope starts at, see `scopeRoot`.
+
+    Returns
+    -------
+    out: NodeIndex
+    """
+    matching = [ s for s in specs if s.match != "" ]
+    if (index is None or not index.built or not matching or not all(s.isScoped() for s in matching)
+            or any(s.match == "" and s.expand != 0 for s in specs)):
+        return documentIndex(doc)
+
+    depths = {}
+    for s in matching:
+        depth = depths.get(s.scope, s.depth)
+        depths[s.scope] = -1 if -1 in (depth, s.depth) else max(depth, s.depth)
+    for scope, depth in depths.items():
+        index.syncSubtree(root(scope).uniqueId, depth)
+    return index
+
+def selectionTargets(raws, index=None, expand=0):
+    """
+    Return the `KritaNode` of each selected layer in `raws`, once, in the order they were selected.
+
+    With `expand`, selected groups stand for the layers in them too, down to `expand` levels
+    below them (-1 for all), and the layers are returned in tree order. A layer selected along
+    with a group it's in is still only acted on once.
+
+    Parameters
+    ----------
+    raws: iter(Node)
+    index: NodeIndex
+    The document index, synced for this run. Needed to expand, otherwise its wrappers are
+    reused instead of making new ones.
+    expand: int
+    """
+    selected = {}
+    for raw in raws:
+        selected.setdefault(nodeId(raw), raw)
+    if expand != 0:
+        return index.nodes(expandSelection(index, selected, expand))
+    if index is None:
+        return [ KritaNode(raw, uniqueId=uid) for uid, raw in selected.items() ]
+    return [ index.node(uid) if uid in index else KritaNode(raw, uniqueId=uid) for uid, raw in selected.items() ]
+
+def expandSelection(index, selected, expand=-1):
+    """
+    Return the unique ids, in pre order, of the `selected` layers and of the layers down to
+    `expand` levels below them, in one pass over the index. The plugin settings are left out
+    unless selected themselves.
+    """
+    excluded = pluginSettingsUids(index)
+    depths = index.depths
+    uids = []
+    # (depth of a selected layer, deepest depth included below it) for the selected layers
+    # the pass is inside of, innermost last
+    stack = []
+    for uid in index.order:
+        depth = depths[uid]
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        if uid in selected:
+            limit = depth + expand if expand != -1 else len(index)
+            # A nested selection doesn't cut short the expansion of the group it's in
+            if stack:
+                limit = max(limit, stack[-1][1])
+            stack.append((depth, limit))
+            uids.append(uid)
+        elif stack and depth <= stack[-1][1] and uid not in excluded:
+            uids.append(uid)
+    return uids
+
+def resolveTargets(doc, specs, selection=None):
+    """
+    Find the layers each of `specs` applies to.
+
+    The patterns of all specs are resolved together against the document's tag index, so the
+    layer tree is walked at most once no matter how many actions there are. Plain tags are
+    found in a single pass, expressions are tested against the cached index (see `Pattern`).
+
+    Scoped specs only look at the subtree of their scope, down to their depth. If all specs are
+    scoped, only those subtrees are synced with the document, or walked if it hasn't been
+    indexed yet.
+
+    Specs with an empty pattern act on the selection, see `selectionTargets`. Unless they expand
+    it, the layer tree isn't walked at all.
+
+    Parameters
+    ----------
+    doc: Document
+    specs: list(ActionSpec)
+    selection: callable
+    Returns the selected raw nodes. Only called if a spec has an empty pattern.
+
+    Returns
+    -------
+    out: (NodeIndex, list(list(KritaNode)))
+    The document index (or `None` if it wasn't used) and the target nodes of each spec.
+    """
+    patterns = { s.match: compilePattern(s.match) for s in specs if s.match != "" }
+    index, found = cachedIndex(doc), {}
+
+    # Scoped actions only walk their own subtree, unless the whole document is indexed already
+    useIndex = (index is not None and index.built) or any(s.match != "" and not s.isScoped() for s in specs)
+    expands = any(s.match == "" and s.expand != 0 for s in specs)
+
+    roots = {}
+    def root(scope):
+        if scope not in roots:
+            roots[scope] = scopeRoot(doc, scope)
+        return roots[scope]
+
+    def resolve():
+        literals = { m: t.text for m, t in patterns.items() if isinstance(t, Literal) }
+        tags = index.tags.resolve(literals.values())
+        found = { m: tags[text] for m, text in literals.items() }
+        for m, term in patterns.items():
+            if m not in found:
+                found[m] = findMatches(index, term)
+        excluded = pluginSettingsUids(index)
+        if excluded:
+            found = { m: [uid for uid in uids if uid not in excluded] for m, uids in found.items() }
+        return found
+
+    if (patterns and useIndex) or expands:
+        # Synced with the document, so layers changed by the user since the last run are seen
+        index = syncScopes(doc, index, specs, root)
+        found = resolve()
+    else:
+        index = None
+
+    raws = None
+    selected = {}
+    targets = []
+    for s in specs:
+        if s.match == "":
+            if raws is None:
+                raws = list(selection()) if selection else []
+            if s.expand not in selected:
+                selected[s.expand] = selectionTargets(raws, index, s.expand)
+            nodes = selected[s.expand]
+        elif not s.isScoped():
+            nodes = index.nodes(found[s.match])
+        else:
+            scopeNode = root(s.scope)
+            scope = index.subtree(scopeNode.uniqueId, s.depth) if index is not None else None
+            if scope is not None:
+                nodes = index.nodes([uid for uid in found[s.match] if uid in scope])
+            else:
+                # Not indexed (or missing from the index) - walk just the scope
+                term = patterns[s.match]
+                visited = list(iterPre(scopeNode, s.depth))
+                counters['visited'] += len(visited)
+                nodes = [n for n in visited if term.matches(n) and not isInPluginSettings(n)]
+        # Pattern matches are numbered in reverse tree order
+        if s.match != "" and s.action is BulkAction.SET_NAME:
+            nodes = list(reversed(nodes))
+        targets.append(nodes)
+    return index, targets
+
+
+def compileSpecs(specs):
+    """
+    Compile the rename templates and parse the states of `specs`.
+
+    Returns
+    -------
+    out: (dict(ActionSpec, (Template, Term)), dict(ActionSpec, bool))
+    The template and pattern of each SET_NAME spec and the state of each state spec.
+
+    Raises
+    ------
+    ValueError
+    If a template or state is invalid.
+    """
+    templates = {}
+    states = {}
+    for spec in specs:
+        if spec.action in SWITCHES:
+            states[spec] = parseState(spec.value)
+        elif spec.action is BulkAction.SET_NAME:
+            term = compilePattern(spec.match) if spec.match else None
+            templates[spec] = (compileTemplate(spec.value), term)
+            checkCaptures(*templates[spec])
+    return templates, states
+
+def planActions(doc, specs, selection=None, stats=None):
+    """
+    Resolve the targets of `specs` in `doc` and gather all their writes in one `ChangeSet`,
+    without writing anything. The resolve and plan stages, and what each spec matched, are
+    recorded in `stats` if given.
+
+    Returns
+    -------
+    out: (NodeIndex, ChangeSet, list((KritaNode, str, str)))
+    The document index (or `None`), the planned changes and the planned renames as
+    (node, old name, new name).
+    """
+    if stats is None:
+        stats = RunStats()
+
+    with stats.stage('resolve'):
+        # Invalid templates and states fail here, before anything is looked up or written
+        compiled = compileSpecs(specs)
+        index, targets = resolveTargets(doc, specs, selection)
+
+    with stats.stage('plan'):
+        changes, renames = planChanges(specs, targets, compiled, stats)
+
+    return index, changes, renames
+
+def planChanges(specs, targets, compiled, stats, rendered=None):
+    """
+    Gather the writes of `specs` to their `targets` in one `ChangeSet`.
+
+    Parameters
+    ----------
+    specs: list(ActionSpec)
+    targets: list(list(KritaNode))
+    compiled: tuple
+    The templates and states of the specs, as returned by `compileSpecs`.
+    stats: RunStats
+    rendered: list(list(str))
+    Optionally the new names of the targets of each SET_NAME spec, rendered from the names
+    the targets had before the run (see `Pipeline`). Renames of layers an earlier spec renames
+    too are rendered again from the pending name.
+
+    Returns
+    -------
+    out: (ChangeSet, list((KritaNode, str, str)))
+    """
+    templates, states = compiled
+    changes = ChangeSet()
+    renames = []
+    for i, (spec, nodes) in enumerate(zip(specs, targets)):
+        start, requested = time.perf_counter(), changes.requested
+        attr = TOGGLES.get(spec.action)
+        if attr is not None:
+            changes.toggleAll(nodes, attr)
+        elif spec.action in SWITCHES:
+            changes.setAll(nodes, SWITCHES[spec.action], states[spec])
+        elif spec.action is BulkAction.SET_OPACITY:
+            changes.setAll(nodes, 'opacity', parseOpacity(spec.value))
+        elif spec.action is BulkAction.SET_NAME:
+            names = rendered[i] if rendered is not None else None
+            if names is not None and not any(changes.isPending(n, 'name') for n in nodes):
+                plan = [ (n, changes.get(n, 'name'), new) for n, new in zip(nodes, names) ]
+            else:
+                template, term = templates[spec]
+                plan = renamePlan(template, nodes, lambda n: changes.get(n, 'name'), term)
+            renames.extend(plan)
+            for n, old, new in plan:
+                changes.set(n, 'name', new)
+        stats.addAction(spec, len(nodes), changes.requested - requested, time.perf_counter() - start)
+    return changes, renames
+
+def finishActions(doc, index, changes, stats=None):
+    """
+    Feed the renames of applied `changes` back to the index and refresh what they made dirty.
+    """
+    if stats is None:
+        stats = RunStats()
+
+    if index is None and any(attr == 'name' for n, attr, value in changes.written):
+        index = cachedIndex(doc)
+    if index is not None:
+        for n, attr, value in changes.written:
+            if attr == 'name':
+                index.renamed(n.uniqueId, value)
+
+    with stats.stage('refresh'):
+        stats.refreshed = refreshDirty(doc, changes)
+    stats.finish(changes)
+    return changes
+
+def applyAll(doc, changes):
+    """
+    Apply `changes` as one step. If a write fails, the changes are rolled back and what the
+    rollback touched is refreshed before the error is raised.
+    """
+    try:
+        changes.apply()
+    except Exception:
+        refreshDirty(doc, changes)
+        raise
+
+def runActions(doc, specs, selection=None, confirmRenames=None, stats=None):
+    """
+    Apply `specs` to `doc` with a single pattern resolution and at most one projection refresh.
+    The writes of all specs are gathered in one `ChangeSet`, so repeated and no-op writes
+    never reach the document.
+
+    Parameters
+    ----------
+    doc: Document
+    specs: list(ActionSpec)
+    selection: callable
+    Returns the selected raw nodes, used by specs with an empty pattern.
+    confirmRenames: callable
+    Called with the planned renames as a list of (node, old name, new name). Returning `False`
+    cancels the whole run.
+    stats: RunStats
+    Filled in with the timings and counts of the run.
+
+    Returns
+    -------
+    out: ChangeSet
+    The applied change set, or `None` if the run was cancelled.
+    """
+    if stats is None:
+        stats = RunStats()
+
+    index, changes, renames = planActions(doc, specs, selection, stats)
+
+    if renames and confirmRenames is not None and not confirmRenames(renames):
+        return None
+
+    with stats.stage('apply'):
+        applyAll(doc, changes)
+    return finishActions(doc, index, changes, stats)
+
+
+class ChunkedRun:
+    """
+    Applies planned changes a slice at a time, so a caller on the GUI thread can hand control
+    back to the event loop between slices.
+
+    Each `step` writes one chunk. The chunk size adapts to the measured cost per write so a
+    step takes about `budget` seconds. `cancel` rolls back what was written so far, and so does
+    a step that fails.
+
+    The stages of the run are recorded in `stats`, from planning to the last step.
+    """
+    # Writes in the first chunk, before there is anything to measure
+    FIRST_CHUNK = 32
+
+    def __init__(self, doc, index, changes, budget=0.02, stats=None):
+        self.doc = doc
+        self.index = index
+        self.changes = changes
+        self.budget = budget
+        self.stats = stats if stats is not None else RunStats()
+        self.chunk = self.FIRST_CHUNK
+        self.total = changes.begin()
+        self.seconds = 0.0
+        self.cancelled = False
+        self.finished = False
+
+    @property
+    def done(self):
+        return len(self.changes.written)
+
+    def isFinished(self):
+        # `ChangeSet.finish` empties the pending changes, so `isDone` alone can't tell
+        return self.cancelled or self.finished
+
+    def step(self):
+        """
+        Write the next chunk of changes. Finishes the run after the last one. If a write fails,
+        the run is rolled back before the error is raised.
+
+        Returns
+        -------
+        out: bool
+        Whether the run is finished.
+        """
+        if self.isFinished():
+            return True
+
+        start = time.perf_counter()
+        try:
+            with self.stats.stage('apply'):
+                count = self.changes.applyNext(self.chunk)
+        except Exception:
+            self.cancel()
+            raise
+        elapsed = time.perf_counter() - start
+        self.seconds += elapsed
+
+        if count and elapsed > 0:
+            self.chunk = int(clamp(self.budget * count / elapsed, 1, 100000))
+
+        if self.changes.isDone():
+            self.finished = True
+            self.changes.finish()
+            finishActions(self.doc, self.index, self.changes, self.stats)
+            return True
+        return False
+
+    def finish(self):
+        """
+        Write everything that is left at once.
+        """
+        self.chunk = self.total
+        return self.step()
+
+    def cancel(self):
+        """
+        Roll back the changes written so far and refresh what they touched.
+
+        Returns
+        -------
+        out: int
+        The number of changes rolled back.
+        """
+        if self.isFinished():
+            return 0
+        with self.stats.stage('rollback'):
+            restored = self.changes.rollback()
+        self.cancelled = True
+        with self.stats.stage('refresh'):
+            self.stats.refreshed = refreshDirty(self.doc, self.changes)
+        return len(restored)
+
+def startActions(doc, specs, selection=None, confirmRenames=None, budget=0.02, stats=None):
+    """
+    Plan `specs` like `runActions` but return a `ChunkedRun` to apply them with, or `None` if
+    the renames weren't confirmed.
+    """
+    if stats is None:
+        stats = RunStats()
+
+    index, changes, renames = planActions(doc, specs, selection, stats)
+
+    if renames and confirmRenames is not None and not confirmRenames(renames):
+        return None
+
+    return ChunkedRun(doc, index, changes, budget, stats)
+
+
+def revertActions(doc, transaction):
+    """
+    Revert the run journaled in `transaction` (see `ChangeSet.transaction`) as one change set.
+    Layers removed since the run and attributes changed since the run are left as they are.
+
+    Returns
+    -------
+    out: ChangeSet
+    The applied change set restoring the values from before the run.
+    """
+    index = documentIndex(doc)
+    changes = transaction.revertChanges(index)
+    applyAll(doc, changes)
+    return finishActions(doc, index, changes)
+
+
+def documentName(doc):
+    path = doc.fileName()
+    return os.path.basename(path) if path else 'Untitled'
+
+class RunReport:
+    """
+    The outcome of running actions on one document: the applied `ChangeSet` (`None` if the
+    run was cancelled or failed), the error message if it failed, the time it took and the
+    `RunStats` of the run.
+    """
+
+    def __init__(self, name, changes=None, seconds=0.0, error=None, stats=None):
+        self.name = name
+        self.changes = changes
+        self.seconds = seconds
+        self.error = error
+        self.stats = stats
+
+    def __repr__(self):
+        return 'RunReport({!r}, {})'.format(self.name, self.summary())
+
+    @property
+    def applied(self):
+        return self.changes.applied if self.changes is not None else 0
+
+    @property
+    def skipped(self):
+        return self.changes.skipped if self.changes is not None else 0
+
+    def summary(self):
+        if self.error is not None:
+            return 'failed: {}'.format(self.error)
+        if self.changes is None:
+            return 'cancelled'
+        return '{} changes, {} unchanged in {:.0f} ms'.format(self.applied, self.skipped, self.seconds * 1000)
+
+def runTimed(doc, specs, selection=None, confirmRenames=None, profile=False):
+    """
+    Run `specs` on `doc` like `runActions` and report the outcome instead of raising, so a
+    document missing a scope, or a layer failing to change, doesn't stop a run across many
+    documents. A failed run is rolled back. With `profile` the run is profiled with cProfile,
+    see `RunStats.profileReport`.
+
+    Returns
+    -------
+    out: RunReport
+    """
+    stats = RunStats(profile)
+    start = time.perf_counter()
+    try:
+        changes = runActions(doc, specs, selection, confirmRenames, stats)
+    except Exception as e:
+        return RunReport(documentName(doc), None, time.perf_counter() - start, str(e), stats)
+    return RunReport(documentName(doc), changes, time.perf_counter() - start, stats=stats)
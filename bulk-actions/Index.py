@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+"""
+
+from itertools import repeat
+
+from .KritaNode import KritaNode, nodeId
+from .Stats import counters
+from .Utils.AhoCorasick import Automaton
+
+
+def marks(text):
+    """
+    Return the set of "mark" code points in `text` - everything that is not a letter, digit or
+    white space. Multi code point marks (emoji with variation selectors or zero width joiners)
+    contribute each of their code points.
+    """
+    return { c for c in text if not c.isalnum() and not c.isspace() }
+
+
+class TagIndex:
+    """
+    Inverted index from tags to the nodes of a `NodeIndex` carrying them.
+
+    Every layer name is tokenised into its mark code points once, when it enters the node
+    index. A tag can only occur in names holding all of the tag's marks, so lookups of tags
+    like "@", "⭕" or "👁" only look at the names in the intersection of those postings.
+    Tags without marks are resolved by scanning the cached names, and `resolve` finds many
+    tags in a single pass with an Aho-Corasick automaton.
+    Resolved tags are cached until the node index changes.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.postings = {}
+        self.clear()
+
+    def clear(self):
+        self.cache = {}
+        self.positions = None
+
+    def add(self, uid, name):
+        for c in marks(name):
+            self.postings.setdefault(c, set()).add(uid)
+        self.clear()
+
+    def discard(self, uid, name):
+        for c in marks(name):
+            uids = self.postings.get(c)
+            if uids is not None:
+                uids.discard(uid)
+                if not uids:
+                    del self.postings[c]
+        self.clear()
+
+    def reset(self):
+        self.postings = {}
+        self.clear()
+
+    def frozen(self, index):
+        """
+        Return a copy of this tag index for `index`, a copy of the node index (see
+        `Pipeline.NameTable`) with the same `order` and `names` and a `match` method. The copy
+        doesn't change when this one does, so it can be read from other threads.
+        """
+        tags = TagIndex(index)
+        tags.postings = { c: frozenset(uids) for c, uids in self.postings.items() }
+        tags.cache = dict(self.cache)
+        return tags
+
+    def ordered(self, uids):
+        """
+        Return `uids` sorted in pre order.
+        """
+        if self.positions is None:
+            self.positions = { uid: i for i, uid in enumerate(self.index.order) }
+        return sorted(uids, key=self.positions.__getitem__)
+
+    def _candidates(self, tag):
+        codes = marks(tag)
+        if not codes:
+            return None
+        sets = sorted((self.postings.get(c, set()) for c in codes), key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def lookup(self, tag):
+        """
+        Return the unique ids, in pre order, of all nodes whose name contains `tag`.
+        """
+        uids = self.cache.get(tag)
+        if uids is not None:
+            return uids
+
+        candidates = self._candidates(tag)
+        if candidates is None:
+            uids = self.index.match(tag)
+        elif len(tag) == 1:
+            uids = self.ordered(candidates)
+        else:
+            names = self.index.names
+            uids = self.ordered(uid for uid in candidates if tag in names[uid])
+
+        self.cache[tag] = uids
+        return uids
+
+    def resolve(self, tags):
+        """
+        Resolve many tags at once.
+
+        Tags containing marks are answered from the postings, the remaining tags are all
+        found in one pass over the cached names.
+
+        Returns
+        -------
+        out: dict(str, list(str))
+        Maps each tag to the unique ids, in pre order, of the nodes carrying it.
+        """
+        result = {}
+        pending = []
+        for tag in dict.fromkeys(tags):
+            if tag in self.cache or self._candidates(tag) is not None:
+                result[tag] = self.lookup(tag)
+            else:
+                pending.append(tag)
+
+        if len(pending) == 1:
+            result[pending[0]] = self.lookup(pending[0])
+        elif pending:
+            automaton = Automaton(pending)
+            found = [[] for _ in pending]
+            names = self.index.names
+            for uid in self.index.order:
+                for i in automaton.search(names[uid]):
+                    found[i].append(uid)
+            for tag, uids in zip(pending, found):
+                self.cache[tag] = result[tag] = uids
+
+        return result
+
+
+
+# The parent of the root node
+NO_NODE = KritaNode(None)
+
+
+class IndexedNode(KritaNode):
+    """
+    The `KritaNode` a `NodeIndex` interns for a node. Its parent is looked up in the index
+    instead of being memoised, so it follows the renames and moves the index has seen.
+    """
+    __slots__ = ('index',)
+
+    def __init__(self, index, uid):
+        KritaNode.__init__(self, index.raws[uid], index.names[uid], index.types[uid], uid)
+        self.index = index
+
+    @property
+    def parent(self):
+        parents = self.index.parents
+        uid = self._uniqueId
+        if uid not in parents:
+            # No longer in the index - ask Krita
+            return KritaNode.parent.fget(self)
+        parentId = parents[uid]
+        return self.index.node(parentId) if parentId is not None else NO_NODE
+
+
+class NodeIndex:
+    """
+    Index of every node in a document's layer tree.
+
+    The tree is walked once and the name, type, parent and depth of each node is kept by
+    the node's unique id. Pattern lookups are then answered from the cached names instead
+    of calling `childNodes()` and `name()` through the scripting API for every node.
+
+    Changes made by the plugin itself are fed back through `renamed`, `refreshSubtree` and
+    `removeSubtree` so the index doesn't have to be rebuilt after each action.
+
+    Krita doesn't tell scripts when layers change, so the unique ids of each layer's children
+    are kept as a fingerprint, and `sync` compares them (and the names) with the document
+    before the index is used. Only what changed is re-read. Runs that only look at part of the
+    document use `syncSubtree` instead.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.tags = TagIndex(self)
+        self.clear()
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, uid):
+        return uid in self.raws
+
+    def clear(self):
+        self.built = False
+        # Unique ids in pre order - a subtree is always a contiguous slice
+        self.order = []
+        self.raws = {}
+        self.names = {}
+        self.types = {}
+        self.parents = {}
+        self.depths = {}
+        self.childIds = {}
+        # uid -> the `uniqueId()` objects of the children, compared without converting them to strings
+        self.childKeys = {}
+        self.wrappers = {}
+        self.tags.reset()
+
+    def invalidate(self):
+        self.built = False
+
+    def build(self):
+        self.clear()
+        self.order = self._walk(self.root.raw, None, 0)
+        self.built = True
+        return self
+
+    def _walk(self, raw, parentId, depth):
+        order = []
+        stack = [(raw, nodeId(raw), parentId, depth)]
+        while stack:
+            raw, uid, parentId, depth = stack.pop()
+            order.append(uid)
+            self._add(raw, uid, raw.name(), parentId, depth)
+            self._pushChildren(stack, raw, uid, depth)
+        counters['visited'] += len(order)
+        return order
+
+    def _add(self, raw, uid, name, parentId, depth):
+        self.raws[uid] = raw
+        self.names[uid] = name
+        self.types[uid] = raw.type()
+        self.parents[uid] = parentId
+        self.depths[uid] = depth
+        self.tags.add(uid, name)
+
+    def _readChildren(self, raw, uid):
+        """
+        Read the children of `raw` and return them with their unique ids and their `uniqueId()`
+        objects, or `None` for the ids and objects if they are the ones last seen.
+
+        Masks can't have children, so they aren't asked. Unchanged children cost one `uniqueId()`
+        call each - the ids are only converted to strings when they changed.
+        """
+        if 'mask' in self.types[uid]:
+            return (), (), ()
+        counters['childNodes'] += 1
+        children = raw.childNodes()
+        keys = tuple(c.uniqueId() for c in children)
+        if keys == self.childKeys.get(uid):
+            return children, None, None
+        return children, tuple(k.toString() for k in keys), keys
+
+    def _pushChildren(self, stack, raw, uid, depth):
+        """
+        Push the children of `raw` on a pre order walk `stack` and return whether they differ
+        from the ones last seen.
+        """
+        children, childIds, keys = self._readChildren(raw, uid)
+        changed = childIds is not None and childIds != self.childIds.get(uid)
+        if childIds is None:
+            childIds = self.childIds[uid]
+        else:
+            self.childIds[uid] = childIds
+            self.childKeys[uid] = keys
+        if children:
+            stack.extend(zip(reversed(children), reversed(childIds), repeat(uid), repeat(depth + 1)))
+        return changed
+
+    def _span(self, uid):
+        start = self.order.index(uid)
+        depth = self.depths[uid]
+        end = start + 1
+        while end < len(self.order) and self.depths[self.order[end]] > depth:
+            end += 1
+        return start, end
+
+    def _forget(self, uids):
+        for uid in uids:
+            self.tags.discard(uid, self.names[uid])
+            for table in (self.raws, self.names, self.types, self.parents, self.depths, self.childIds, self.childKeys, self.wrappers):
+                table.pop(uid, None)
+
+    def node(self, uid):
+        """
+        Return the `IndexedNode` for `uid`. Wrappers are created on demand, interned per node
+        and come with the cached name, type and unique id so matching them costs no API calls.
+        """
+        wrapper = self.wrappers.get(uid)
+        if wrapper is None:
+            wrapper = self.wrappers[uid] = IndexedNode(self, uid)
+        return wrapper
+
+    def nodes(self, uids=None):
+        return [self.node(uid) for uid in (self.order if uids is None else uids)]
+
+    def children(self, uid):
+        start, end = self._span(uid)
+        depth = self.depths[uid] + 1
+        return [u for u in self.order[start + 1:end] if self.depths[u] == depth]
+
+    def subtree(self, uid, maxDepth=-1):
+        """
+        Return the set of unique ids in the subtree rooted at `uid`, down to `maxDepth` levels
+        below it, or `None` if `uid` isn't in the index.
+        """
+        if uid not in self.raws:
+            return None
+        start, end = self._span(uid)
+        uids = self.order[start:end]
+        if maxDepth != -1:
+            limit = self.depths[uid] + maxDepth
+            uids = [u for u in uids if self.depths[u] <= limit]
+        return set(uids)
+
+    def match(self, m):
+        """
+        Return the unique ids, in pre order, of all nodes whose name contains `m`.
+        """
+        names = self.names
+        return [uid for uid in self.order if m in names[uid]]
+
+    def find(self, m):
+        return self.nodes(self.match(m))
+
+    def sync(self):
+        """
+        Bring the index up to date with the document.
+
+        The tree is walked comparing each group's child ids and each node's name with the
+        index. Only new layers are fully read, only renamed layers are re-tagged, and the
+        pre order is only rebuilt if layers were added, removed or moved.
+
+        Returns
+        -------
+        out: bool
+        Whether anything changed.
+        """
+        if not self.built:
+            self.build()
+            return True
+
+        order = []
+        changed = False
+        names, parents, depths = self.names, self.parents, self.depths
+        raw = self.root.raw
+        stack = [(raw, nodeId(raw), None, 0)]
+        while stack:
+            raw, uid, parentId, depth = stack.pop()
+            order.append(uid)
+            name = names.get(uid)
+            if name is None:
+                self._add(raw, uid, raw.name(), parentId, depth)
+                changed = True
+            else:
+                if raw.name() != name:
+                    self.renamed(uid, raw.name())
+                    changed = True
+                if parents[uid] != parentId or depths[uid] != depth:
+                    self.parents[uid] = parentId
+                    self.depths[uid] = depth
+                    self._invalidateWrapper(uid)
+                    changed = True
+            if self._pushChildren(stack, raw, uid, depth):
+                self._invalidateWrapper(uid)
+                changed = True
+        counters['visited'] += len(order)
+
+        if changed:
+            self._forget(set(self.raws).difference(order))
+            if order != self.order:
+                self.order = order
+                self.tags.clear()
+        return changed
+
+    def syncSubtree(self, uid, maxDepth=-1):
+        """
+        Bring the subtree rooted at `uid`, down to `maxDepth` levels below it, up to date with the
+        document, leaving the rest of the index as it is. For runs scoped to part of the document.
+
+        Renames are picked up like `sync` does. If the subtree was moved, or layers were added,
+        removed or moved in it, the whole document is synced instead.
+
+        Returns
+        -------
+        out: bool
+        Whether anything changed.
+        """
+        if not self.built or uid not in self.raws or not self._inPlace(uid):
+            return self.sync()
+
+        changed = False
+        names, depths = self.names, self.depths
+        limit = depths[uid] + maxDepth if maxDepth != -1 else None
+        visited = 0
+        stack = [(self.raws[uid], uid)]
+        while stack:
+            raw, uid = stack.pop()
+            visited += 1
+            name = raw.name()
+            if name != names[uid]:
+                self.renamed(uid, name)
+                changed = True
+            if limit is not None and depths[uid] >= limit:
+                continue
+            children, childIds, keys = self._readChildren(raw, uid)
+            if childIds is not None and childIds != self.childIds.get(uid):
+                counters['visited'] += visited
+                self.sync()
+                return True
+            stack.extend(zip(reversed(children), reversed(self.childIds[uid])))
+        counters['visited'] += visited
+        return changed
+
+    def _inPlace(self, uid):
+        """
+        Return whether the layer `uid` is still where the index has it, comparing its ancestors
+        in the document with the ones in the index.
+        """
+        raw = self.raws[uid]
+        parentId = self.parents[uid]
+        while parentId is not None:
+            raw = raw.parentNode()
+            if raw is None or nodeId(raw) != parentId:
+                return False
+            parentId = self.parents[parentId]
+        return True
+
+    def _invalidateWrapper(self, uid):
+        wrapper = self.wrappers.get(uid)
+        if wrapper is not None:
+            wrapper.invalidate()
+
+    def renamed(self, uid, name):
+        if uid in self.names:
+            self.tags.discard(uid, self.names[uid])
+            self.names[uid] = name
+            self.tags.add(uid, name)
+            # Keep the wrapper, the layers below it get it as their parent
+            wrapper = self.wrappers.get(uid)
+            if wrapper is not None:
+                wrapper.invalidate()
+                wrapper._name = name
+
+    def refreshSubtree(self, uid):
+        """
+        Re-read the subtree rooted at `uid` from the document, leaving the rest untouched.
+        """
+        if uid not in self.raws:
+            return self.build()
+        raw, parentId, depth = self.raws[uid], self.parents[uid], self.depths[uid]
+        start, end = self._span(uid)
+        self._forget(self.order[start:end])
+        self.order[start:end] = self._walk(raw, parentId, depth)
+        return self
+
+    def removeSubtree(self, uid):
+        if uid not in self.raws:
+            return self
+        parentId = self.parents[uid]
+        childIds = self.childIds.get(parentId, ())
+        if uid in childIds:
+            i = childIds.index(uid)
+            self.childIds[parentId] = childIds[:i] + childIds[i + 1:]
+            keys = self.childKeys.get(parentId)
+            if keys is not None:
+                self.childKeys[parentId] = keys[:i] + keys[i + 1:]
+        start, end = self._span(uid)
+        self._forget(self.order[start:end])
+        del self.order[start:end]
+        return self
+
+
+_documentIndexes = {}
+
+def documentKey(doc):
+    return nodeId(doc.rootNode())
+
+def documentIndex(doc):
+    """
+    Return the up to date `NodeIndex` of `doc`, building it the first time the document is seen
+    and syncing it with the document after that.
+    """
+    key = documentKey(doc)
+    index = _documentIndexes.get(key)
+    if index is None:
+        index = _documentIndexes[key] = NodeIndex(KritaNode(doc.rootNode()))
+    index.sync()
+    return index
+
+def cachedIndex(doc):
+    """
+    Return the `NodeIndex` of `doc` if one has been built already, otherwise `None`.
+    """
+    return _documentIndexes.get(documentKey(doc))
+
+def forgetDocument(doc):
+    _documentIndexes.pop(documentKey(doc), None)
+
+def pruneDocuments(docs):
+    """
+    Forget the indexes of all documents but `docs`, the open ones.
+    """
+    keep = set(documentKey(doc) for doc in docs)
+    for key in list(_documentIndexes):
+        if key not in keep:
+            del _documentIndexes[key]
@@ -4,26 +4,49 @@ import re
 
 from collections import OrderedDict
 
-from krita import Krita
+from .Stats import counters
 
-KI = Krita.instance()
+def nodeId(node):
+    """
+    Return the unique id of a raw Krita node as a string usable as a dictionary key.
+    """
+    return node.uniqueId().toString()
 
 class KritaNode:
     """
     Wrapper around Krita's Node class, that represents a layer.
     Adapted from https://github.com/GDquest/krita-batch-exporter/blob/0a21f34942794e12ebdab86f74860379169f6f77/krita_batch_exporter/Infrastructure.py#L28
+
+    The name, type, unique id, parent and children are read from Krita once and memoised,
+    so a handle should only live for the duration of one action run (or be kept up to date
+    by `NodeIndex`). Call `invalidate` if the layer changed behind the handle's back.
     """
+    __slots__ = ('node', '_name', '_type', '_uniqueId', '_parent', '_children')
 
-    def __init__(self, node):
+    def __init__(self, node, name=None, type=None, uniqueId=None):
         self.node = node
+        self._name = name
+        self._type = type
+        self._uniqueId = uniqueId
+        self._parent = None
+        self._children = None
 
     def __bool__(self):
         return bool(self.node)
 
+    def invalidate(self):
+        """
+        Forget the memoised name, parent and children. The type and unique id of a node never change.
+        """
+        self._name = None
+        self._parent = None
+        self._children = None
+
     @property
     def name(self):
-        name = self.node.name()
-        return name
+        if self._name is None:
+            self._name = self.node.name()
+        return self._name
 
     @property
     def raw(self):
@@ -31,15 +54,28 @@ class KritaNode:
 
     @property
     def parent(self):
-        return KritaNode(self.node.parentNode())
+        if self._parent is None:
+            self._parent = KritaNode(self.node.parentNode())
+        return self._parent
 
     @property
     def children(self):
-        return [KritaNode(n) for n in self.node.childNodes()]
+        if self._children is None:
+            counters['childNodes'] += 1
+            self._children = [KritaNode(n) for n in self.node.childNodes()]
+        return self._children
 
     @property
     def type(self):
-        return self.node.type()
+        if self._type is None:
+            self._type = self.node.type()
+        return self._type
+
+    @property
+    def uniqueId(self):
+        if self._uniqueId is None:
+            self._uniqueId = nodeId(self.node)
+        return self._uniqueId
 
     @property
     def position(self):
@@ -84,7 +120,7 @@ class KritaNode:
         return self.type == "vectorlayer"
 
     def isTransparencyMask(self):
-        return self.type == "transparencyMask"
+        return self.type == "transparencymask"
 
     def isFilterMask(self):
         return self.type == "filtermask"
@@ -99,8 +135,11 @@ class KritaNode:
         return self.type == "colorizemask"
 
     def match(self, m):
-        name = self.node.name()
-        return m in name
+        return m in self.name
+
+    def setName(self, name):
+        self.node.setName(name)
+        self._name = name
 
     def setVisible(self, visibility):
         self.node.setVisible(visibility)
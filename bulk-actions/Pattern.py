@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Pattern engine for matching layers.
+
+A pattern is a plain tag matched anywhere in the layer name, just like `KritaNode.match`,
+whatever characters it contains - tags like "R&D" or "!hide" saved before expressions existed
+keep their meaning. A pattern is only parsed as an expression if it starts with "=" or with
+one of the prefixed terms:
+
+    re:<regex>      The layer name matches the regular expression (anywhere)
+    glob:<glob>     The whole layer name matches the glob, e.g. glob:Shadow*
+    path:<glob>     The layer path matches the glob, e.g. path:Robot/*/Shadows*
+    type:<type>     The layer type, e.g. type:paint, type:group, type:mask
+    !               Negation, e.g. =!shadow
+    & |             And / or, e.g. =@ & !shadow or =(⭕ | 👁) & type:paint
+    ( )             Grouping
+
+Terms next to each other without an operator are and'ed. Tags containing spaces or operator
+characters can be quoted: ="Shadows @" | "R&D".
+"""
+
+import os
+import re
+
+from fnmatch import translate
+from functools import lru_cache
+
+from .Utils.Tree import pathFS
+
+# Name used in `type:` filters -> `KritaNode` predicate
+TYPE_FILTERS = {
+    'layer': 'isLayer',
+    'mask': 'isMask',
+    'paint': 'isPaintLayer',
+    'group': 'isGroupLayer',
+    'file': 'isFileLayer',
+    'filter': 'isFilterLayer',
+    'fill': 'isFillLayer',
+    'clone': 'isCloneLayer',
+    'vector': 'isVectorLayer',
+    'transparency': 'isTransparencyMask',
+    'filtermask': 'isFilterMask',
+    'transform': 'isTransformMask',
+    'selection': 'isSelectionMask',
+    'colorize': 'isColorizeMask',
+}
+
+OPERATORS = ('&', '|', '(', ')')
+
+# Start of a pattern that is an expression without starting with a prefixed term
+EXPRESSION = '='
+
+
+class Term:
+    """
+    Base class of compiled patterns. `cost` is a rough measure of how expensive `matches` is,
+    used to evaluate cheap predicates first. `groups` is the number of regular expression
+    groups `captures` can return.
+    """
+    cost = 0
+    groups = 0
+
+    def matches(self, node):
+        raise NotImplementedError()
+
+    def captures(self, node):
+        """
+        Return the text matched in the name of `node` followed by the regular expression
+        groups, or `None` if this term doesn't capture anything.
+        """
+        return None
+
+    def candidates(self, tags):
+        """
+        Return the unique ids of the nodes that can possibly match, as found by the `TagIndex`
+        `tags`, or `None` if every node has to be tested.
+        """
+        return None
+
+class Type(Term):
+    cost = 0
+
+    def __init__(self, name):
+        predicate = TYPE_FILTERS.get(name)
+        if predicate is not None:
+            self.matches = lambda n: getattr(n, predicate)()
+        else:
+            self.matches = lambda n: n.type == name
+
+class Literal(Term):
+    cost = 1
+
+    def __init__(self, text):
+        self.text = text
+
+    def matches(self, node):
+        return self.text in node.name
+
+    def captures(self, node):
+        return (self.text,) if self.text in node.name else None
+
+    def candidates(self, tags):
+        return set(tags.lookup(self.text))
+
+class Regex(Term):
+    cost = 3
+
+    def __init__(self, regex):
+        try:
+            self.regex = re.compile(regex)
+        except re.error as e:
+            raise ValueError('Invalid regular expression {!r}: {}'.format(regex, e))
+        self.groups = self.regex.groups
+
+    def matches(self, node):
+        return self.regex.search(node.name) is not None
+
+    def captures(self, node):
+        m = self.regex.search(node.name)
+        if m is None:
+            return None
+        return (m.group(0),) + tuple(g or '' for g in m.groups())
+
+class Glob(Regex):
+    cost = 2
+
+    def __init__(self, glob):
+        Regex.__init__(self, translate(glob))
+        # Any groups are fnmatch's own
+        self.groups = 0
+
+    def matches(self, node):
+        # The whole name - the translated pattern is anchored at the end only
+        return self.regex.match(node.name) is not None
+
+    def captures(self, node):
+        return (node.name,) if self.matches(node) else None
+
+class Path(Glob):
+    cost = 4
+
+    def matches(self, node):
+        path = pathFS(node).replace(os.sep, '/')
+        return self.regex.match(path) is not None
+
+    def captures(self, node):
+        return None
+
+class Not(Term):
+
+    def __init__(self, term):
+        self.term = term
+        self.cost = term.cost
+
+    def matches(self, node):
+        return not self.term.matches(node)
+
+class And(Term):
+
+    def __init__(self, terms):
+        # Cheapest first, so the expensive predicates only run on nodes that passed the rest
+        self.terms = sorted(terms, key=lambda t: t.cost)
+        self.cost = sum(t.cost for t in self.terms)
+        # Captures come from the term with the most groups, the leftmost one on ties
+        self.capturing = max(terms, key=lambda t: t.groups)
+        self.groups = self.capturing.groups
+
+    def matches(self, node):
+        return all(t.matches(node) for t in self.terms)
+
+    def captures(self, node):
+        return self.capturing.captures(node)
+
+    def candidates(self, tags):
+        sets = [c for c in (t.candidates(tags) for t in self.terms) if c is not None]
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+class Or(And):
+
+    def matches(self, node):
+        return any(t.matches(node) for t in self.terms)
+
+    def candidates(self, tags):
+        sets = [t.candidates(tags) for t in self.terms]
+        if any(c is None for c in sets):
+            return None
+        return set().union(*sets)
+
+
+PREFIXES = {
+    're:': Regex,
+    'glob:': Glob,
+    'path:': Path,
+    'type:': Type,
+}
+
+def tokenize(text):
+    r"""
+    Split pattern text into operators, quoted strings (returned as 1-tuples) and terms.
+
+    Parentheses inside a prefixed term, and operators between them, belong to the term as
+    long as they are balanced, so re:^(\d+) and re:(a|b) keep their groups. A prefixed term
+    can also be quoted as a whole: re:"a b".
+    """
+    tokens = []
+    term = ''
+    depth = 0
+    i = 0
+    while i < len(text):
+        c = text[i]
+        prefixed = any(term.startswith(p) for p in PREFIXES)
+        if c == '"':
+            end = text.find('"', i + 1)
+            if end == -1:
+                term += c
+                i += 1
+                continue
+            if term in PREFIXES:
+                tokens.append(term + text[i + 1:end])
+            else:
+                if term:
+                    tokens.append(term)
+                tokens.append((text[i + 1:end],))
+            term = ''
+            depth = 0
+            i = end
+        elif prefixed and c == '(':
+            depth += 1
+            term += c
+        elif prefixed and c == ')' and depth > 0:
+            depth -= 1
+            term += c
+        elif prefixed and c in ('&', '|') and depth > 0:
+            term += c
+        elif c.isspace() or c in OPERATORS or (c == '!' and not term):
+            if term:
+                tokens.append(term)
+                term = ''
+                depth = 0
+            if not c.isspace():
+                tokens.append(c)
+        else:
+            term += c
+        i += 1
+    if term:
+        tokens.append(term)
+    return tokens
+
+def isExpression(text):
+    """
+    Return whether pattern text is an expression rather than a plain tag. Expressions have to
+    say so up front, so any plain tag saved in a document keeps matching the same layers.
+    """
+    return text.startswith(EXPRESSION) or any(text.startswith(p) for p in PREFIXES)
+
+def parseTerm(token):
+    if isinstance(token, tuple):
+        return Literal(token[0])
+    for prefix, term in PREFIXES.items():
+        if token.startswith(prefix):
+            return term(token[len(prefix):])
+    return Literal(token)
+
+def parse(tokens, text):
+    pos = 0
+
+    def error(msg):
+        return ValueError('{} in pattern {!r}'.format(msg, text))
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def orExpr():
+        nonlocal pos
+        terms = [andExpr()]
+        while peek() == '|':
+            pos += 1
+            terms.append(andExpr())
+        return terms[0] if len(terms) == 1 else Or(terms)
+
+    def andExpr():
+        nonlocal pos
+        terms = [unary()]
+        while peek() is not None and peek() not in ('|', ')'):
+            if peek() == '&':
+                pos += 1
+            terms.append(unary())
+        return terms[0] if len(terms) == 1 else And(terms)
+
+    def unary():
+        nonlocal pos
+        token = peek()
+        pos += 1
+        if token is None:
+            raise error('Unexpected end')
+        if token == '!':
+            return Not(unary())
+        if token == '(':
+            term = orExpr()
+            if peek() != ')':
+                raise error('Missing )')
+            pos += 1
+            return term
+        if token in OPERATORS:
+            raise error('Unexpected {!r}'.format(token))
+        return parseTerm(token)
+
+    term = orExpr()
+    if pos != len(tokens):
+        raise error('Unexpected {!r}'.format(tokens[pos]))
+    return term
+
+@lru_cache(maxsize=256)
+def compilePattern(text):
+    """
+    Compile pattern text into a `Term`. Compiled patterns are cached by their text.
+
+    Raises
+    ------
+    ValueError
+    If the pattern is an invalid expression.
+    """
+    if not isExpression(text):
+        return Literal(text)
+    if text.startswith(EXPRESSION):
+        return parse(tokenize(text[len(EXPRESSION):]), text)
+    return parse(tokenize(text), text)
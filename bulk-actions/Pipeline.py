@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Planning a run off the GUI thread.
+
+Once the layer names are read, matching patterns and rendering rename templates is string work
+that doesn't need Krita. A pipelined run is planned in three steps:
+
+1. On the main thread, `startPlanning` syncs the document index - the only pass over the
+   layer tree, or over the scopes if every action is scoped - and copies the names, types and
+   parents into a `NameTable`. Scopes and the selection are resolved to unique ids.
+2. In a `concurrent.futures` executor, `precomputeSpec` looks up the candidates of the pattern
+   of each spec in a frozen copy of the tag index, matches them against the table and renders
+   their new names, one task per spec.
+3. Back on the main thread, `PlanJob.result` turns the matched ids into the run's `ChangeSet`.
+   Only here are attribute values read from Krita, and the writes happen later as usual. If
+   the event loop ran in between, the user may have renamed or removed layers: the names of
+   the layers the plan touches are read again and if any changed the run is planned again
+   the usual way.
+
+Threads keep the GUI responsive while a big plan is computed. Processes compute several
+specs in parallel, but only outside Krita - inside Krita `sys.executable` is Krita itself -
+e.g. from the scripts in `sbin`.
+"""
+
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .Engine import (
+    BulkAction,
+    ChunkedRun,
+    checkCaptures,
+    compileSpecs,
+    iterRenames,
+    pluginSettingsUids,
+    planActions,
+    planChanges,
+    scopeRoot,
+    selectionTargets,
+    syncScopes,
+)
+from .Index import NO_NODE, cachedIndex, documentIndex
+from .KritaNode import KritaNode, nodeId
+from .Pattern import compilePattern
+from .Stats import RunStats, counters
+from .Template import compileTemplate
+
+
+class NameTable:
+    """
+    Copy of the names, types, parents, depths and tags of a `NodeIndex`, in pre `order`, that
+    workers can read while the index changes, or that can be sent to another process.
+    """
+
+    def __init__(self, index):
+        self.order = list(index.order)
+        self.names = dict(index.names)
+        self.types = dict(index.types)
+        self.parents = dict(index.parents)
+        self.depths = dict(index.depths)
+        self.tags = index.tags.frozen(self)
+        self._excluded = None
+
+    @property
+    def excluded(self):
+        # Layers patterns never act on, see `Engine.PLUGIN_SETTINGS`. Looked up by the first
+        # worker that needs them - workers computing them at the same time get the same set.
+        if self._excluded is None:
+            self._excluded = pluginSettingsUids(self)
+        return self._excluded
+
+    def match(self, m):
+        """
+        Return the unique ids, in pre order, of all layers whose name contains `m`, like
+        `NodeIndex.match`.
+        """
+        names = self.names
+        return [ uid for uid in self.order if m in names[uid] ]
+
+    def node(self, uid):
+        # Not cached - the nodes point at the table, a cache would make reference cycles of
+        # every layer for the garbage collector to walk
+        return TableNode(self, uid)
+
+    def nodes(self, uids):
+        node = self.node
+        return [ node(uid) for uid in uids ]
+
+    def subtree(self, uid, maxDepth=-1):
+        """
+        Return the unique ids, in pre order, of the subtree rooted at `uid` down to `maxDepth`
+        levels below it.
+        """
+        start = self.order.index(uid)
+        depths = self.depths
+        depth = depths[uid]
+        limit = depth + maxDepth if maxDepth != -1 else None
+        uids = [ uid ]
+        for u in self.order[start + 1:]:
+            d = depths[u]
+            if d <= depth:
+                break
+            if limit is None or d <= limit:
+                uids.append(u)
+        return uids
+
+class TableNode(KritaNode):
+    """
+    A layer of a `NameTable`. It has the name, type, parent and type predicates of `KritaNode`
+    for patterns and templates to use, all answered from the table without calling Krita.
+    """
+    __slots__ = ('table',)
+
+    def __init__(self, table, uid):
+        KritaNode.__init__(self, None, table.names[uid], table.types[uid], uid)
+        self.table = table
+
+    def invalidate(self):
+        # The table doesn't change
+        pass
+
+    def __bool__(self):
+        return True
+
+    @property
+    def parent(self):
+        if self._parent is None:
+            parentId = self.table.parents[self._uniqueId]
+            self._parent = self.table.node(parentId) if parentId is not None else NO_NODE
+        return self._parent
+
+    @property
+    def children(self):
+        raise NotImplementedError('Table nodes only know their parent')
+
+
+def precomputeSpec(table, spec, target):
+    """
+    Match and render one spec against a `NameTable`. Runs in a worker, so it must not touch
+    Krita. Only the layers the tag index can't rule out are matched.
+
+    Parameters
+    ----------
+    table: NameTable
+    spec: ActionSpec
+    target: list(str) or (str, int) or None
+    The unique ids of the selected layers for a spec without a pattern, the unique id of the
+    scope root and the depth for a scoped spec, `None` for the whole document.
+
+    Returns
+    -------
+    out: (list(str), list(str))
+    The unique ids of the target layers and, for SET_NAME specs, their new names.
+    """
+    if spec.match == '':
+        uids, term = target, None
+    else:
+        term = compilePattern(spec.match)
+        candidates = term.candidates(table.tags)
+        if candidates is not None:
+            candidates = table.tags.ordered(candidates)
+        if target is None:
+            uids = table.order if candidates is None else candidates
+        elif candidates is None:
+            uids = table.subtree(*target)
+        else:
+            scope = set(table.subtree(*target))
+            uids = [ uid for uid in candidates if uid in scope ]
+        excluded = table.excluded
+        node = table.node
+        uids = [ uid for uid in uids if uid not in excluded and term.matches(node(uid)) ]
+        # Pattern matches are numbered in reverse tree order, see `Engine.resolveTargets`
+        if spec.action is BulkAction.SET_NAME:
+            uids.reverse()
+
+    rendered = None
+    if spec.action is BulkAction.SET_NAME:
+        # The nodes are made and dropped one at a time, so the garbage collector has less to track
+        template = compileTemplate(spec.value)
+        checkCaptures(template, term)
+        nodes = (TableNode(table, uid) for uid in uids)
+        rendered = [ new for n, old, new in iterRenames(template, nodes, len(uids), None, term) ]
+    return uids, rendered
+
+
+class PlanJob:
+    """
+    A plan being computed by `startPlanning`. Poll `isDone`, then take the plan with `result`
+    on the main thread.
+    """
+
+    def __init__(self, doc, specs, selection, index, table, compiled, futures, stats):
+        self.doc = doc
+        self.specs = specs
+        self.selection = selection
+        self.index = index
+        self.table = table
+        self.compiled = compiled
+        self.futures = futures
+        self.stats = stats
+        self.started = time.perf_counter()
+
+    def isDone(self):
+        return all(f.done() for f in self.futures)
+
+    def wait(self, timeout=None):
+        """
+        Block until the workers are done or `timeout` seconds passed. Return whether they're done.
+        """
+        wait(self.futures, timeout)
+        return self.isDone()
+
+    def cancel(self):
+        for f in self.futures:
+            f.cancel()
+
+    def isStale(self, results):
+        """
+        Return whether a layer the plan touches was renamed, or is gone from the index, since
+        `startPlanning`. Costs one `name()` call per target layer.
+        """
+        names, raws = self.table.names, self.index.raws
+        touched = set()
+        for uids, rendered in results:
+            touched.update(uids)
+        counters['visited'] += len(touched)
+        for uid in touched:
+            raw = raws.get(uid)
+            if raw is None or raw.name() != names[uid]:
+                return True
+        return False
+
+    def result(self, resync=True):
+        """
+        Wait for the workers and plan the run's changes from what they found. Pass `resync=False`
+        if the layers can't have changed since `startPlanning`, i.e. no events were processed.
+        Otherwise the layers the plan touches are checked, see `isStale`.
+
+        Returns
+        -------
+        out: (NodeIndex, ChangeSet, list((KritaNode, str, str)))
+        Like `Engine.planActions`.
+        """
+        results = [ f.result() for f in self.futures ]
+        self.stats.seconds['precompute'] = time.perf_counter() - self.started
+
+        index = self.index
+        if resync:
+            with self.stats.stage('resolve'):
+                stale = self.isStale(results)
+            if stale:
+                # The workers matched names that are gone
+                return planActions(self.doc, self.specs, self.selection, self.stats)
+
+        with self.stats.stage('plan'):
+            targets = [ index.nodes(uids) for uids, rendered in results ]
+            changes, renames = planChanges(self.specs, targets, self.compiled, self.stats, [ r for uids, r in results ])
+        return index, changes, renames
+
+
+_executor = None
+
+def defaultExecutor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='bulk-actions')
+    return _executor
+
+def startPlanning(doc, specs, selection=None, executor=None, stats=None):
+    """
+    Read what `specs` need from `doc` and hand the matching and rendering to `executor`, a
+    shared thread pool by default.
+
+    Returns
+    -------
+    out: PlanJob
+
+    Raises
+    ------
+    ValueError
+    If a template, state or scope is invalid.
+    """
+    if stats is None:
+        stats = RunStats()
+    if executor is None:
+        executor = defaultExecutor()
+
+    roots = {}
+    def root(scope):
+        if scope not in roots:
+            roots[scope] = scopeRoot(doc, scope)
+        return roots[scope]
+
+    with stats.stage('resolve'):
+        compiled = compileSpecs(specs)
+        raws = list(selection()) if selection and any(s.match == '' for s in specs) else []
+        index = syncScopes(doc, cachedIndex(doc), specs, root)
+        if any(nodeId(raw) not in index for raw in raws):
+            # A layer added outside of the synced scopes - the workers and the plan only know
+            # indexed layers
+            index = documentIndex(doc)
+        table = NameTable(index)
+
+        selected = {}
+        targets = []
+        for spec in specs:
+            if spec.match == '':
+                if spec.expand not in selected:
+                    # Selected layers that aren't in the document any more are left out
+                    nodes = selectionTargets(raws, index, spec.expand)
+                    selected[spec.expand] = [ n.uniqueId for n in nodes if n.uniqueId in index ]
+                targets.append(selected[spec.expand])
+            elif spec.isScoped():
+                targets.append((root(spec.scope).uniqueId, spec.depth))
+            else:
+                targets.append(None)
+
+    futures = [ executor.submit(precomputeSpec, table, spec, target) for spec, target in zip(specs, targets) ]
+    return PlanJob(doc, specs, selection, index, table, compiled, futures, stats)
+
+def finishPlanning(job, confirmRenames=None, budget=0.02, resync=True):
+    """
+    Take the plan of a finished `job` and return a `ChunkedRun` to apply it with, or `None`
+    if the renames weren't confirmed. See `PlanJob.result` for `resync`.
+    """
+    index, changes, renames = job.result(resync)
+
+    if renames and confirmRenames is not None and not confirmRenames(renames):
+        return None
+
+    return ChunkedRun(job.doc, index, changes, budget, job.stats)
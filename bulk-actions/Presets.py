@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+State presets: named lists of actions, like "lineart pass" or "final render", that put the
+layers matching each pattern in an absolute state - visible, locked, at 50% opacity...
+
+A preset is applied like any other run. Its writes are merged in one `ChangeSet`, which only
+calls the setters of attributes that differ from the target, so switching from one preset to
+another only writes to the layers the two presets disagree on.
+"""
+
+from .Engine import ActionSpec, BulkActionType
+
+
+class StatePreset:
+    """
+    A named list of `ActionSpec`. Presets are usually made of SET actions, toggles are allowed
+    but make applying the preset twice undo it.
+    """
+
+    def __init__(self, name, specs=()):
+        self.name = name
+        self.specs = list(specs)
+
+    def __repr__(self):
+        return 'StatePreset({!r}, {})'.format(self.name, self.specs)
+
+    @classmethod
+    def fromSettings(cls, settings):
+        """
+        Create a preset from its saved settings, see `settings`.
+        """
+        specs = [ ActionSpec.fromSettings(BulkActionType(a['type']), a['settings']) for a in settings['actions'] ]
+        return cls(settings['name'], specs)
+
+    def settings(self):
+        return {
+            'name': self.name,
+            'actions': [ { 'type': spec.type.value, 'settings': spec.settings() } for spec in self.specs ],
+        }
+
+
+def presetSettings(presets):
+    return [ p.settings() for p in presets ]
+
+def statePresets(settings):
+    """
+    Return the state presets of decoded settings. Settings saved before presets existed have none.
+    """
+    return [ StatePreset.fromSettings(p) for p in settings.get('presets', []) ]
+
+def replacePreset(presets, preset):
+    """
+    Return `presets` with `preset` added, or replacing the preset of the same name.
+    """
+    replaced = [ preset if p.name == preset.name else p for p in presets ]
+    if not any(p.name == preset.name for p in presets):
+        replaced.append(preset)
+    return replaced
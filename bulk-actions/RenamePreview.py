@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Table model over a rename plan, for the confirmation dialog.
+
+The plan is computed once by the engine and applied as is when the user confirms. The model
+only reads the rows the view asks for, so the dialog opens as fast for 5000 renames as for 5.
+"""
+
+from PyQt5.QtCore import (
+    Qt,
+    QAbstractTableModel,
+    QModelIndex,
+)
+
+from PyQt5.QtGui import (
+    QBrush,
+    QPalette,
+)
+
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QHeaderView,
+    QTableView,
+)
+
+
+class RenamePreviewModel(QAbstractTableModel):
+    """
+    Rows of (node, old name, new name), as returned by `Engine.renamePlan`.
+    """
+    headers = ('Name', 'New name')
+
+    def __init__(self, renames, parent=None):
+        QAbstractTableModel.__init__(self, parent)
+        self.renames = renames
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.renames)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return section + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        n, old, new = self.renames[index.row()]
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return new if index.column() == 1 else old
+        if role == Qt.ForegroundRole and old == new:
+            # Layers that keep their name aren't written
+            return QBrush(QPalette().color(QPalette.Disabled, QPalette.Text))
+        return None
+
+    def changedCount(self):
+        return sum(1 for n, old, new in self.renames if old != new)
+
+def renamePreviewView(renames):
+    view = QTableView()
+    view.setModel(RenamePreviewModel(renames, view))
+    view.setSelectionMode(QAbstractItemView.NoSelection)
+    view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+    view.setWordWrap(False)
+    # Fixed row heights and stretched columns, so nothing has to measure all the rows
+    view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+    return view
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Krita's scripting API don't allow for any user/script data to be stored within the document,
+so the plugin stores its settings in layer names inside a hidden "Plugin Settings" group layer:
+
+    Plugin Settings
+      +-- Bulk Actions
+            +-- BA2 0/2 <zlib compressed, base85 encoded JSON>
+            +-- BA2 1/2 <...>
+
+Since version 2.0 the payload is split in chunks of `CHUNK_SIZE` characters, one layer each,
+numbered so the order of the layers doesn't matter. Versions 1.0 and 1.1 stored base64
+encoded JSON in a single layer; they are still read, and replaced on the next save.
+
+Layer state snapshots (see `Snapshot`) are stored the same way in a group of their own, so
+saving the actions doesn't rewrite them:
+
+    Plugin Settings
+      +-- Bulk Actions Snapshots
+            +-- BAS 0/5 <...>
+"""
+
+import json
+import zlib
+import base64
+
+from .KritaNode import KritaNode
+from .Index import documentKey
+from .Engine import ActionSpec, BulkActionType
+from .Utils.Tree import iterPre
+
+SETTINGS_VERSION = 2.0
+
+# Prefix of the layers holding version 2.0 data
+CHUNK_PREFIX = 'BA2'
+# Characters of payload per layer - long layer names are slow to set and display
+CHUNK_SIZE = 4096
+
+SNAPSHOTS_LAYER = 'Bulk Actions Snapshots'
+SNAPSHOTS_PREFIX = 'BAS'
+
+
+def isPluginSettingsLayer(n):
+    return n.isGroupLayer() and n.name == 'Plugin Settings'
+
+def isSettingsLayer(n):
+    # Names are the cheapest check, the parent is only looked at for "Bulk Actions" layers
+    return n.name == 'Bulk Actions' and bool(n.parent) and isPluginSettingsLayer(n.parent)
+
+
+def encodeSettings(actions, presets=()):
+    """
+    Encode a list of (BulkActionType, settings dict), and the settings of the state presets
+    (see `Presets`), for storage in layer names.
+
+    Returns
+    -------
+    out: list(str)
+    The names of the data layers, in order.
+    """
+    bulkActions = [ { 'settings': settings, 'type': BulkActionType(t).value } for t, settings in actions ]
+    settings = { 'version': SETTINGS_VERSION, 'actions':bulkActions }
+    if presets:
+        settings['presets'] = list(presets)
+    return encodeChunks(settings, CHUNK_PREFIX)
+
+def encodeChunks(data, prefix):
+    """
+    Encode JSON compatible `data` as the names of numbered data layers starting with `prefix`.
+    """
+    data = json.dumps(data, separators=(',', ':'))
+    encoded = base64.b85encode(zlib.compress(data.encode('utf-8'), 9)).decode('ascii')
+    chunks = [ encoded[i:i + CHUNK_SIZE] for i in range(0, len(encoded), CHUNK_SIZE) ]
+    return [ '{} {}/{} {}'.format(prefix, i, len(chunks), chunk) for i, chunk in enumerate(chunks) ]
+
+def isChunk(name, prefix=CHUNK_PREFIX):
+    return name.startswith(prefix + ' ')
+
+def decodeLegacySettings(encoded):
+    decoded = base64.b64decode(encoded).decode('utf-8')
+    return json.loads(decoded)
+
+def decodeSettings(names):
+    """
+    Decode the names of the data layers, written by any settings version.
+
+    Raises
+    ------
+    ValueError
+    If the data is incomplete or corrupt.
+    """
+    if names and not isChunk(names[0]):
+        # Version 1.0 and 1.1 data is a single layer
+        return decodeLegacySettings(names[0])
+    return decodeChunks(names, CHUNK_PREFIX)
+
+def decodeChunks(names, prefix):
+    """
+    Decode the names of data layers written by `encodeChunks`.
+
+    Raises
+    ------
+    ValueError
+    If the data is incomplete or corrupt.
+    """
+    chunks = {}
+    count = 0
+    for name in names:
+        if not isChunk(name, prefix):
+            raise ValueError('Bulk Actions settings are corrupt: unexpected layer {!r}'.format(name[:40]))
+        header, _, chunk = name[len(prefix) + 1:].partition(' ')
+        i, _, n = header.partition('/')
+        chunks[int(i)] = chunk
+        count = int(n)
+
+    if count == 0 or sorted(chunks) != list(range(count)):
+        raise ValueError('Bulk Actions settings are incomplete')
+
+    try:
+        data = zlib.decompress(base64.b85decode(''.join(chunks[i] for i in range(count))))
+    except zlib.error as e:
+        raise ValueError('Bulk Actions settings are corrupt: {}'.format(e))
+    return json.loads(data.decode('utf-8'))
+
+def actionSettings(settings):
+    """
+    Return the actions of decoded `settings` as a list of (BulkActionType, settings dict),
+    whatever the settings version.
+    """
+    if settings['version'] == 1.0:
+        return [ (BulkActionType.BOOL, s) for s in settings['actions'] ]
+    if settings['version'] in (1.1, 2.0):
+        return [ (BulkActionType(s['type']), s['settings']) for s in settings['actions'] ]
+    return []
+
+def actionSpecs(settings):
+    return [ ActionSpec.fromSettings(t, s) for t, s in actionSettings(settings) ]
+
+
+# Document key -> the raw "Bulk Actions" node of the document
+_settingsLayers = {}
+
+def pruneSettingsLayers(docs):
+    """
+    Forget the settings layers of all documents but `docs`, the open ones.
+    """
+    keep = set(documentKey(doc) for doc in docs)
+    for key in list(_settingsLayers):
+        if key not in keep:
+            del _settingsLayers[key]
+
+def forgetSettingsLayer(doc):
+    """
+    Forget the settings layer of `doc`, e.g. once it's closed.
+    """
+    _settingsLayers.pop(documentKey(doc), None)
+
+def isAttached(n):
+    # A layer removed from the document has no parent - check the whole settings branch
+    return bool(n.parent) and bool(n.parent.parent)
+
+def findPluginSettingsLayer(doc):
+    """
+    Find the "Plugin Settings" group among the children of the root of `doc`, where the plugin
+    inserts it. Only the root's children are looked at, so this stays cheap when switching
+    between documents.
+    """
+    root = KritaNode(doc.rootNode())
+    return next(filter(isPluginSettingsLayer, root.children), None)
+
+def findSettingsLayer(doc):
+    """
+    Find the "Bulk Actions" settings layer of `doc`.
+
+    The layer found last time is remembered by document and reused as long as it's still in
+    place. Otherwise the children of a "Plugin Settings" group at the root are checked, and
+    only if there are none, or the user moved the group somewhere else, is the whole tree walked.
+    """
+    key = documentKey(doc)
+    raw = _settingsLayers.get(key)
+    if raw is not None:
+        n = KritaNode(raw)
+        if isSettingsLayer(n) and isAttached(n):
+            return n
+
+    settingsLayer = None
+    pluginSettingsLayer = findPluginSettingsLayer(doc)
+    if pluginSettingsLayer is not None:
+        settingsLayer = next(filter(isSettingsLayer, pluginSettingsLayer.children), None)
+    if settingsLayer is None:
+        it = iterPre(KritaNode(doc.rootNode()))
+        it = filter(isSettingsLayer, it)
+        settingsLayer = next(it, None)
+
+    if settingsLayer is None:
+        _settingsLayers.pop(key, None)
+    else:
+        _settingsLayers[key] = settingsLayer.raw
+    return settingsLayer
+
+def hasSettings(doc):
+    settingsLayer = findSettingsLayer(doc)
+    return settingsLayer is not None and len(settingsLayer.children) > 0
+
+def loadSettings(doc):
+    """
+    Read and decode the settings stored in `doc`, or return `None` if there are none.
+
+    Raises
+    ------
+    ValueError
+    If the stored settings can't be decoded.
+    """
+    settingsLayer = findSettingsLayer(doc)
+    if settingsLayer is None:
+        return None
+
+    names = [ n.name for n in settingsLayer.children ]
+    if len(names) == 0:
+        return None
+
+    return decodeSettings(names)
+
+def saveSettings(doc, actions, presets=()):
+    """
+    Encode `actions`, a list of (BulkActionType, settings dict), and the settings of the state
+    `presets` and store them in `doc`.
+    The settings layers are created as needed, and only data layers whose content changed
+    are written.
+
+    Returns
+    -------
+    out: bool
+    Whether anything was written.
+    """
+    names = encodeSettings(actions, presets)
+
+    settingsLayer = findSettingsLayer(doc)
+    if settingsLayer is None:
+        settingsLayer = createSettingsGroup(doc, 'Bulk Actions')
+        _settingsLayers[documentKey(doc)] = settingsLayer.raw
+
+    return writeDataLayers(doc, settingsLayer, names)
+
+def createSettingsGroup(doc, name):
+    """
+    Create a hidden, locked group `name` in the "Plugin Settings" group, creating that too if needed.
+    """
+    pluginSettingsLayer = findPluginSettingsLayer(doc)
+    if pluginSettingsLayer is None:
+        root = doc.rootNode()
+        children = root.childNodes()
+        gl = doc.createGroupLayer('Plugin Settings')
+        gl.setVisible(False)
+        gl.setCollapsed(True)
+        gl.setLocked(True)
+        root.addChildNode(gl, children[0] if children else None)
+        # A fresh handle - wrappers of the root memoised its children before the group was added
+        pluginSettingsLayer = KritaNode(gl)
+
+    gl = doc.createGroupLayer(name)
+    gl.setVisible(False)
+    gl.setCollapsed(True)
+    gl.setLocked(True)
+    pluginSettingsLayer.raw.addChildNode(gl, None)
+    pluginSettingsLayer.invalidate()
+    return KritaNode(gl)
+
+def writeDataLayers(doc, settingsLayer, names):
+    """
+    Make the children of `settingsLayer` the data layers `names`, writing only what changed.
+
+    Returns
+    -------
+    out: bool
+    Whether anything was written.
+    """
+    # Keep the data layers that already hold a chunk and reuse the rest for the new chunks.
+    # Chunks are numbered, so the order the layers end up in doesn't matter.
+    dataLayers = settingsLayer.children
+    existing = set(n.name for n in dataLayers)
+    wanted = set(names)
+    stale = [ n for n in dataLayers if n.name not in wanted ]
+    missing = [ name for name in names if name not in existing ]
+    written = bool(stale or missing)
+
+    for dataLayer, name in zip(stale, missing):
+        dataLayer.setLocked(False)
+        dataLayer.setName(name)
+        dataLayer.setLocked(True)
+
+    for name in missing[len(stale):]:
+        gl = doc.createGroupLayer(name)
+        gl.setVisible(False)
+        gl.setLocked(True)
+        settingsLayer.raw.addChildNode(gl, None)
+
+    for dataLayer in stale[len(missing):]:
+        settingsLayer.raw.removeChildNode(dataLayer.raw)
+
+    if written:
+        settingsLayer.invalidate()
+    return written
+
+
+def findSnapshotsLayer(doc):
+    pluginSettingsLayer = findPluginSettingsLayer(doc)
+    if pluginSettingsLayer is None:
+        return None
+    return next((n for n in pluginSettingsLayer.children if n.isGroupLayer() and n.name == SNAPSHOTS_LAYER), None)
+
+def loadSnapshots(doc):
+    """
+    Read and decode the snapshots data stored in `doc`, or return `None` if there is none.
+
+    Raises
+    ------
+    ValueError
+    If the stored data can't be decoded.
+    """
+    snapshotsLayer = findSnapshotsLayer(doc)
+    if snapshotsLayer is None:
+        return None
+
+    names = [ n.name for n in snapshotsLayer.children ]
+    if len(names) == 0:
+        return None
+
+    return decodeChunks(names, SNAPSHOTS_PREFIX)
+
+def saveSnapshots(doc, data):
+    """
+    Store the snapshots `data` in `doc`, or remove the stored snapshots if `data` is `None`.
+
+    Returns
+    -------
+    out: bool
+    Whether anything was written.
+    """
+    snapshotsLayer = findSnapshotsLayer(doc)
+    if data is None:
+        if snapshotsLayer is None:
+            return False
+        snapshotsLayer.parent.raw.removeChildNode(snapshotsLayer.raw)
+        return True
+
+    if snapshotsLayer is None:
+        snapshotsLayer = createSettingsGroup(doc, SNAPSHOTS_LAYER)
+    return writeDataLayers(doc, snapshotsLayer, encodeChunks(data, SNAPSHOTS_PREFIX))
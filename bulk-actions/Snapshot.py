@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Snapshots of the state of every layer - the attributes the plugin acts on - to switch a
+document between looks quickly, like Krita's Compositions but including names, locks and
+opacity.
+
+A snapshot is stored in columns by layer: the unique ids, one bit array per boolean
+attribute, one byte per layer for the opacity and the names. Restoring it captures the
+current state in the same columns and compares them column by column, so only the attributes
+that differ from the snapshot are written.
+"""
+
+import base64
+
+from .ChangeSet import ChangeSet
+from .Engine import applyAll, finishActions, pluginSettingsUids
+from .Index import documentIndex
+
+# The boolean attributes of a snapshot, one bit array each
+FLAGS = ('visible', 'locked', 'alphaLocked', 'collapsed', 'inheritAlpha')
+
+
+def packBits(values):
+    """
+    Pack an iterable of bools into a bytearray, 8 values per byte.
+    """
+    bits = bytearray()
+    for i, value in enumerate(values):
+        if i & 7 == 0:
+            bits.append(0)
+        if value:
+            bits[-1] |= 1 << (i & 7)
+    return bits
+
+def bit(bits, i):
+    return bool(bits[i >> 3] >> (i & 7) & 1)
+
+def differingBits(a, b):
+    """
+    Yield the positions of the bits that differ between the bit arrays `a` and `b`, a byte at
+    a time.
+    """
+    if a == b:
+        return
+    for k, (x, y) in enumerate(zip(a, b)):
+        d = x ^ y
+        while d:
+            low = d & -d
+            yield (k << 3) + low.bit_length() - 1
+            d ^= low
+
+
+class Snapshot:
+    """
+    The state of a list of layers, in columns: `uids`, a bit array per attribute of `FLAGS`
+    in `flags`, a byte per layer in `opacity` and the `names`.
+    """
+
+    def __init__(self, name, uids, flags, opacity, names):
+        self.name = name
+        self.uids = uids
+        self.flags = flags
+        self.opacity = opacity
+        self.names = names
+
+    def __repr__(self):
+        return 'Snapshot({!r}, {} layers)'.format(self.name, len(self))
+
+    def __len__(self):
+        return len(self.uids)
+
+    @classmethod
+    def capture(cls, name, index, uids=None):
+        """
+        Read the state of the layers `uids` of `index`, by default all of them but the root and
+        the plugin settings.
+        """
+        if uids is None:
+            excluded = pluginSettingsUids(index)
+            uids = [ uid for uid in index.order[1:] if uid not in excluded ]
+        raws = [ index.raws[uid] for uid in uids ]
+        flags = { attr: packBits(getattr(raw, attr)() for raw in raws) for attr in FLAGS }
+        opacity = bytearray(raw.opacity() for raw in raws)
+        names = [ index.names[uid] for uid in uids ]
+        return cls(name, uids, flags, opacity, names)
+
+    def state(self, i):
+        """
+        Return the attributes of the `i`th layer as a dict.
+        """
+        state = { attr: bit(self.flags[attr], i) for attr in FLAGS }
+        state['opacity'] = self.opacity[i]
+        state['name'] = self.names[i]
+        return state
+
+    def select(self, rows):
+        """
+        Return a snapshot of the layers at positions `rows` only.
+        """
+        flags = { attr: packBits(bit(bits, i) for i in rows) for attr, bits in self.flags.items() }
+        return Snapshot(self.name, [ self.uids[i] for i in rows ], flags,
+            bytearray(self.opacity[i] for i in rows), [ self.names[i] for i in rows ])
+
+    def restoreChanges(self, index):
+        """
+        Plan the writes putting the layers of `index` back in the snapshot's state, without
+        writing anything. Layers removed since the snapshot was taken are skipped.
+
+        Returns
+        -------
+        out: ChangeSet
+        """
+        target = self
+        if not all(uid in index for uid in self.uids):
+            target = self.select([ i for i, uid in enumerate(self.uids) if uid in index ])
+        current = Snapshot.capture(self.name, index, target.uids)
+
+        changes = ChangeSet()
+        def write(i, attr, old, new):
+            node = index.node(target.uids[i])
+            # The current value was just read - don't read it again
+            changes.seed(node, attr, old)
+            changes.set(node, attr, new)
+
+        for attr in FLAGS:
+            old, new = current.flags[attr], target.flags[attr]
+            for i in differingBits(old, new):
+                write(i, attr, bit(old, i), bit(new, i))
+        if current.opacity != target.opacity:
+            for i, (old, new) in enumerate(zip(current.opacity, target.opacity)):
+                if old != new:
+                    write(i, 'opacity', old, new)
+        if current.names != target.names:
+            for i, (old, new) in enumerate(zip(current.names, target.names)):
+                if old != new:
+                    write(i, 'name', old, new)
+        return changes
+
+    def toDict(self, uidTable):
+        """
+        Return the snapshot as JSON compatible data. The unique ids are stored as positions in
+        `uidTable`, a dict shared by the snapshots saved together, which gets the new ids added.
+        """
+        rows = [ uidTable.setdefault(uid, len(uidTable)) for uid in self.uids ]
+        return {
+            'name': self.name,
+            'rows': rows,
+            'flags': { attr: base64.b85encode(bytes(bits)).decode('ascii') for attr, bits in self.flags.items() },
+            'opacity': base64.b85encode(bytes(self.opacity)).decode('ascii'),
+            'names': self.names,
+        }
+
+    @classmethod
+    def fromDict(cls, data, uids):
+        """
+        Create a snapshot from `toDict` data, where `uids` is the list of the shared unique ids.
+        """
+        flags = { attr: bytearray(base64.b85decode(bits)) for attr, bits in data['flags'].items() }
+        return cls(data['name'], [ uids[row] for row in data['rows'] ], flags,
+            bytearray(base64.b85decode(data['opacity'])), data['names'])
+
+
+SNAPSHOTS_VERSION = 1
+
+def snapshotsData(snapshots):
+    uidTable = {}
+    data = [ s.toDict(uidTable) for s in snapshots ]
+    return { 'version': SNAPSHOTS_VERSION, 'uids': list(uidTable), 'snapshots': data }
+
+def snapshotsFromData(data):
+    """
+    Raises
+    ------
+    ValueError
+    If the data was written by an unknown version.
+    """
+    if data.get('version') != SNAPSHOTS_VERSION:
+        raise ValueError('Unknown Bulk Actions snapshots version {!r}'.format(data.get('version')))
+    return [ Snapshot.fromDict(s, data['uids']) for s in data['snapshots'] ]
+
+
+def captureSnapshot(doc, name):
+    return Snapshot.capture(name, documentIndex(doc))
+
+def restoreSnapshot(doc, snapshot):
+    """
+    Put the layers of `doc` back in the state of `snapshot`, writing only what differs.
+
+    Returns
+    -------
+    out: ChangeSet
+    The applied changes.
+    """
+    index = documentIndex(doc)
+    changes = snapshot.restoreChanges(index)
+    applyAll(doc, changes)
+    return finishActions(doc, index, changes)
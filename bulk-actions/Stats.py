@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Instrumentation of action runs.
+
+`counters` counts the expensive things the engine does through the scripting API - nodes
+read, `childNodes()` calls and setter calls - for as long as the plugin is loaded. A
+`RunStats` times each stage of one run and records how much the counters grew during it,
+along with what each action matched and wrote.
+
+Profiling with cProfile is switched on per run with `RunStats(profile=True)`. Only the stages
+are profiled, not the event loop in between the slices of a chunked run.
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import time
+
+from contextlib import contextmanager
+
+# The stages of a run, in the order they happen
+STAGES = ('resolve', 'plan', 'apply', 'refresh')
+
+# Engine wide counters, only ever incremented
+counters = {
+    # Nodes read from the document while indexing or walking a scope
+    'visited': 0,
+    'childNodes': 0,
+    'setters': 0,
+}
+
+
+class ActionStats:
+    """
+    What one action of a run did: the layers its pattern `matched`, the `writes` it asked for
+    (before merging with the other actions) and the `seconds` it took to plan them.
+    """
+
+    def __init__(self, spec, matched=0, writes=0, seconds=0.0):
+        self.spec = spec
+        self.matched = matched
+        self.writes = writes
+        self.seconds = seconds
+
+    def __repr__(self):
+        return 'ActionStats({!r}, {})'.format(self.spec, self.summary())
+
+    def summary(self):
+        return '{} matched, {} writes, planned in {:.1f} ms'.format(self.matched, self.writes, self.seconds * 1000)
+
+    def toDict(self):
+        return {
+            'action': self.spec.action.name,
+            'match': self.spec.match,
+            'value': self.spec.value,
+            'scope': self.spec.scope,
+            'depth': self.spec.depth,
+            'matched': self.matched,
+            'writes': self.writes,
+            'seconds': self.seconds,
+        }
+
+
+class RunStats:
+    """
+    Timings and counts of one run, filled in by the engine.
+    """
+
+    def __init__(self, profile=False):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.counts = dict.fromkeys(counters, 0)
+        self.actions = []
+        self.applied = 0
+        self.skipped = 0
+        self.refreshed = False
+        self.profiler = cProfile.Profile() if profile else None
+
+    def __repr__(self):
+        return 'RunStats({})'.format(self.summary())
+
+    @property
+    def total(self):
+        return sum(self.seconds.values())
+
+    @property
+    def matched(self):
+        return sum(a.matched for a in self.actions)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the block as stage `name` and add the counter increments made in it.
+        """
+        before = dict(counters)
+        if self.profiler is not None:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+            for key, value in counters.items():
+                self.counts[key] += value - before[key]
+
+    def addAction(self, spec, matched, writes, seconds):
+        self.actions.append(ActionStats(spec, matched, writes, seconds))
+
+    def finish(self, changes):
+        self.applied = changes.applied
+        self.skipped = changes.skipped
+
+    def summary(self):
+        stages = ', '.join('{} {:.1f}'.format(name, seconds * 1000) for name, seconds in self.seconds.items())
+        return '{:.1f} ms ({} ms), {} visited, {} childNodes() calls, {} matched, {} setter calls{}'.format(
+            self.total * 1000, stages, self.counts['visited'], self.counts['childNodes'], self.matched,
+            self.counts['setters'], ', refreshed' if self.refreshed else '')
+
+    def profileReport(self, limit=25):
+        """
+        Return the cProfile report of the run, sorted by cumulative time, or `None` if the run
+        wasn't profiled.
+        """
+        if self.profiler is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def toDict(self):
+        data = {
+            'seconds': dict(self.seconds, total=self.total),
+            'counts': dict(self.counts, matched=self.matched),
+            'applied': self.applied,
+            'skipped': self.skipped,
+            'refreshed': self.refreshed,
+            'actions': [ a.toDict() for a in self.actions ],
+        }
+        if self.profiler is not None:
+            data['profile'] = self.profileReport()
+        return data
+
+    def toJson(self, **kwargs):
+        return json.dumps(self.toDict(), **kwargs)
+
+
+# Version of the exported statistics
+EXPORT_VERSION = 1
+
+def exportStats(path, runs):
+    """
+    Write the statistics of `runs` to a JSON file, for tracking performance across versions.
+
+    Parameters
+    ----------
+    path: str
+    runs: iter((str, dict))
+    The document name and `RunStats.toDict()` of each run.
+    """
+    data = { 'version': EXPORT_VERSION, 'runs': [ dict(stats, document=name) for name, stats in runs ] }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+Rename templates.
+
+A template is the new name of a layer with fields in braces, e.g. "Shadow {i+:03} {%name}":
+
+    {i++} {i--}     Counters 0, 1, 2... and n-1, n-2... 0 over the renamed layers
+    {i+} {i-}       Counters 1, 2, 3... and n, n-1... 1
+    {%name}         The current name of the layer
+    {%parent}       The name of the group the layer is in, empty at the top level
+    {%depth}        How deep the layer is, 0 at the top level
+    {%type}         The layer type, e.g. paintlayer
+    {%0} {%1}...    The text matched by the pattern and its regular expression groups
+    {{ }}           Literal braces
+
+Any field can have a Python format spec, e.g. {i+:03} for zero-padded counters.
+
+A template written as s/<regex>/<replacement>/ replaces every match of the regular expression
+in the current name with the replacement, which is a template itself where {%0} {%1}... are the
+match and its groups.
+
+Templates are compiled once, and all errors are raised by `compileTemplate`, before any layer
+is renamed.
+"""
+
+import re
+
+from functools import lru_cache
+from string import Formatter
+
+REPLACE = re.compile(r'^s/((?:\\.|[^\\/])*)/((?:\\.|[^\\/])*)/$')
+CAPTURE = re.compile(r'^%(\d+)$')
+
+
+class RenameContext:
+    """
+    What the fields of a template are rendered from, for one layer.
+    """
+    __slots__ = ('node', 'name', 'index', 'count', 'captures')
+
+    def __init__(self, node, name, index, count, captures=()):
+        self.node = node
+        self.name = name
+        self.index = index
+        self.count = count
+        self.captures = captures
+
+def parentName(c):
+    parent = c.node.parent
+    # The root node is nobody's group as far as the user is concerned
+    if not parent or not parent.parent:
+        return ''
+    return parent.name
+
+def depth(c):
+    d = -1
+    n = c.node.parent
+    while n:
+        d += 1
+        n = n.parent
+    return d
+
+# Field name -> value getter
+FIELDS = {
+    'i++': lambda c: c.index,
+    'i--': lambda c: c.count - 1 - c.index,
+    'i+': lambda c: c.index + 1,
+    'i-': lambda c: c.count - c.index,
+    '%name': lambda c: c.name,
+    '%parent': parentName,
+    '%depth': depth,
+    '%type': lambda c: c.node.type,
+}
+
+# Sample value of each field, to check format specs at compile time
+SAMPLES = {
+    'i++': 0,
+    'i--': 0,
+    'i+': 0,
+    'i-': 0,
+    '%depth': 0,
+}
+
+def capture(i):
+    return lambda c: c.captures[i] if i < len(c.captures) else ''
+
+
+class Template:
+    """
+    A compiled rename template. `render(context)` returns the new name.
+
+    `captures` is the number of pattern captures the template uses ({%0} counts as one).
+    """
+
+    def __init__(self, text, parts, captures):
+        self.text = text
+        self.parts = parts
+        self.captures = captures
+        if len(parts) == 1 and isinstance(parts[0], str):
+            constant = parts[0]
+            self.render = lambda c: constant
+
+    def __repr__(self):
+        return 'Template({!r})'.format(self.text)
+
+    def render(self, c):
+        return ''.join(p if isinstance(p, str) else p(c) for p in self.parts)
+
+class ReplaceTemplate(Template):
+    """
+    A compiled s/<regex>/<replacement>/ template.
+    """
+
+    def __init__(self, text, find, replacement):
+        # {%0} {%1}... in the replacement are the regex match, not the pattern captures
+        Template.__init__(self, text, [], 0)
+        self.find = find
+        self.replacement = replacement
+
+    def render(self, c):
+        def replace(m):
+            groups = tuple(g or '' for g in m.groups())
+            return self.replacement.render(RenameContext(c.node, c.name, c.index, c.count, (m.group(0),) + groups))
+        return self.find.sub(replace, c.name)
+
+
+def field(name, spec, conversion, text):
+    if conversion:
+        raise ValueError('Conversions like !{} are not supported in template {!r}'.format(conversion, text))
+
+    m = CAPTURE.match(name)
+    if m is not None:
+        getter = capture(int(m.group(1)))
+        sample = ''
+    elif name in FIELDS:
+        getter = FIELDS[name]
+        sample = SAMPLES.get(name, '')
+    else:
+        raise ValueError('Unknown field {{{}}} in template {!r}'.format(name, text))
+
+    if not spec:
+        return lambda c: str(getter(c))
+    try:
+        format(sample, spec)
+    except ValueError as e:
+        raise ValueError('Invalid format {{{}:{}}} in template {!r}: {}'.format(name, spec, text, e))
+    return lambda c: format(getter(c), spec)
+
+def parseTemplate(text):
+    parts = []
+    captures = 0
+    try:
+        parsed = list(Formatter().parse(text))
+    except ValueError as e:
+        raise ValueError('Invalid template {!r}: {}'.format(text, e))
+
+    for literal, name, spec, conversion in parsed:
+        if literal:
+            parts.append(literal)
+        if name is None:
+            continue
+        m = CAPTURE.match(name)
+        if m is not None:
+            captures = max(captures, int(m.group(1)) + 1)
+        parts.append(field(name, spec, conversion, text))
+
+    if not parts:
+        parts.append('')
+    return Template(text, parts, captures)
+
+@lru_cache(maxsize=256)
+def compileTemplate(text):
+    """
+    Compile a rename template. Compiled templates are cached by their text.
+
+    Raises
+    ------
+    ValueError
+    If the template has unknown fields, invalid format specs, unbalanced braces or, in
+    find/replace mode, an invalid regular expression.
+    """
+    m = REPLACE.match(text)
+    if m is None:
+        return parseTemplate(text)
+
+    find, replacement = m.group(1), m.group(2).replace('\\/', '/')
+    try:
+        find = re.compile(find)
+    except re.error as e:
+        raise ValueError('Invalid regular expression {!r} in template {!r}: {}'.format(find, text, e))
+    replacement = parseTemplate(replacement)
+    if replacement.captures > find.groups + 1:
+        raise ValueError('Template {!r} uses {{%{}}} but {!r} only has {} groups'.format(text, replacement.captures - 1, find.pattern, find.groups))
+    return ReplaceTemplate(text, find, replacement)
@@ -0,0 +1,67 @@
+from collections import deque
+
+class Automaton:
+    """
+    Aho-Corasick automaton for finding which of many patterns occur in a text in one pass.
+
+    Parameters
+    ----------
+    patterns: iter(str)
+    The patterns to search for. Patterns are plain strings and matched by code point.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+
+        goto = [{}]
+        out = [set()]
+        for i, pattern in enumerate(self.patterns):
+            state = 0
+            for c in pattern:
+                nxt = goto[state].get(c)
+                if nxt is None:
+                    nxt = goto[state][c] = len(goto)
+                    goto.append({})
+                    out.append(set())
+                state = nxt
+            out[state].add(i)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and c not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(c, 0)
+                out[nxt] |= out[fail[nxt]]
+
+        self.goto = goto
+        self.fail = fail
+        self.out = out
+
+    def search(self, text):
+        """
+        Find the patterns occurring in `text`.
+
+        Parameters
+        ----------
+        text: str
+
+        Returns
+        -------
+        out: set(int)
+        The indices of the patterns, as given to the constructor, found in `text`.
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set(out[0])
+        state = 0
+        for c in text:
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if out[state]:
+                found |= out[state]
+        return found
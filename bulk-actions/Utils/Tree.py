@@ -16,14 +16,13 @@ def iterPre(node, maxDepth=-1):
     out: iter(Node)
     """
 
-    def go(nodes, depth=0):
-        for n in nodes:
-            yield n
-            # recursively call the generator if depth < maxDepth
-            it = go(n.children, depth + 1) if maxDepth == -1 or depth < maxDepth else iter()
-            yield from it
-
-    return go([node])
+    # Explicit stack - O(1) work per node and no recursion limit on deep trees
+    stack = [(node, 0)]
+    while stack:
+        n, depth = stack.pop()
+        yield n
+        if maxDepth == -1 or depth < maxDepth:
+            stack.extend((c, depth + 1) for c in reversed(n.children))
 
 
 def iterLevel(node, maxDepth=-1):
@@ -41,13 +40,8 @@ def iterLevel(node, maxDepth=-1):
     out: iter(Node)
     """
 
-    def go(nodes, depth=0):
-        yield from nodes
-        it = map(lambda n: go(n.children, depth + 1), nodes)
-        it = chain(*it) if maxDepth == -1 or depth < maxDepth else iter()
-        yield from it
-
-    return go([node])
+    for level in iterLevelGroup(node, maxDepth):
+        yield from level
 
 
 def iterLevelGroup(node, maxDepth=-1):
@@ -66,13 +60,14 @@ def iterLevelGroup(node, maxDepth=-1):
     Returns an iterator that holds an iterator for each depth level.
     """
 
-    def go(nodes, depth=0):
-        yield iter(nodes)
-        it = map(lambda n: go(n.children, depth + 1), nodes)
-        it = chain(*it) if maxDepth == -1 or depth < maxDepth else iter()
-        yield from filter(None, it)
-
-    return go([node])
+    level = [node]
+    depth = 0
+    while level:
+        yield iter(level)
+        if maxDepth != -1 and depth >= maxDepth:
+            break
+        level = [c for n in level for c in n.children]
+        depth += 1
 
 
 def iterPost(node, maxDepth=-1):
@@ -90,13 +85,15 @@ def iterPost(node, maxDepth=-1):
     out: iter(Node)
     """
 
-    def go(nodes, depth=0):
-        for n in nodes:
-            it = go(n.children, depth + 1) if maxDepth == -1 or depth < maxDepth else iter()
-            yield from it
+    # Each node is pushed twice - first to expand its children, then to be yielded
+    stack = [(node, 0, False)]
+    while stack:
+        n, depth, expanded = stack.pop()
+        if expanded or (maxDepth != -1 and depth >= maxDepth):
             yield n
-
-    return go([node])
+            continue
+        stack.append((n, depth, True))
+        stack.extend((c, depth + 1, False) for c in reversed(n.children))
 
 
 def path(node):
@@ -113,12 +110,13 @@ def path(node):
     The path of nodes going through all the parents to the given node.
     """
 
-    def go(n, acc=[]):
-        acc += [n]
-        n.parent and go(n.parent, acc)
-        return reversed(acc)
-
-    return list(go(node))
+    acc = []
+    n = node
+    while n:
+        acc.append(n)
+        n = n.parent
+    acc.reverse()
+    return acc
 
 
 def pathFS(node):
@@ -138,8 +136,8 @@ def pathFS(node):
     string format.
     """
     it = filter(lambda n: n.parent, path(node))
-    it = map(lambda n: n.name, it)
-    return os.path.join(*it)
+    it = list(map(lambda n: n.name, it))
+    return os.path.join(*it) if it else ''
 
 
 def iterDirs(node):
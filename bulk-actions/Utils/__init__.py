@@ -14,3 +14,29 @@ def remap(oldValue, oldMin, oldMax, newMin, newMax):
 
 def clamp(value, clamp_min, clamp_max):
     return min(clamp_max, max(clamp_min, value))
+
+def isEmptyRect(rect):
+    return rect is None or rect[2] <= 0 or rect[3] <= 0
+
+def unionRect(a, b):
+    # Rects are (x, y, width, height) tuples like `KritaNode.bounds`
+    if isEmptyRect(a):
+        return None if isEmptyRect(b) else b
+    if isEmptyRect(b):
+        return a
+    x, y = min(a[0], b[0]), min(a[1], b[1])
+    return (x, y, max(a[0] + a[2], b[0] + b[2]) - x, max(a[1] + a[3], b[1] + b[3]) - y)
+
+def intersectRect(a, b):
+    if isEmptyRect(a) or isEmptyRect(b):
+        return None
+    x, y = max(a[0], b[0]), max(a[1], b[1])
+    rect = (x, y, min(a[0] + a[2], b[0] + b[2]) - x, min(a[1] + a[3], b[1] + b[3]) - y)
+    return None if isEmptyRect(rect) else rect
+
+def containsRect(a, b):
+    if isEmptyRect(b):
+        return True
+    if isEmptyRect(a):
+        return False
+    return a[0] <= b[0] and a[1] <= b[1] and a[0] + a[2] >= b[0] + b[2] and a[1] + a[3] >= b[1] + b[3]
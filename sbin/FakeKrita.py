@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+In-memory stand-in for the parts of Krita's scripting API the plugin uses, so the action
+engine (`Engine`, `Index`, `Pattern`, `ChangeSet`, `Settings`) can be run and timed without
+Krita or a GUI.
+
+The engine only relies on this node protocol, which `KritaNode` wraps:
+
+    name() setName(name) type() uniqueId().toString() childNodes() parentNode() bounds()
+    visible() locked() alphaLocked() collapsed() inheritAlpha() opacity()
+    and the matching setters
+
+and on `rootNode()`, `activeNode()`, `bounds()`, `createGroupLayer(name)` and
+`refreshProjection()` of the document. `nodeByName(name)` is there for the tests.
+
+`FakeKrita` stands in for `Krita.instance()` in headless batch runs (see `Batch`). Its
+documents are JSON files holding the layer tree, written by `FakeDocument.save`.
+
+It's a development tool used by the scripts in `sbin` and the tests, not part of the plugin.
+"""
+
+import json
+import uuid
+
+from itertools import cycle
+
+
+class FakeUuid:
+
+    def __init__(self, value=None):
+        self.uuid = uuid.UUID(value) if value else uuid.uuid4()
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUuid) and self.uuid == other.uuid
+
+    def __hash__(self):
+        return hash(self.uuid)
+
+    def toString(self):
+        return '{' + str(self.uuid) + '}'
+
+class FakeRect:
+
+    def __init__(self, x=0, y=0, width=0, height=0):
+        self.rect = (x, y, width, height)
+
+    def x(self):
+        return self.rect[0]
+
+    def y(self):
+        return self.rect[1]
+
+    def width(self):
+        return self.rect[2]
+
+    def height(self):
+        return self.rect[3]
+
+
+class FakeNode:
+    """
+    A layer in a `FakeDocument`. Children are kept bottom to top like `Node.childNodes()`.
+    """
+
+    def __init__(self, name, type='paintlayer', children=(), bounds=(0, 0, 0, 0)):
+        self._name = name
+        self._type = type
+        self._uid = FakeUuid()
+        self._parent = None
+        self._children = []
+        self._bounds = bounds
+        self._visible = True
+        self._locked = False
+        self._alphaLocked = False
+        self._collapsed = False
+        self._inheritAlpha = False
+        self._opacity = 255
+        for child in children:
+            self.addChildNode(child, None)
+
+    def __repr__(self):
+        return 'FakeNode({!r}, {!r})'.format(self._name, self._type)
+
+    def name(self):
+        return self._name
+
+    def setName(self, name):
+        self._name = name
+
+    def type(self):
+        return self._type
+
+    def uniqueId(self):
+        return self._uid
+
+    def childNodes(self):
+        return list(self._children)
+
+    def parentNode(self):
+        return self._parent
+
+    def addChildNode(self, child, above):
+        if child._parent is not None:
+            child._parent.removeChildNode(child)
+        child._parent = self
+        if above is None:
+            self._children.append(child)
+        else:
+            self._children.insert(self._children.index(above) + 1, child)
+        return True
+
+    def removeChildNode(self, child):
+        self._children.remove(child)
+        child._parent = None
+        return True
+
+    def bounds(self):
+        return FakeRect(*self._bounds)
+
+    def visible(self):
+        return self._visible
+
+    def setVisible(self, visible):
+        self._visible = visible
+
+    def locked(self):
+        return self._locked
+
+    def setLocked(self, locked):
+        self._locked = locked
+
+    def alphaLocked(self):
+        return self._alphaLocked
+
+    def setAlphaLocked(self, alphaLocked):
+        self._alphaLocked = alphaLocked
+
+    def collapsed(self):
+        return self._collapsed
+
+    def setCollapsed(self, collapsed):
+        self._collapsed = collapsed
+
+    def inheritAlpha(self):
+        return self._inheritAlpha
+
+    def setInheritAlpha(self, inheritAlpha):
+        self._inheritAlpha = inheritAlpha
+
+    def opacity(self):
+        return self._opacity
+
+    def setOpacity(self, opacity):
+        self._opacity = opacity
+
+    def toDict(self):
+        return {
+            'name': self._name,
+            'type': self._type,
+            'uuid': str(self._uid.uuid),
+            'bounds': list(self._bounds),
+            'visible': self._visible,
+            'locked': self._locked,
+            'alphaLocked': self._alphaLocked,
+            'collapsed': self._collapsed,
+            'inheritAlpha': self._inheritAlpha,
+            'opacity': self._opacity,
+            'children': [c.toDict() for c in self._children],
+        }
+
+    @classmethod
+    def fromDict(cls, data):
+        node = cls(data['name'], data['type'], [cls.fromDict(c) for c in data['children']], tuple(data['bounds']))
+        node._uid = FakeUuid(data['uuid'])
+        for attr in ('visible', 'locked', 'alphaLocked', 'collapsed', 'inheritAlpha', 'opacity'):
+            setattr(node, '_' + attr, data[attr])
+        return node
+
+
+class FakeDocument:
+
+    def __init__(self, root=None, width=1024, height=1024, fileName=''):
+        self.root = root if root is not None else FakeNode('root', 'grouplayer')
+        self.size = (width, height)
+        self.path = fileName
+        self.refreshCount = 0
+        self.active = None
+        self.closed = False
+
+    def rootNode(self):
+        return self.root
+
+    def activeNode(self):
+        return self.active
+
+    def setActiveNode(self, node):
+        self.active = node
+
+    def bounds(self):
+        return FakeRect(0, 0, *self.size)
+
+    def width(self):
+        return self.size[0]
+
+    def height(self):
+        return self.size[1]
+
+    def fileName(self):
+        return self.path
+
+    def nodeByName(self, name):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node._name == name:
+                return node
+            stack.extend(reversed(node._children))
+        return None
+
+    def createGroupLayer(self, name):
+        return FakeNode(name, 'grouplayer')
+
+    def createNode(self, name, type):
+        return FakeNode(name, type)
+
+    def refreshProjection(self):
+        self.refreshCount += 1
+
+    def setFileName(self, fileName):
+        self.path = fileName
+
+    def save(self):
+        return self.saveAs(self.path)
+
+    def saveAs(self, fileName):
+        with open(fileName, 'w') as f:
+            json.dump({ 'width': self.size[0], 'height': self.size[1], 'root': self.root.toDict() }, f)
+        return True
+
+    def close(self):
+        self.closed = True
+        return True
+
+    @classmethod
+    def load(cls, fileName):
+        with open(fileName) as f:
+            data = json.load(f)
+        return cls(FakeNode.fromDict(data['root']), data['width'], data['height'], fileName)
+
+
+class FakeKrita:
+    """
+    Stand-in for `Krita.instance()` with the documents opened through it.
+    """
+
+    def __init__(self):
+        self.openDocuments = []
+        self.batchmode = False
+
+    def setBatchmode(self, batchmode):
+        self.batchmode = batchmode
+
+    def openDocument(self, fileName):
+        try:
+            doc = FakeDocument.load(fileName)
+        except (OSError, ValueError, KeyError):
+            return None
+        self.openDocuments.append(doc)
+        return doc
+
+    def documents(self):
+        self.openDocuments = [doc for doc in self.openDocuments if not doc.closed]
+        return list(self.openDocuments)
+
+    def activeDocument(self):
+        documents = self.documents()
+        return documents[-1] if documents else None
+
+def fakeApplication():
+    return FakeKrita()
+
+
+def buildDocument(layers, width=10, tags=('@', '⭕', '👁', ''), layerSize=64):
+    """
+    Build a `FakeDocument` with `layers` paint layers spread over nested groups.
+
+    Parameters
+    ----------
+    layers: int
+    The number of paint layers.
+    width: int
+    The number of children of each group.
+    tags: iter(str)
+    Tags added to the layer names in turn.
+    layerSize: int
+    Width and height of each layer's bounds, laid out on a grid.
+
+    Returns
+    -------
+    out: FakeDocument
+    """
+    tags = cycle(tags)
+    columns = max(1, int(layers ** 0.5))
+    nodes = []
+    for i in range(layers):
+        x, y = (i % columns) * layerSize, (i // columns) * layerSize
+        name = 'Layer {} {}'.format(i, next(tags)).strip()
+        nodes.append(FakeNode(name, bounds=(x, y, layerSize, layerSize)))
+
+    # Group the layers bottom up until a single level is left
+    level = 0
+    while len(nodes) > width:
+        level += 1
+        groups = []
+        for i in range(0, len(nodes), width):
+            groups.append(FakeNode('Group {}.{}'.format(level, i // width), 'grouplayer', nodes[i:i + width]))
+        nodes = groups
+
+    size = columns * layerSize
+    return FakeDocument(FakeNode('root', 'grouplayer', nodes), size, size)
+
+def buildChain(depth, layerSize=64):
+    """
+    Build a `FakeDocument` of `depth` groups nested in each other, with a paint layer at the bottom.
+    """
+    node = FakeNode('Layer @', bounds=(0, 0, layerSize, layerSize))
+    for i in reversed(range(depth)):
+        node = FakeNode('Group {}'.format(i), 'grouplayer', [node])
+    return FakeDocument(FakeNode('root', 'grouplayer', [node]), layerSize, layerSize)
+
+def buildFlat(layers, tags=('@', '⭕', '👁', ''), layerSize=64):
+    """
+    Build a `FakeDocument` with `layers` paint layers directly under the root.
+    """
+    return buildDocument(layers, max(1, layers), tags, layerSize)
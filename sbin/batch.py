@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Run Bulk Actions on many documents without the docker.
+
+    python3 sbin/batch.py art/*.kra
+    python3 sbin/batch.py --preset export.json --action no-shadows --jobs 4 --output out art/*.kra
+    python3 sbin/batch.py --fake --dry-run tests/*.json
+    python3 sbin/batch.py --stats stats.json art/*.kra
+
+Without `--preset` the actions saved in each document are run. `--action` picks actions by
+name or by position (counting from 1) and can be repeated.
+
+The `krita` module is only available inside Krita, so run this with Krita's Python (e.g. from
+`kritarunner`) for real documents. `--fake` uses the JSON documents of `FakeKrita` instead.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import types
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.join(SCRIPT_DIR, '..', 'bulk-actions')
+
+
+def loadPlugin(name='bulk_actions'):
+    """
+    Make the plugin modules importable as `name` without running the package's __init__.py,
+    which registers the docker with Krita.
+    """
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[name] = package
+    return lambda module: importlib.import_module(name + '.' + module)
+
+plugin = loadPlugin()
+Batch = plugin('Batch')
+Stats = plugin('Stats')
+
+import FakeKrita
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('documents', nargs='+')
+    parser.add_argument('--preset', help='JSON file with the actions to run instead of the ones saved in each document')
+    parser.add_argument('--action', action='append', default=[], help='name or position of an action to run, all if not given')
+    parser.add_argument('--output', help='directory to save the documents to instead of overwriting them')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--dry-run', action='store_true', help="run the actions but don't save")
+    parser.add_argument('--fake', action='store_true', help='use FakeKrita JSON documents instead of Krita')
+    parser.add_argument('--stats', help='JSON file to write the timings and counts of each run to')
+    args = parser.parse_args(argv)
+
+    try:
+        preset = Batch.loadPreset(args.preset) if args.preset else None
+        if preset is not None:
+            Batch.selectActions(preset, args.action)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    appFactory = FakeKrita.fakeApplication if args.fake else Batch.kritaApplication
+    results = Batch.runBatch(args.documents, appFactory, args.jobs,
+        preset=preset, wanted=args.action, output=args.output, dryRun=args.dry_run)
+
+    failed = 0
+    runs = []
+    for r in results:
+        if r['stats'] is not None:
+            runs.append((r['path'], r['stats']))
+        if r['error'] is not None:
+            failed += 1
+            print('{}: failed: {}'.format(r['path'], r['error']))
+        else:
+            print('{}: {} changes, {} unchanged in {:.0f} ms{}'.format(
+                r['path'], r['applied'], r['skipped'], r['seconds'] * 1000, ', saved' if r['saved'] else ''))
+    if args.stats:
+        Stats.exportStats(args.stats, runs)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Bulk Actions engine without Krita, against the in-memory `FakeKrita` documents.
+
+    python3 sbin/benchmark.py
+    python3 sbin/benchmark.py --layers 1000 10000 --repeat 5 --only index match
+    python3 sbin/benchmark.py --shape art deep wide --only pre post level levelgroup path
+
+Reports the best time of `--repeat` runs and the peak memory allocated by one run of each
+benchmark.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.join(SCRIPT_DIR, '..', 'bulk-actions')
+
+
+def loadPlugin(name='bulk_actions'):
+    """
+    Make the plugin modules importable as `name` without running the package's __init__.py,
+    which registers the docker with Krita.
+    """
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[name] = package
+    return lambda module: importlib.import_module(name + '.' + module)
+
+plugin = loadPlugin()
+KritaNode = plugin('KritaNode')
+Index = plugin('Index')
+Engine = plugin('Engine')
+Settings = plugin('Settings')
+Snapshot = plugin('Snapshot')
+Pipeline = plugin('Pipeline')
+Tree = plugin('Utils.Tree')
+
+import FakeKrita
+
+from collections import deque
+
+TAGS = ['@', '⭕', '👁', 'Layer 1']
+
+
+def traversal(iterate):
+    def bench(doc):
+        root = KritaNode.KritaNode(doc.rootNode())
+        return lambda: deque(iterate(root), maxlen=0)
+    return bench
+
+def benchPath(doc):
+    root = KritaNode.KritaNode(doc.rootNode())
+    leaves = [n for n in Tree.iterPre(root) if not n.isGroupLayer()][:100]
+    return lambda: [Tree.pathFS(n) for n in leaves]
+
+def benchIndex(doc):
+    return lambda: Index.NodeIndex(KritaNode.KritaNode(doc.rootNode())).build()
+
+def benchSync(doc):
+    # An unchanged document, the common case before every run
+    index = Index.documentIndex(doc)
+    return index.sync
+
+def benchMatch(doc):
+    index = Index.documentIndex(doc)
+    def run():
+        index.tags.clear()
+        index.tags.resolve(TAGS)
+    return run
+
+def benchExpression(doc):
+    index = Index.documentIndex(doc)
+    specs = [Engine.ActionSpec(Engine.BulkAction.BOOL_VISIBLE, '=@ & !"Layer 1" & type:paint')]
+    def run():
+        index.tags.clear()
+        Engine.resolveTargets(doc, specs)
+    return run
+
+def benchRename(doc):
+    nodes = Index.documentIndex(doc).nodes()
+    return lambda: Engine.renamePlan('Layer {i+} {%name}', nodes)
+
+def benchRun(doc):
+    specs = [Engine.ActionSpec(Engine.BulkAction.BOOL_VISIBLE, tag) for tag in TAGS]
+    return lambda: Engine.runActions(doc, specs)
+
+def benchSettings(doc):
+    actions = [ (Engine.BulkActionType.BOOL, { 'index': i % 5, 'match': TAGS[i % len(TAGS)] }) for i in range(200) ]
+    def run():
+        Settings.saveSettings(doc, actions)
+        Settings.loadSettings(doc)
+    return run
+
+def benchSnapshot(doc):
+    # Restoring a snapshot of an unchanged document - captures and compares, writes nothing
+    snapshot = Snapshot.captureSnapshot(doc, 'bench')
+    return lambda: Snapshot.restoreSnapshot(doc, snapshot)
+
+# Planning only, nothing is written - the serial engine against the background pipeline
+PLAN_SPECS = [
+    Engine.ActionSpec(Engine.BulkAction.BOOL_VISIBLE, '@'),
+    Engine.ActionSpec(Engine.BulkAction.SET_NAME, '👁', 'Eye {i+:05} {%parent}'),
+    Engine.ActionSpec(Engine.BulkAction.SET_NAME, 're:(\\d+) ⭕', 'Circle {%1}'),
+]
+
+def benchPlan(doc):
+    return lambda: Engine.planActions(doc, PLAN_SPECS)
+
+def benchPipeline(doc):
+    return lambda: Pipeline.startPlanning(doc, PLAN_SPECS).result(resync=False)
+
+def benchSelection(doc):
+    # A multi-selection of every group at the top two levels, nested in each other, expanded
+    # to everything below them. Each run toggles the layers back.
+    root = doc.rootNode()
+    groups = [ n for n in root.childNodes() if n.childNodes() ]
+    raws = groups + [ c for g in groups for c in g.childNodes() ]
+    specs = [ Engine.ActionSpec(Engine.BulkAction.BOOL_VISIBLE, '', expand=-1) ]
+    return lambda: Engine.runActions(doc, specs, lambda: raws)
+
+BENCHMARKS = {
+    'pre': traversal(Tree.iterPre),
+    'post': traversal(Tree.iterPost),
+    'level': traversal(Tree.iterLevel),
+    'levelgroup': traversal(lambda root: (deque(level, maxlen=0) for level in Tree.iterLevelGroup(root))),
+    'path': benchPath,
+    'index': benchIndex,
+    'sync': benchSync,
+    'match': benchMatch,
+    'expression': benchExpression,
+    'rename': benchRename,
+    'run': benchRun,
+    'settings': benchSettings,
+    'snapshot': benchSnapshot,
+    'plan': benchPlan,
+    'pipeline': benchPipeline,
+    'selection': benchSelection,
+}
+
+
+# Synthetic layer trees: nested groups like a real art file, a single deep chain of groups
+# and one wide flat group
+SHAPES = {
+    'art': lambda layers, width: FakeKrita.buildDocument(layers, width),
+    'deep': lambda layers, width: FakeKrita.buildChain(layers),
+    'wide': lambda layers, width: FakeKrita.buildFlat(layers),
+}
+
+
+def measure(run, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--layers', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--width', type=int, default=10, help='children per group')
+    parser.add_argument('--shape', nargs='+', choices=sorted(SHAPES), default=['art'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    args = parser.parse_args(argv)
+
+    print('{:<12} {:<6} {:>8} {:>12} {:>12}'.format('benchmark', 'shape', 'layers', 'time (ms)', 'peak (KiB)'))
+    for shape in args.shape:
+        for layers in args.layers:
+            for name in args.only:
+                doc = SHAPES[shape](layers, args.width)
+                best, peak = measure(BENCHMARKS[name](doc), args.repeat)
+                print('{:<12} {:<6} {:>8} {:>12.2f} {:>12.1f}'.format(name, shape, layers, best * 1000, peak / 1024))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Actions
+------------
+Copyright 2019 Lars Pontoppidan <dev.larpon@gmail.com>
+
+Licensed under the GNU GPL v3.0 terms
+
+The tests run the engine against the in-memory documents of `sbin/FakeKrita.py`. The plugin
+modules are imported as the `bulk_actions` package without running its __init__.py, which
+registers the docker with Krita.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(ROOT, 'sbin'))
+if 'bulk_actions' not in sys.modules:
+    package = types.ModuleType('bulk_actions')
+    package.__path__ = [os.path.join(ROOT, 'bulk-actions')]
+    sys.modules['bulk_actions'] = package
+
+from FakeKrita import FakeDocument, FakeNode
+from bulk_actions import Index, Settings
+
+
+@pytest.fixture(autouse=True)
+def forgetDocuments():
+    # Documents are cached by the unique id of their root, every test starts afresh
+    yield
+    Index.pruneDocuments(())
+    Settings.pruneSettingsLayers(())
+
+@pytest.fixture
+def robot():
+    """
+    root
+      Background
+      Robot
+        Body
+          Body Color
+          Body Shadows @
+        Head
+          Head Color
+          Head Shadows @
+          Eyes ⭕
+    """
+    body = FakeNode('Body', 'grouplayer', [FakeNode('Body Color'), FakeNode('Body Shadows @')])
+    head = FakeNode('Head', 'grouplayer', [FakeNode('Head Color'), FakeNode('Head Shadows @'), FakeNode('Eyes ⭕')])
+    robot = FakeNode('Robot', 'grouplayer', [body, head])
+    return FakeDocument(FakeNode('root', 'grouplayer', [FakeNode('Background'), robot]))
+
+@pytest.fixture
+def written(monkeypatch):
+    """
+    The (layer name, setter) of every setter call made on a `FakeNode`.
+    """
+    calls = []
+    for setter in ('setName', 'setVisible', 'setLocked', 'setAlphaLocked', 'setCollapsed', 'setInheritAlpha', 'setOpacity'):
+        def recording(node, value, setter=setter, original=getattr(FakeNode, setter)):
+            calls.append((node.name(), setter))
+            original(node, value)
+        monkeypatch.setattr(FakeNode, setter, recording)
+    return calls
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from FakeKrita import FakeDocument, FakeKrita, fakeApplication
+from bulk_actions import Batch, Index, Settings
+from bulk_actions.Engine import ActionSpec, BulkAction, BulkActionType
+
+
+PRESET = {
+    'version': 2.0,
+    'actions': [
+        { 'type': 0, 'name': 'no-shadows', 'settings': { 'index': 0, 'match': '@' } },
+        { 'type': 0, 'settings': { 'index': 1, 'match': '⭕' } },
+    ],
+}
+
+def shadows(path):
+    doc = FakeDocument.load(path)
+    return [ doc.nodeByName(name).visible() for name in ('Body Shadows @', 'Head Shadows @') ]
+
+@pytest.fixture
+def files(robot, tmp_path):
+    """
+    A document with the actions saved in it, one with malformed settings and one that isn't there.
+    """
+    good = str(tmp_path / 'good.json')
+    Settings.saveSettings(robot, [(BulkActionType.BOOL, { 'index': 0, 'match': '@' })])
+    robot.saveAs(good)
+    # The copies share the unique ids of their layers, and so the cache key
+    Settings.forgetSettingsLayer(robot)
+
+    bad = str(tmp_path / 'bad.json')
+    doc = FakeDocument.load(good)
+    Settings.saveSettings(doc, [(BulkActionType.BOOL, { 'match': '@' })])
+    doc.saveAs(bad)
+    Settings.forgetSettingsLayer(doc)
+    return good, bad, str(tmp_path / 'missing.json')
+
+
+def testLoadPreset(tmp_path):
+    path = tmp_path / 'preset.json'
+    path.write_text(json.dumps(PRESET), encoding='utf-8')
+    actions = Batch.loadPreset(str(path))
+    assert [ (name, spec.action, spec.match) for name, spec in actions ] == [
+        ('no-shadows', BulkAction.BOOL_VISIBLE, '@'), (None, BulkAction.BOOL_LOCKED, '⭕')]
+
+def testSelectActions():
+    actions = [ ('no-shadows', ActionSpec(BulkAction.BOOL_VISIBLE, '@')), (None, ActionSpec(BulkAction.BOOL_LOCKED, '⭕')) ]
+    assert [ s.match for s in Batch.selectActions(actions, ()) ] == ['@', '⭕']
+    assert [ s.match for s in Batch.selectActions(actions, ['2', 'no-shadows']) ] == ['⭕', '@']
+    with pytest.raises(ValueError):
+        Batch.selectActions(actions, ['3'])
+
+def testProcessFile(files, tmp_path):
+    good, bad, missing = files
+    result = Batch.processFile(FakeKrita(), good, dryRun=True)
+    assert (result['applied'], result['saved'], result['error']) == (2, False, None)
+    assert shadows(good) == [True, True]
+
+    output = tmp_path / 'out'
+    output.mkdir()
+    result = Batch.processFile(FakeKrita(), good, output=str(output))
+    assert (result['applied'], result['saved'], result['error']) == (2, True, None)
+    assert shadows(str(output / 'good.json')) == [False, False]
+
+    preset = [ (None, ActionSpec(BulkAction.SET_VISIBLE, 'Head Shadows', 'off')) ]
+    result = Batch.processFile(FakeKrita(), good, preset=preset)
+    assert result['applied'] == 1
+    assert shadows(good) == [True, False]
+
+def testProcessFileForgetsTheDocument(files):
+    good, bad, missing = files
+    Index.pruneDocuments(())
+    Settings.pruneSettingsLayers(())
+    Batch.processFile(FakeKrita(), good)
+    assert Index._documentIndexes == {} and Settings._settingsLayers == {}
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def testBatchGoesOnAfterFailures(files, jobs):
+    good, bad, missing = files
+    results = list(Batch.runBatch([bad, missing, good], fakeApplication, jobs))
+    assert [ r['path'] for r in results ] == [bad, missing, good]
+    assert results[0]['error'].startswith('KeyError')
+    assert results[1]['error'] == 'Could not open document'
+    assert (results[2]['applied'], results[2]['saved'], results[2]['error']) == (2, True, None)
+    assert shadows(good) == [False, False]
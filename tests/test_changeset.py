@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from FakeKrita import FakeDocument, FakeNode
+from bulk_actions import Engine
+from bulk_actions.ChangeSet import ChangeSet
+from bulk_actions.Engine import ActionSpec, BulkAction, revertActions, runActions, runTimed, startActions
+from bulk_actions.Index import documentIndex
+
+
+class FailingNode(FakeNode):
+
+    def setLocked(self, locked):
+        raise RuntimeError('locked for good')
+
+
+class Clock:
+    """
+    Stand-in for the `time` module where every `perf_counter()` call takes `tick` seconds.
+    """
+
+    def __init__(self, tick):
+        self.tick = tick
+        self.now = 0.0
+
+    def perf_counter(self):
+        self.now += self.tick
+        return self.now
+
+
+def state(doc, *names):
+    return [ (doc.nodeByName(name).visible(), doc.nodeByName(name).locked()) for name in names ]
+
+def layers(count, failing=False):
+    nodes = [ FakeNode('Layer {} @'.format(i), bounds=(0, 0, 8, 8)) for i in range(count) ]
+    if failing:
+        nodes.append(FailingNode('Failing @', bounds=(0, 0, 8, 8)))
+    return FakeDocument(FakeNode('root', 'grouplayer', nodes), 8, 8)
+
+def unchanged(doc):
+    return all(n.visible() and not n.locked() for n in doc.rootNode().childNodes())
+
+
+def testWritesAreMerged(robot):
+    index = documentIndex(robot)
+    eyes = index.node(robot.nodeByName('Eyes ⭕').uniqueId().toString())
+    changes = ChangeSet()
+    changes.toggle(eyes, 'visible')
+    changes.toggle(eyes, 'visible')
+    changes.set(eyes, 'opacity', 128)
+    changes.set(eyes, 'opacity', 255)
+    changes.set(eyes, 'locked', True)
+    assert changes.requested == 5
+    # Only the lock differs from what the layer has to begin with
+    assert changes.apply() == [(eyes, 'locked', True)]
+    assert changes.applied == 1 and changes.skipped == 4
+
+def testFailedApplyRollsBack():
+    doc = FakeDocument(FakeNode('root', 'grouplayer', [FakeNode('A @'), FailingNode('B @'), FakeNode('C @')]))
+    index = documentIndex(doc)
+    changes = ChangeSet()
+    for n in index.nodes():
+        if n.name != 'root':
+            changes.set(n, 'visible', False)
+            changes.set(n, 'locked', True)
+    with pytest.raises(RuntimeError):
+        changes.apply()
+    assert state(doc, 'A @', 'B @', 'C @') == [(True, False)] * 3
+    assert changes.applied == 0
+
+def testRunIsAllOrNothing():
+    doc = FakeDocument(FakeNode('root', 'grouplayer', [FakeNode('A @'), FailingNode('B @')]))
+    with pytest.raises(RuntimeError):
+        runActions(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, '@'), ActionSpec(BulkAction.SET_NAME, '@', 'Renamed'),
+            ActionSpec(BulkAction.BOOL_LOCKED, '@')])
+    assert state(doc, 'A @', 'B @') == [(True, False)] * 2
+
+def testRevert(robot):
+    changes = runActions(robot, [ActionSpec(BulkAction.BOOL_VISIBLE, '@'), ActionSpec(BulkAction.SET_NAME, '⭕', 'Eyes')])
+    assert state(robot, 'Body Shadows @', 'Head Shadows @') == [(False, False)] * 2
+    assert robot.nodeByName('Eyes') is not None
+    assert len(changes.transaction) == 3
+
+    reverted = revertActions(robot, changes.transaction)
+    assert reverted.applied == 3
+    assert state(robot, 'Body Shadows @', 'Head Shadows @') == [(True, False)] * 2
+    assert robot.nodeByName('Eyes ⭕') is not None
+
+def testRevertKeepsLaterChanges(robot):
+    changes = runActions(robot, [ActionSpec(BulkAction.BOOL_VISIBLE, '@')])
+    # The user shows one of the layers again and removes the other
+    robot.nodeByName('Body Shadows @').setVisible(True)
+    head = robot.nodeByName('Head')
+    head.removeChildNode(robot.nodeByName('Head Shadows @'))
+    robot.nodeByName('Head Color').setVisible(False)
+
+    reverted = revertActions(robot, changes.transaction)
+    assert reverted.applied == 0
+    assert state(robot, 'Body Shadows @', 'Head Color') == [(True, False), (False, False)]
+
+def testRunTimedReportsFailures():
+    doc = FakeDocument(FakeNode('root', 'grouplayer', [FakeNode('A @'), FailingNode('B @')]))
+    report = runTimed(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, '@'), ActionSpec(BulkAction.BOOL_LOCKED, '@')])
+    assert report.changes is None
+    assert report.summary() == 'failed: locked for good'
+    assert state(doc, 'A @', 'B @') == [(True, False)] * 2
+
+    report = runTimed(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, '@', scope='Nowhere')])
+    assert report.summary().startswith('failed: No layer at scope')
+
+def testChunkedRunAdaptsTheChunks(monkeypatch):
+    doc = layers(100)
+    run = startActions(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, '@')], budget=2 ** -6)
+    assert run.total == 100
+    # Each step takes half the budget, so the next chunk is twice as big (binary fractions
+    # keep the sizes exact)
+    monkeypatch.setattr(Engine, 'time', Clock(2 ** -7))
+    assert not run.step()
+    assert (run.done, run.chunk) == (32, 64)
+    assert not run.step()
+    assert (run.done, run.chunk) == (96, 128)
+    assert run.step()
+    assert run.done == 100 and run.isFinished()
+    assert not any(n.visible() for n in doc.rootNode().childNodes())
+    # A finished run is left alone
+    assert run.step() and run.cancel() == 0
+    assert not any(n.visible() for n in doc.rootNode().childNodes())
+
+def testChunkedRunFinish():
+    doc = layers(100)
+    run = startActions(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, '@')])
+    run.step()
+    assert run.finish()
+    assert not any(n.visible() for n in doc.rootNode().childNodes())
+
+def testCancelRollsBack():
+    doc = layers(100)
+    run = startActions(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, '@'), ActionSpec(BulkAction.BOOL_LOCKED, '@')])
+    run.step()
+    refreshed = doc.refreshCount
+    assert run.cancel() == 32
+    assert unchanged(doc)
+    assert doc.refreshCount > refreshed
+    assert run.isFinished() and run.step()
+    assert run.cancel() == 0
+
+def testFailedStepRollsBack():
+    doc = layers(40, failing=True)
+    run = startActions(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, '@'), ActionSpec(BulkAction.BOOL_LOCKED, '@')])
+    assert not run.step()
+    with pytest.raises(RuntimeError):
+        while not run.step():
+            pass
+    assert unchanged(doc)
+    assert run.isFinished()
+
+def canvas(*layers):
+    """
+    A 100 x 100 document with a group holding `layers`, (name, bounds) pairs.
+    """
+    group = FakeNode('Group', 'grouplayer', [ FakeNode(name, bounds=bounds) for name, bounds in layers ], (10, 10, 20, 20))
+    return FakeDocument(FakeNode('root', 'grouplayer', [group]), 100, 100)
+
+def testRefreshOnlyForPixelChanges():
+    doc = canvas(('Layer @', (40, 40, 20, 20)))
+    for spec in (ActionSpec(BulkAction.BOOL_LOCKED, '@'), ActionSpec(BulkAction.BOOL_ALPHA_LOCKED, '@'),
+            ActionSpec(BulkAction.BOOL_COLLAPSED, 'Group'), ActionSpec(BulkAction.SET_NAME, '@', 'Layer @ 1')):
+        assert runActions(doc, [spec]).applied == 1
+    assert doc.refreshCount == 0
+
+    changes = runActions(doc, [ActionSpec(BulkAction.SET_OPACITY, '@', '50')])
+    assert changes.dirtyRect((0, 0, 100, 100)) == (40, 40, 20, 20)
+    assert doc.refreshCount == 1
+    # Inherit alpha composites against the group
+    changes = runActions(doc, [ActionSpec(BulkAction.BOOL_INHERIT_ALPHA, '@')])
+    assert changes.dirtyRect((0, 0, 100, 100)) == (10, 10, 50, 50)
+    assert doc.refreshCount == 2
+
+def testNoRefreshForEmptyOrOffCanvasLayers():
+    doc = canvas(('Empty @', (0, 0, 0, 0)), ('Outside @', (200, 200, 50, 50)), ('Edge', (90, 90, 50, 50)))
+    changes = runActions(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, '@')])
+    assert changes.applied == 2
+    assert changes.dirtyRect((0, 0, 100, 100)) is None
+    assert doc.refreshCount == 0
+
+    # Clipped to the canvas
+    changes = runActions(doc, [ActionSpec(BulkAction.BOOL_VISIBLE, 'Edge')])
+    assert changes.dirtyRect((0, 0, 100, 100)) == (90, 90, 10, 10)
+    assert doc.refreshCount == 1
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+from FakeKrita import FakeDocument, FakeNode, FakeUuid, buildDocument
+from bulk_actions.Engine import ActionSpec, BulkAction, resolveTargets
+from bulk_actions.Index import documentIndex, cachedIndex
+from bulk_actions.Stats import counters
+from bulk_actions.Utils.AhoCorasick import Automaton
+
+
+def names(index, uids):
+    return [ index.names[uid] for uid in uids ]
+
+def uid(node):
+    return node.uniqueId().toString()
+
+
+def testBuildIndexesEveryLayer(robot):
+    index = documentIndex(robot)
+    assert names(index, index.order) == ['root', 'Background', 'Robot', 'Body', 'Body Color', 'Body Shadows @',
+        'Head', 'Head Color', 'Head Shadows @', 'Eyes ⭕']
+    head = uid(robot.nodeByName('Head'))
+    assert index.parents[head] == uid(robot.nodeByName('Robot'))
+    assert index.depths[head] == 2
+    assert cachedIndex(robot) is index
+
+def testSyncWithoutChanges(robot):
+    index = documentIndex(robot)
+    assert not index.sync()
+
+def testSyncFindsRenamedLayers(robot):
+    index = documentIndex(robot)
+    assert names(index, index.tags.lookup('@')) == ['Body Shadows @', 'Head Shadows @']
+
+    robot.nodeByName('Head Shadows @').setName('Head Shadows')
+    robot.nodeByName('Eyes ⭕').setName('Eyes @')
+    assert index.sync()
+    assert names(index, index.tags.lookup('@')) == ['Body Shadows @', 'Eyes @']
+    assert index.tags.lookup('⭕') == []
+    assert index.node(uid(robot.nodeByName('Eyes @'))).name == 'Eyes @'
+
+def testSyncFindsAddedLayers(robot):
+    index = documentIndex(robot)
+    head = robot.nodeByName('Head')
+    head.addChildNode(FakeNode('Mouth @'), head.childNodes()[0])
+    assert index.sync()
+    assert names(index, index.children(uid(head))) == ['Head Color', 'Mouth @', 'Head Shadows @', 'Eyes ⭕']
+    assert names(index, index.tags.lookup('@')) == ['Body Shadows @', 'Mouth @', 'Head Shadows @']
+
+def testSyncForgetsRemovedLayers(robot):
+    index = documentIndex(robot)
+    head = robot.nodeByName('Head')
+    eyes = uid(robot.nodeByName('Eyes ⭕'))
+    robot.nodeByName('Robot').removeChildNode(head)
+    assert index.sync()
+    assert 'Head' not in index.names.values()
+    assert eyes not in index
+    assert names(index, index.tags.lookup('@')) == ['Body Shadows @']
+
+def testSyncFindsMovedLayers(robot):
+    index = documentIndex(robot)
+    eyes = robot.nodeByName('Eyes ⭕')
+    robot.rootNode().addChildNode(eyes, None)
+    assert index.sync()
+    assert index.parents[uid(eyes)] == uid(robot.rootNode())
+    assert index.depths[uid(eyes)] == 1
+    assert index.order[-1] == uid(eyes)
+    assert index.node(uid(eyes)).parent.name == 'root'
+
+def testSubtree(robot):
+    index = documentIndex(robot)
+    robotId = uid(robot.nodeByName('Robot'))
+    assert sorted(names(index, index.subtree(robotId))) == sorted(['Robot', 'Body', 'Body Color', 'Body Shadows @',
+        'Head', 'Head Color', 'Head Shadows @', 'Eyes ⭕'])
+    assert sorted(names(index, index.subtree(robotId, 1))) == ['Body', 'Head', 'Robot']
+    assert index.subtree('{not a layer}') is None
+
+def testParentsFollowRenames(robot):
+    # Renaming a group must not leave its layers with a stale parent
+    index = documentIndex(robot)
+    eyes = uid(robot.nodeByName('Eyes ⭕'))
+    assert index.node(eyes).parent.name == 'Head'
+
+    robot.nodeByName('Head').setName('Face')
+    index.sync()
+    assert index.node(eyes).parent.name == 'Face'
+    assert index.node(eyes).parent is index.node(uid(robot.nodeByName('Face')))
+
+def testRootHasNoParent(robot):
+    index = documentIndex(robot)
+    assert not index.node(uid(robot.rootNode())).parent
+
+def testSyncSubtree(robot):
+    index = documentIndex(robot)
+    robot.nodeByName('Eyes ⭕').setName('Eyes @')
+    robot.nodeByName('Body Color').setName('Body Paint')
+    assert index.syncSubtree(uid(robot.nodeByName('Head')))
+    assert index.tags.lookup('@')[-1] == uid(robot.nodeByName('Eyes @'))
+    # Outside of the subtree the index is only brought up to date by the next full sync
+    assert 'Body Color' in index.names.values()
+    assert index.sync()
+    assert 'Body Paint' in index.names.values()
+
+def testSyncSubtreeFallsBackToSync(robot):
+    index = documentIndex(robot)
+    head = robot.nodeByName('Head')
+    head.addChildNode(FakeNode('Mouth'), None)
+    robot.nodeByName('Body Color').setName('Body Paint')
+    assert index.syncSubtree(uid(head))
+    assert names(index, index.children(uid(head)))[-1] == 'Mouth'
+    assert 'Body Paint' in index.names.values()
+
+    # The subtree itself moved
+    robot.rootNode().addChildNode(head, None)
+    assert index.syncSubtree(uid(head))
+    assert index.parents[uid(head)] == uid(robot.rootNode())
+
+def testSyncSubtreeDepth(robot):
+    index = documentIndex(robot)
+    robot.nodeByName('Eyes ⭕').setName('Eyes')
+    robot.nodeByName('Head').setName('Face')
+    assert index.syncSubtree(uid(robot.nodeByName('Robot')), 1)
+    assert 'Face' in index.names.values() and 'Eyes ⭕' in index.names.values()
+
+def testSyncWithoutStringIds(robot, monkeypatch):
+    index = documentIndex(robot)
+    calls = []
+    toString = FakeUuid.toString
+    monkeypatch.setattr(FakeUuid, 'toString', lambda self: calls.append(self) or toString(self))
+    assert not index.sync()
+    # Only the root's
+    assert len(calls) == 1
+
+def testScopedRunsOnlySyncTheirScope():
+    doc = buildDocument(1000)
+    index = documentIndex(doc)
+    before = dict(counters)
+    spec = ActionSpec(BulkAction.BOOL_VISIBLE, '@', scope='Group 2.0/Group 1.3', depth=1)
+    index, targets = resolveTargets(doc, [spec])
+    assert counters['visited'] - before['visited'] < 20
+    assert counters['childNodes'] - before['childNodes'] < 5
+    assert [ n.name for n in targets[0] ] == ['Layer 32 @', 'Layer 36 @']
+
+    doc.nodeByName('Group 1.3').addChildNode(FakeNode('New @'), None)
+    index, targets = resolveTargets(doc, [spec])
+    assert [ n.name for n in targets[0] ] == ['Layer 32 @', 'Layer 36 @', 'New @']
+
+def testAutomaton():
+    automaton = Automaton(['he', 'she', 'his', 'hers', 'e'])
+    assert automaton.search('ushers') == {0, 1, 3, 4}
+    assert automaton.search('this') == {2}
+    assert automaton.search('') == set()
+
+def testResolveManyTags():
+    names = ['she sells', 'ushers @', 'his 👁️ eye', 'hers 👩\u200d💻', 'Copy @@', 'he@me', '👩 alone', 'nothing']
+    doc = FakeDocument(FakeNode('root', 'grouplayer', [ FakeNode(name) for name in names ]))
+    index = documentIndex(doc)
+    # Overlapping tags without marks, single and multi code point marks, and a tag no layer has
+    tags = ['he', 'she', 'hers', 'his', 'e', '@', '@@', 'he@', '👁️', '👁', '👩\u200d💻', '👩', 'absent', 'he']
+    resolved = index.tags.resolve(tags)
+    assert sorted(resolved) == sorted(set(tags))
+    for tag in tags:
+        assert resolved[tag] == [ uid for uid in index.order if tag in index.names[uid] ], tag
+    # The same as looking each tag up on its own
+    index.tags.clear()
+    assert { tag: index.tags.lookup(tag) for tag in tags } == resolved
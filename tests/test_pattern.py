@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from bulk_actions.Index import documentIndex
+from bulk_actions.Pattern import compilePattern, Literal
+
+
+def matching(doc, pattern):
+    index = documentIndex(doc)
+    term = compilePattern(pattern)
+    return [ n.name for n in index.nodes() if term.matches(n) ]
+
+
+def testPlainTags(robot):
+    assert isinstance(compilePattern('@'), Literal)
+    assert isinstance(compilePattern('Copy (2)'), Literal)
+    assert matching(robot, 'Shadows @') == ['Body Shadows @', 'Head Shadows @']
+
+def testOldTagsStayPlainTags():
+    for tag in ('!', '&', '|', 'R&D', '!hide', 'a | b', '(⭕)', '"quoted"', 'Copy (2'):
+        term = compilePattern(tag)
+        assert isinstance(term, Literal) and term.text == tag
+
+def testOperators(robot):
+    assert matching(robot, '=@ & !Head') == ['Body Shadows @']
+    assert matching(robot, '=@ | ⭕') == ['Body Shadows @', 'Head Shadows @', 'Eyes ⭕']
+    assert matching(robot, '=(@ | ⭕) & Head') == ['Head Shadows @']
+    # Terms next to each other are and'ed
+    assert matching(robot, '=Head "Shadows @"') == ['Head Shadows @']
+    assert matching(robot, '=!Shadows & !Color & !Eyes') == ['root', 'Background', 'Robot', 'Body', 'Head']
+    # A prefixed term starts an expression too
+    assert matching(robot, 'type:paint & !Color & !@') == ['Background', 'Eyes ⭕']
+
+def testPrefixes(robot):
+    assert matching(robot, 'glob:*Color') == ['Body Color', 'Head Color']
+    # Globs match the whole name
+    assert matching(robot, 'glob:Shadow*') == []
+    assert matching(robot, 'glob:Body') == ['Body']
+    assert matching(robot, 'glob:*Shadow*') == ['Body Shadows @', 'Head Shadows @']
+    assert matching(robot, 're:^(Body|Head) C') == ['Body Color', 'Head Color']
+    assert matching(robot, 'path:Robot/Head/*') == ['Head Color', 'Head Shadows @', 'Eyes ⭕']
+    assert matching(robot, 'type:group & !root') == ['Robot', 'Body', 'Head']
+    # Quoted tags in an expression can start with "="
+    assert matching(robot, '="=" | Eyes') == ['Eyes ⭕']
+
+def testRegexCaptures(robot):
+    index = documentIndex(robot)
+    term = compilePattern('re:"(\\w+) Shadows"')
+    assert term.groups == 1
+    captures = [ term.captures(n) for n in index.nodes() if term.matches(n) ]
+    assert captures == [('Body Shadows', 'Body'), ('Head Shadows', 'Head')]
+
+def testCandidates(robot):
+    index = documentIndex(robot)
+    assert compilePattern('re:Head').candidates(index.tags) is None
+    found = compilePattern('=@ & Head').candidates(index.tags)
+    assert [ index.names[uid] for uid in index.tags.ordered(found) ] == ['Head Shadows @']
+
+@pytest.mark.parametrize('pattern', ['=@ &', '=(@ | ⭕', '=@ | )', 're:(', '=a & b)', '=', 'type:paint &'])
+def testInvalidExpressions(pattern):
+    with pytest.raises(ValueError):
+        compilePattern(pattern)
+
+def testPathsFollowRenamedGroups(robot):
+    assert matching(robot, 'path:Robot/Head/*') == ['Head Color', 'Head Shadows @', 'Eyes ⭕']
+    robot.nodeByName('Head').setName('Face')
+    assert matching(robot, 'path:Robot/Head/*') == []
+    assert matching(robot, 'path:Robot/Face/*') == ['Head Color', 'Head Shadows @', 'Eyes ⭕']
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from FakeKrita import FakeNode, buildDocument
+from bulk_actions import Pipeline, Settings
+from bulk_actions.Engine import ActionSpec, BulkAction, planActions
+from bulk_actions.Index import TagIndex, documentIndex
+from bulk_actions.Stats import counters
+
+
+A = BulkAction
+SPECS = [
+    ActionSpec(A.BOOL_VISIBLE, '@'),
+    ActionSpec(A.SET_OPACITY, '⭕', '20'),
+    ActionSpec(A.SET_NAME, '👁', 'n{i+}'),
+    ActionSpec(A.SET_NAME, 'Layer', 'x{%name} {%parent}'),
+    ActionSpec(A.SET_LOCKED, 'Layer 1', 'on'),
+    ActionSpec(A.SET_NAME, 're:Layer.(\\d+)', 'L{%1}', 'Group 2.0', 2),
+    ActionSpec(A.SET_NAME, '', 'sel{i++} {%0}'),
+    ActionSpec(A.BOOL_LOCKED, '', expand=1),
+    ActionSpec(A.SET_NAME, 'path:*/*/*2*', '{%parent}-{%depth}-{i--}'),
+]
+
+@pytest.fixture
+def doc():
+    doc = buildDocument(1000)
+    Settings.saveSettings(doc, [(0, { 'index': 0, 'match': '@' })])
+    return doc
+
+def selection(doc):
+    group = doc.nodeByName('Group 2.0')
+    return lambda: [ group.childNodes()[0], group.childNodes()[1] ]
+
+def plan(changes, renames):
+    return sorted(changes.target.items()), [ (n.uniqueId, old, new) for n, old, new in renames ]
+
+
+def testPipelinePlansLikePlanActions(doc):
+    index, changes, renames = planActions(doc, SPECS, selection(doc))
+    job = Pipeline.startPlanning(doc, SPECS, selection(doc))
+    index, pipelined, pipelinedRenames = job.result()
+    assert plan(pipelined, pipelinedRenames) == plan(changes, renames)
+
+def testProcessPool(doc):
+    index, changes, renames = planActions(doc, SPECS, selection(doc))
+    with ProcessPoolExecutor(2) as executor:
+        job = Pipeline.startPlanning(doc, SPECS, selection(doc), executor)
+        index, pipelined, pipelinedRenames = job.result()
+    assert plan(pipelined, pipelinedRenames) == plan(changes, renames)
+
+def testRenamedTargetsArePlannedAgain(doc):
+    job = Pipeline.startPlanning(doc, SPECS, selection(doc))
+    # The user renames a target while the workers are busy
+    doc.nodeByName('Layer 4 @').setName('Layer 4')
+    index, changes, renames = job.result()
+    assert plan(changes, renames) == plan(*planActions(doc, SPECS, selection(doc))[1:])
+
+def testResultOnlyChecksTheTargets(doc):
+    documentIndex(doc)
+    specs = [ActionSpec(A.BOOL_VISIBLE, 'Layer 99')]
+    job = Pipeline.startPlanning(doc, specs)
+    job.wait()
+    before = counters['visited']
+    index, changes, renames = job.result()
+    assert counters['visited'] - before == len(changes) == 11
+
+def testScopedPipelineOnlySyncsTheScope(doc):
+    documentIndex(doc)
+    specs = [ActionSpec(A.BOOL_VISIBLE, '@', scope='Group 2.0/Group 1.3', depth=1)]
+    before = dict(counters)
+    job = Pipeline.startPlanning(doc, specs)
+    index, changes, renames = job.result()
+    assert counters['childNodes'] - before['childNodes'] < 5
+    assert counters['visited'] - before['visited'] < 20
+    assert sorted(index.names[uid] for uid, attr in changes.target) == ['Layer 32 @', 'Layer 36 @']
+
+def testTagsAreLookedUpInTheWorkers(doc, monkeypatch):
+    documentIndex(doc)
+    threads = []
+    lookup = TagIndex.lookup
+    def recordingLookup(tags, tag):
+        threads.append(threading.current_thread())
+        return lookup(tags, tag)
+    monkeypatch.setattr(TagIndex, 'lookup', recordingLookup)
+    specs = [ActionSpec(A.BOOL_VISIBLE, 'Layer 1'), ActionSpec(A.BOOL_LOCKED, '=@ & !9')]
+    index, changes, renames = Pipeline.startPlanning(doc, specs).result()
+    assert threads and threading.main_thread() not in threads
+    assert plan(changes, renames) == plan(*planActions(doc, specs)[1:])
+
+def testSelectedLayerOutsideTheScopes(robot):
+    documentIndex(robot)
+    mouth = FakeNode('Mouth')
+    robot.rootNode().addChildNode(mouth, None)
+    specs = [ActionSpec(A.BOOL_VISIBLE, '@', scope='Robot'), ActionSpec(A.BOOL_LOCKED, '')]
+    index, changes, renames = Pipeline.startPlanning(robot, specs, lambda: [mouth]).result(False)
+    assert index.names[mouth.uniqueId().toString()] == 'Mouth'
+    assert plan(changes, renames) == plan(*planActions(robot, specs, lambda: [mouth])[1:])
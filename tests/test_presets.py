@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from bulk_actions import Settings
+from bulk_actions.Engine import ActionSpec, BulkAction, runActions
+from bulk_actions.Presets import StatePreset, presetSettings, replacePreset, statePresets
+
+
+A = BulkAction
+LINEART = StatePreset('lineart', [
+    ActionSpec(A.SET_VISIBLE, '@', 'off'),
+    ActionSpec(A.SET_LOCKED, 'Color', 'on'),
+    ActionSpec(A.SET_OPACITY, '⭕', '50', 'Robot/Head', 1),
+])
+FINAL = StatePreset('final', [
+    ActionSpec(A.SET_VISIBLE, '@', 'on'),
+    ActionSpec(A.SET_LOCKED, 'Color', 'on'),
+    ActionSpec(A.SET_OPACITY, '⭕', '50', 'Robot/Head', 1),
+])
+
+def specSettings(preset):
+    return [ (s.action, s.match, s.value, s.scope, s.depth, s.expand) for s in preset.specs ]
+
+
+def testSaveAndLoad(robot):
+    assert Settings.saveSettings(robot, [], presetSettings([LINEART, FINAL]))
+    presets = statePresets(Settings.loadSettings(robot))
+    assert [ p.name for p in presets ] == ['lineart', 'final']
+    assert [ specSettings(p) for p in presets ] == [ specSettings(LINEART), specSettings(FINAL) ]
+
+    # Settings saved before presets existed have none
+    Settings.saveSettings(robot, [])
+    assert statePresets(Settings.loadSettings(robot)) == []
+
+def testReplacePreset():
+    clean = StatePreset('lineart')
+    assert [ p.specs for p in replacePreset([LINEART, FINAL], clean) ] == [[], FINAL.specs]
+    assert [ p.name for p in replacePreset([LINEART], FINAL) ] == ['lineart', 'final']
+
+def testApplyOnlyWritesWhatDiffers(robot, written):
+    changes = runActions(robot, LINEART.specs)
+    assert changes.applied == 5
+    assert sorted(written) == [('Body Color', 'setLocked'), ('Body Shadows @', 'setVisible'),
+        ('Eyes ⭕', 'setOpacity'), ('Head Color', 'setLocked'), ('Head Shadows @', 'setVisible')]
+
+    # Applying a preset again writes nothing
+    del written[:]
+    assert runActions(robot, LINEART.specs).applied == 0
+    assert written == []
+
+    # Switching presets only writes what they disagree on
+    changes = runActions(robot, FINAL.specs)
+    assert changes.applied == 2
+    assert sorted(written) == [('Body Shadows @', 'setVisible'), ('Head Shadows @', 'setVisible')]
+    assert robot.nodeByName('Body Color').locked() and robot.nodeByName('Eyes ⭕').opacity() == 127
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from bulk_actions import Settings
+from bulk_actions.Engine import ActionSpec, BulkAction, BulkActionType, runActions, selectionTargets
+from bulk_actions.Index import documentIndex
+
+
+def selected(doc, *names):
+    return [ doc.nodeByName(name) for name in names ]
+
+def targets(doc, names, expand=0, index=None):
+    return [ n.name for n in selectionTargets(selected(doc, *names), index, expand) ]
+
+
+def testSelectedOnce(robot):
+    assert targets(robot, ['Eyes ⭕', 'Head', 'Eyes ⭕']) == ['Eyes ⭕', 'Head']
+    index = documentIndex(robot)
+    nodes = selectionTargets(selected(robot, 'Head', 'Head'), index)
+    assert len(nodes) == 1 and nodes[0] is index.node(robot.nodeByName('Head').uniqueId().toString())
+
+def testExpandNestedSelection(robot):
+    index = documentIndex(robot)
+    # A layer selected along with a group it's in comes once, in tree order
+    assert targets(robot, ['Eyes ⭕', 'Head', 'Robot'], -1, index) == ['Robot', 'Body', 'Body Color',
+        'Body Shadows @', 'Head', 'Head Color', 'Head Shadows @', 'Eyes ⭕']
+
+def testExpandDepth(robot):
+    index = documentIndex(robot)
+    assert targets(robot, ['Robot'], 1, index) == ['Robot', 'Body', 'Head']
+    # The nested selection expands as deep below itself
+    assert targets(robot, ['Robot', 'Head'], 1, index) == ['Robot', 'Body', 'Head', 'Head Color', 'Head Shadows @', 'Eyes ⭕']
+    # ... and doesn't cut short the expansion of the group it's in
+    assert targets(robot, ['Robot', 'Body'], 2, index) == ['Robot', 'Body', 'Body Color', 'Body Shadows @',
+        'Head', 'Head Color', 'Head Shadows @', 'Eyes ⭕']
+
+def testExpandLeavesOutPluginSettings(robot):
+    Settings.saveSettings(robot, [(BulkActionType.BOOL, { 'index': 0, 'match': '@' })])
+    index = documentIndex(robot)
+    assert targets(robot, ['root'], -1, index) == ['root', 'Background', 'Robot', 'Body', 'Body Color',
+        'Body Shadows @', 'Head', 'Head Color', 'Head Shadows @', 'Eyes ⭕']
+    # Unless selected themselves
+    assert targets(robot, ['Plugin Settings'], -1, index) == ['Plugin Settings']
+
+    changes = runActions(robot, [ActionSpec(BulkAction.BOOL_VISIBLE, '', expand=-1)], lambda: selected(robot, 'root'))
+    assert changes.applied == 10
+    assert not robot.nodeByName('Plugin Settings').visible() and not robot.nodeByName('Bulk Actions').visible()
+    assert Settings.loadSettings(robot) is not None
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+
+import pytest
+
+from FakeKrita import FakeDocument, buildDocument
+from bulk_actions import Settings
+from bulk_actions.Engine import ActionSpec, BulkAction, resolveTargets
+from bulk_actions.Stats import counters
+
+
+SPECS = [
+    ActionSpec(BulkAction.BOOL_VISIBLE, '@'),
+    ActionSpec(BulkAction.SET_NAME, 're:"(\\w+) Shadows"', '{%1} {i+:02}', 'Robot', 1),
+    ActionSpec(BulkAction.SET_OPACITY, '', '50', expand=-1),
+]
+
+def actions(specs):
+    return [ (spec.type, spec.settings()) for spec in specs ]
+
+def specSettings(specs):
+    return [ (spec.action, spec.match, spec.value, spec.scope, spec.depth, spec.expand) for spec in specs ]
+
+def settingsNames(doc):
+    return [ n.name for n in Settings.findSettingsLayer(doc).children ]
+
+
+def testCodecRoundTrip():
+    names = Settings.encodeSettings(actions(SPECS), [{ 'name': 'Clean', 'actions': [] }])
+    assert all(Settings.isChunk(name) for name in names)
+    settings = Settings.decodeSettings(names)
+    assert settings['version'] == Settings.SETTINGS_VERSION
+    assert settings['presets'] == [{ 'name': 'Clean', 'actions': [] }]
+    assert specSettings(Settings.actionSpecs(settings)) == specSettings(SPECS)
+
+def testChunksInAnyOrder(monkeypatch):
+    monkeypatch.setattr(Settings, 'CHUNK_SIZE', 16)
+    names = Settings.encodeSettings(actions(SPECS))
+    assert len(names) > 2
+    settings = Settings.decodeSettings(list(reversed(names)))
+    assert specSettings(Settings.actionSpecs(settings)) == specSettings(SPECS)
+
+    with pytest.raises(ValueError):
+        Settings.decodeSettings(names[1:])
+    with pytest.raises(ValueError):
+        Settings.decodeSettings(names[:1] + [ 'Layer 1' ])
+
+def testLegacySettings():
+    legacy = { 'version': 1.0, 'actions': [{ 'index': 1, 'match': '⭕' }] }
+    names = [ base64.b64encode(json.dumps(legacy).encode('utf-8')).decode('ascii') ]
+    specs = Settings.actionSpecs(Settings.decodeSettings(names))
+    assert specSettings(specs) == [(BulkAction.BOOL_LOCKED, '⭕', '', '', -1, 0)]
+
+def testSaveAndLoad(robot):
+    assert Settings.loadSettings(robot) is None
+    assert Settings.saveSettings(robot, actions(SPECS))
+
+    # The settings group is hidden and locked at the top of the root
+    pluginSettings = robot.rootNode().childNodes()[1]
+    assert pluginSettings.name() == 'Plugin Settings'
+    assert not pluginSettings.visible() and pluginSettings.locked()
+
+    settings = Settings.loadSettings(robot)
+    assert specSettings(Settings.actionSpecs(settings)) == specSettings(SPECS)
+    # Nothing is written if nothing changed
+    assert not Settings.saveSettings(robot, actions(SPECS))
+
+def testSaveOnlyRewritesChangedChunks(robot, monkeypatch):
+    monkeypatch.setattr(Settings, 'CHUNK_SIZE', 16)
+    Settings.saveSettings(robot, actions(SPECS))
+    before = set(settingsNames(robot))
+    Settings.saveSettings(robot, actions(SPECS[:2]))
+    after = set(settingsNames(robot))
+    assert before != after and len(after) < len(before)
+    assert specSettings(Settings.actionSpecs(Settings.loadSettings(robot))) == specSettings(SPECS[:2])
+
+def testSettingsSurviveReload(robot, tmp_path):
+    Settings.saveSettings(robot, actions(SPECS))
+    path = str(tmp_path / 'robot.json')
+    robot.saveAs(path)
+    doc = FakeDocument.load(path)
+    assert specSettings(Settings.actionSpecs(Settings.loadSettings(doc))) == specSettings(SPECS)
+
+def testSettingsLayersAreNeverMatched(robot):
+    Settings.saveSettings(robot, actions(SPECS))
+    index, targets = resolveTargets(robot, [ActionSpec(BulkAction.BOOL_VISIBLE, 'Bulk Actions')])
+    assert targets == [[]]
+
+def testFirstSaveInEmptyDocument():
+    doc = FakeDocument()
+    assert Settings.saveSettings(doc, actions(SPECS))
+    assert specSettings(Settings.actionSpecs(Settings.loadSettings(doc))) == specSettings(SPECS)
+
+def testFirstSaveNextToSnapshots(robot):
+    # The "Plugin Settings" group is there, its "Bulk Actions" group isn't
+    Settings.saveSnapshots(robot, { 'snapshots': [] })
+    assert Settings.loadSettings(robot) is None
+    assert Settings.saveSettings(robot, actions(SPECS))
+    assert [ n.name() for n in robot.rootNode().childNodes() ] == ['Background', 'Plugin Settings', 'Robot']
+    assert specSettings(Settings.actionSpecs(Settings.loadSettings(robot))) == specSettings(SPECS)
+    assert Settings.loadSnapshots(robot) == { 'snapshots': [] }
+
+def testSnapshotsLookupOnlyReadsTheRoot():
+    doc = buildDocument(1000)
+    before = counters['childNodes']
+    assert Settings.loadSnapshots(doc) is None
+    assert counters['childNodes'] - before == 1
+
+def testSettingsInMovedGroup(robot):
+    Settings.saveSettings(robot, actions(SPECS))
+    Settings.pruneSettingsLayers(())
+    pluginSettings = robot.nodeByName('Plugin Settings')
+    robot.rootNode().removeChildNode(pluginSettings)
+    robot.nodeByName('Robot').addChildNode(pluginSettings, None)
+    assert specSettings(Settings.actionSpecs(Settings.loadSettings(robot))) == specSettings(SPECS)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from bulk_actions import Settings
+from bulk_actions.Index import documentIndex
+from bulk_actions.Snapshot import (
+    Snapshot,
+    captureSnapshot,
+    differingBits,
+    packBits,
+    restoreSnapshot,
+    snapshotsData,
+    snapshotsFromData,
+)
+
+
+def state(doc, name):
+    n = doc.nodeByName(name)
+    return (n.visible(), n.locked(), n.opacity())
+
+
+def testDifferingBits():
+    a = packBits([True, False, False, True, False, False, False, False, True, True])
+    b = packBits([True, True, False, True, False, False, False, True, True, False])
+    assert list(differingBits(a, b)) == [1, 7, 9]
+    assert list(differingBits(a, bytearray(a))) == []
+
+def testCaptureLeavesOutRootAndSettings(robot):
+    Settings.saveSettings(robot, [])
+    snapshot = captureSnapshot(robot, 'look')
+    assert snapshot.names == ['Background', 'Robot', 'Body', 'Body Color', 'Body Shadows @',
+        'Head', 'Head Color', 'Head Shadows @', 'Eyes ⭕']
+    assert snapshot.state(0) == { 'visible': True, 'locked': False, 'alphaLocked': False, 'collapsed': False,
+        'inheritAlpha': False, 'opacity': 255, 'name': 'Background' }
+
+def testRestoreOnlyWritesWhatDiffers(robot, written):
+    snapshot = captureSnapshot(robot, 'look')
+    robot.nodeByName('Head Color').setVisible(False)
+    robot.nodeByName('Eyes ⭕').setOpacity(100)
+    robot.nodeByName('Body').setName('Torso')
+    # Changed and changed back
+    robot.nodeByName('Background').setLocked(True)
+    robot.nodeByName('Background').setLocked(False)
+    del written[:]
+
+    changes = restoreSnapshot(robot, snapshot)
+    assert changes.applied == 3
+    assert sorted(written) == [('Eyes ⭕', 'setOpacity'), ('Head Color', 'setVisible'), ('Torso', 'setName')]
+    assert state(robot, 'Head Color') == (True, False, 255)
+    assert state(robot, 'Eyes ⭕') == (True, False, 255)
+    assert robot.nodeByName('Body') is not None
+
+    del written[:]
+    assert restoreSnapshot(robot, snapshot).applied == 0
+    assert written == []
+
+def testRestoreSkipsRemovedLayers(robot):
+    snapshot = captureSnapshot(robot, 'look')
+    head = robot.nodeByName('Head')
+    head.removeChildNode(robot.nodeByName('Eyes ⭕'))
+    robot.nodeByName('Head Color').setVisible(False)
+    robot.nodeByName('Body Color').setLocked(True)
+
+    changes = restoreSnapshot(robot, snapshot)
+    assert changes.applied == 2
+    assert state(robot, 'Head Color') == (True, False, 255)
+    assert state(robot, 'Body Color') == (True, False, 255)
+    assert [ n.name() for n in head.childNodes() ] == ['Head Color', 'Head Shadows @']
+
+def testRoundTrip(robot):
+    first = captureSnapshot(robot, 'first')
+    robot.nodeByName('Head').setCollapsed(True)
+    robot.nodeByName('Eyes ⭕').setOpacity(51)
+    second = Snapshot.capture('second', documentIndex(robot), first.uids[4:])
+
+    data = json.loads(json.dumps(snapshotsData([first, second])))
+    # The unique ids are stored once for all snapshots
+    assert len(data['uids']) == len(first)
+    loaded = snapshotsFromData(data)
+    for snapshot, copy in zip([first, second], loaded):
+        assert (copy.name, copy.uids, copy.flags, copy.opacity, copy.names) == (
+            snapshot.name, snapshot.uids, snapshot.flags, snapshot.opacity, snapshot.names)
+
+    Settings.saveSnapshots(robot, snapshotsData(loaded))
+    assert Settings.loadSnapshots(robot) == data
+
+    data['version'] = 0
+    with pytest.raises(ValueError):
+        snapshotsFromData(data)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from bulk_actions.Engine import ActionSpec, BulkAction, renamePlan, runActions
+from bulk_actions.Index import documentIndex
+from bulk_actions.Pattern import compilePattern
+
+
+def renamed(doc, pattern, template):
+    index = documentIndex(doc)
+    term = compilePattern(pattern)
+    nodes = [ n for n in index.nodes() if term.matches(n) ]
+    return [ new for n, old, new in renamePlan(template, nodes, term=term) ]
+
+
+def testCounters(robot):
+    assert renamed(robot, 'Color', 'Color {i++} {i--} {i+} {i-}') == ['Color 0 1 1 2', 'Color 1 0 2 1']
+    assert renamed(robot, 'Color', 'Color {i+:03}') == ['Color 001', 'Color 002']
+
+def testLayerFields(robot):
+    assert renamed(robot, 'Color', '{%parent}/{%name} {%depth} {%type}') == ['Body/Body Color 2 paintlayer', 'Head/Head Color 2 paintlayer']
+    # Layers at the top level have no parent group
+    assert renamed(robot, 'Background', '[{%parent}] {%depth}') == ['[] 0']
+
+def testCaptures(robot):
+    assert renamed(robot, 're:"(\\w+) Shadows"', '{%1} shade') == ['Body shade', 'Head shade']
+    # Without groups {%0} is what the pattern matched
+    assert renamed(robot, 'Shadows', '{%0}!') == ['Shadows!', 'Shadows!']
+
+def testReplace(robot):
+    assert renamed(robot, 'Shadows', 's/Shadows (.)/{%1} Shade/') == ['Body @ Shade', 'Head @ Shade']
+    assert renamed(robot, 'Color', 's/o/0/') == ['B0dy C0l0r', 'Head C0l0r']
+
+def testLiteralBraces(robot):
+    assert renamed(robot, 'Background', '{{{%name}}}') == ['{Background}']
+
+@pytest.mark.parametrize('template', ['{nope}', '{i+:q}', '{%name!r}', '{%name', 's/(/x/', '{%1}'])
+def testInvalidTemplates(robot, template):
+    with pytest.raises(ValueError):
+        renamed(robot, 'Color', template)
+
+def testParentAfterRename(robot):
+    assert renamed(robot, '⭕', '{%parent}') == ['Head']
+    robot.nodeByName('Head').setName('Face')
+    assert renamed(robot, '⭕', '{%parent}') == ['Face']
+
+def testParentRenamedByTheRun(robot):
+    # The group is renamed by the plugin itself, the index is told rather than synced
+    runActions(robot, [ActionSpec(BulkAction.SET_NAME, 'glob:Head', 'Face')])
+    assert renamed(robot, '⭕', '{%parent}') == ['Face']
+    runActions(robot, [ActionSpec(BulkAction.SET_NAME, 'glob:Face', 'Mask'), ActionSpec(BulkAction.SET_NAME, 'Eyes', '{%parent} Eyes')])
+    assert robot.nodeByName('Mask Eyes') is None and robot.nodeByName('Face Eyes') is not None
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+from FakeKrita import buildChain
+from bulk_actions.KritaNode import KritaNode
+from bulk_actions.Utils.Tree import iterLevel, iterLevelGroup, iterPost, iterPre, path, pathFS
+
+
+def names(nodes):
+    return [ n.name for n in nodes ]
+
+def root(doc):
+    return KritaNode(doc.rootNode())
+
+
+def testPreOrder(robot):
+    assert names(iterPre(root(robot))) == ['root', 'Background', 'Robot', 'Body', 'Body Color', 'Body Shadows @',
+        'Head', 'Head Color', 'Head Shadows @', 'Eyes ⭕']
+    assert names(iterPre(root(robot), 0)) == ['root']
+    assert names(iterPre(root(robot), 2)) == ['root', 'Background', 'Robot', 'Body', 'Head']
+
+def testPostOrder(robot):
+    assert names(iterPost(root(robot))) == ['Background', 'Body Color', 'Body Shadows @', 'Body',
+        'Head Color', 'Head Shadows @', 'Eyes ⭕', 'Head', 'Robot', 'root']
+    # Nodes at the cutoff are yielded, their children aren't
+    assert names(iterPost(root(robot), 2)) == ['Background', 'Body', 'Head', 'Robot', 'root']
+
+def testLevelOrder(robot):
+    assert names(iterLevel(root(robot))) == ['root', 'Background', 'Robot', 'Body', 'Head',
+        'Body Color', 'Body Shadows @', 'Head Color', 'Head Shadows @', 'Eyes ⭕']
+    assert [ names(level) for level in iterLevelGroup(root(robot)) ] == [['root'], ['Background', 'Robot'],
+        ['Body', 'Head'], ['Body Color', 'Body Shadows @', 'Head Color', 'Head Shadows @', 'Eyes ⭕']]
+    assert [ names(level) for level in iterLevelGroup(root(robot), 1) ] == [['root'], ['Background', 'Robot']]
+    # Deeper than the tree is the whole tree
+    assert names(iterLevel(root(robot), 10)) == names(iterLevel(root(robot)))
+
+def testPath(robot):
+    eyes = [ n for n in iterPre(root(robot)) if n.name == 'Eyes ⭕' ][0]
+    assert names(path(eyes)) == ['root', 'Robot', 'Head', 'Eyes ⭕']
+    assert pathFS(eyes) == os.path.join('Robot', 'Head', 'Eyes ⭕')
+    assert pathFS(root(robot)) == ''
+
+def testDeepTrees():
+    depth = sys.getrecursionlimit() + 100
+    chain = root(buildChain(depth))
+    assert len(list(iterPre(chain))) == depth + 2
+    assert names(iterPost(chain))[0] == 'Layer @'
+    assert len(list(iterLevelGroup(chain))) == depth + 2
+    leaf = list(iterPre(chain))[-1]
+    assert len(path(leaf)) == depth + 2